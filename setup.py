@@ -61,6 +61,10 @@ setup(name='taskw',
       include_package_data=True,
       zip_safe=False,
       install_requires=REQUIREMENTS['install'],
+      extras_require={
+          # For taskw.frame.
+          'frame': ['numpy'],
+      },
       entry_points="""
       # -*- Entry points: -*-
       """,
@@ -8,12 +8,14 @@ from taskw.utils import clean_task, encode_task, decode_task
 from taskw.utils import encode_task_experimental
 
 __all__ = [
-    TaskWarrior,
-    TaskWarriorShellout,
-    TaskWarriorDirect,
-    TaskWarriorExperimental,  # This is deprecated.  Use TaskWarriorShellout
-    clean_task,
-    encode_task,
-    decode_task,
-    encode_task_experimental,
+    'TaskWarrior',
+    'TaskWarriorShellout',
+    'TaskWarriorDirect',
+    # This is deprecated.  Use TaskWarriorShellout
+    'TaskWarriorExperimental',
+    'clean_task',
+    'encode_task',
+    'decode_task',
+    'encode_task_experimental',
 ]
+
@@ -0,0 +1,464 @@
+""" An asyncio version of the shell-out backend.
+
+``AsyncTaskWarriorShellout`` has the same API as ``TaskWarriorShellout``,
+except that every method which runs taskwarrior is a coroutine::
+
+    tw = AsyncTaskWarriorShellout(max_concurrency=4)
+    tasks = await tw.load_tasks()
+    task = await tw.task_add('Eat food')
+
+Commands are run with ``asyncio.create_subprocess_exec`` so they never
+block the event loop; at most ``max_concurrency`` of them run at once.
+Cancelling a call kills the taskwarrior process it started.
+
+``iter_tasks`` is an asynchronous generator, and ``batch`` an asynchronous
+context manager::
+
+    async for task in tw.iter_tasks({'status': 'pending'}):
+        print(task['description'])
+
+    async with tw.batch() as batch:
+        batch.task_add('Eat food')
+
+The taskwarrior version is still probed synchronously, once per binary;
+call ``get_version()`` at startup to get that out of the way.
+
+Asynchronous generators make this module require Python 3.6 or later.
+
+"""
+import asyncio
+import itertools
+import json
+import subprocess
+import tempfile
+import time
+
+from taskw.cache import DEFAULT_CACHE_TTL
+from taskw.exceptions import TaskwarriorError
+from taskw.index import TaskIndex
+from taskw.warrior import (
+    IMPORT_CHUNK_SIZE,
+    TASKRC,
+    ChangeCursor,
+    LoadStrategy,
+    TaskWarriorBatch,
+    TaskWarriorShellout,
+)
+
+
+# How many taskwarrior processes an ``AsyncTaskWarriorShellout`` runs at once.
+DEFAULT_MAX_CONCURRENCY = 8
+
+# The longest line of `task export` output ``iter_tasks`` reads; asyncio's
+# own limit of 64KiB is short of what a heavily annotated task can take.
+EXPORT_LINE_LIMIT = 1 << 24
+
+
+class AsyncTaskWarriorShellout(TaskWarriorShellout):
+    """ Interacts with taskwarrior by invoking shell commands from asyncio.
+
+    Argument building, output decoding and ``Task`` marshalling are shared
+    with ``TaskWarriorShellout``; only running the commands differs.
+    """
+
+    def __init__(
+        self,
+        config_filename=TASKRC,
+        config_overrides=None,
+        marshal=False,
+        load_strategy=None,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        cache_size=0,
+        cache_ttl=DEFAULT_CACHE_TTL,
+    ):
+        super(AsyncTaskWarriorShellout, self).__init__(
+            config_filename,
+            config_overrides=config_overrides,
+            marshal=marshal,
+            load_strategy=load_strategy,
+            cache_size=cache_size,
+            cache_ttl=cache_ttl,
+        )
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        self.max_concurrency = max_concurrency
+        # Created on first use so that it belongs to the running loop.
+        self._semaphore = None
+
+    def _get_semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _execute(self, *args, stdin=None):
+        """ Execute a given taskwarrior command with arguments
+
+        If given, the ``stdin`` bytestring is fed to the command's standard
+        input.  If the call is cancelled, the command is killed.
+
+        Returns a 2-tuple of stdout and stderr (respectively).
+
+        """
+        command, env = self._get_command(args)
+
+        async with self._get_semaphore():
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *command,
+                    env=env,
+                    stdin=subprocess.PIPE if stdin is not None else None,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+            except FileNotFoundError:
+                raise FileNotFoundError(
+                    "Unable to find the 'task' command-line tool."
+                )
+
+            try:
+                stdout, stderr = await proc.communicate(stdin)
+            except BaseException:
+                # Most likely cancelled; don't leave taskwarrior running
+                # (and holding its lock) behind us.
+                if proc.returncode is None:
+                    try:
+                        proc.kill()
+                    except ProcessLookupError:
+                        pass
+                    await proc.wait()
+                raise
+            finally:
+                self._invalidate_cache(args)
+
+        return self._decode_output(command, proc.returncode, stdout, stderr)
+
+    async def _get_json(self, *args):
+        if self.cache is None:
+            return json.loads((await self._execute(*args))[0])
+
+        key = self._get_cache_key(args)
+        signature = self.cache.get_signature()
+        stdout = self.cache.get(key, signature)
+        if stdout is None:
+            stdout = (await self._execute(*args))[0]
+            self.cache.set(key, stdout, signature)
+        return json.loads(stdout)
+
+    async def _get_task_objects(self, *args):
+        return self._get_task_objects_from(await self._get_json(*args))
+
+    async def sync(self, init=False):
+        await self._execute(*self._get_sync_args(init))
+
+    async def load_tasks(self, command='all', strategy=None):
+        """ Returns a dictionary of tasks for a list of command.
+
+        Each status is exported concurrently, unless ``strategy`` (or the
+        warrior's ``load_strategy``) is 'single', in which case they are
+        all exported at once.
+        """
+        strategy = LoadStrategy.validate(strategy or self.load_strategy)
+        if strategy == LoadStrategy.SINGLE:
+            results = self._partition_loaded_tasks(
+                command,
+                await self._get_task_objects(
+                    *self._get_combined_load_args(command)
+                ),
+            )
+        else:
+            results = await asyncio.gather(*[
+                self._get_task_objects('status:%s' % status, 'export')
+                for db, status in self._get_load_queries(command)
+            ])
+        return self._merge_loaded_tasks(command, results)
+
+    async def filter_by(self, func):
+        """ Returns the tasks for which ``func`` is true.
+
+        See ``TaskWarriorBase.filter_by``.
+        """
+        tasks = await self.load_tasks()
+        return [
+            task for task in itertools.chain(*tasks.values()) if func(task)
+        ]
+
+    async def load_index(self, command='all'):
+        """ Load tasks into a ``taskw.index.TaskIndex``.
+
+        See ``TaskWarriorShellout.load_index``.
+        """
+        index = TaskIndex(
+            await self.load_tasks(command), udas=self.config.get_udas()
+        )
+        self._indexes.add(index)
+        return index
+
+    async def load_frame(self, command='all'):
+        """ Load tasks into a ``taskw.frame.TaskFrame``.
+
+        See ``TaskWarriorShellout.load_frame``.
+        """
+        from taskw.frame import TaskFrame
+        return TaskFrame(
+            await self.load_tasks(command), udas=self.config.get_udas()
+        )
+
+    async def filter_tasks(self, filter_dict):
+        """ Return a filtered list of tasks from taskwarrior.
+
+        See ``TaskWarriorShellout.filter_tasks``.
+        """
+        return await self._get_task_objects(
+            *self._get_filter_args(filter_dict)
+        )
+
+    async def filter_tasks_many(self, filter_dicts):
+        """ Run several ``filter_tasks`` queries concurrently.
+
+        Returns one list of tasks per filter dict, in order.
+        """
+        return list(await asyncio.gather(*[
+            self.filter_tasks(filter_dict) for filter_dict in filter_dicts
+        ]))
+
+    async def changes_since(self, since):
+        """ Returns the tasks changed since ``since``, and a cursor to pass
+        next time.
+
+        See ``TaskWarriorShellout.changes_since``.
+        """
+        cursor = ChangeCursor.get(since)
+        started = int(time.time())
+        tasks = await self._get_task_objects(*self._get_changes_args(cursor))
+        return tasks, ChangeCursor(started, None)
+
+    async def task_import(self, tasks, chunk_size=IMPORT_CHUNK_SIZE):
+        """ Add (or replace) many tasks using `task import`.
+
+        See ``TaskWarriorShellout.task_import``.
+        """
+        uuids = []
+        for payload in self._get_import_payloads(tasks, uuids, chunk_size):
+            await self._execute('import', stdin=payload)
+        return uuids
+
+    async def _get_tasks_by_uuid(self, uuids):
+        uuids = [str(u) for u in uuids]
+        if not uuids:
+            return []
+        return await self._get_task_objects(*(uuids + ['export']))
+
+    def batch(self):
+        """ Queue up task changes and apply them all at once.
+
+        See ``TaskWarriorShellout.batch``; use the returned
+        ``AsyncTaskWarriorBatch`` with ``async with``.
+        """
+        return AsyncTaskWarriorBatch(self)
+
+    async def iter_tasks(self, filter_dict=None):
+        """ Yield the tasks matching ``filter_dict`` one at a time.
+
+        See ``TaskWarriorShellout.iter_tasks``; this is an asynchronous
+        generator.  It takes up one of the ``max_concurrency`` slots until
+        it is exhausted or closed.  Closing it early (or cancelling the
+        task iterating over it) kills taskwarrior.
+        """
+        args = ['export']
+        if filter_dict:
+            args = self._get_filter_args(filter_dict)
+        command, env = self._get_command(args)
+        schema = self._get_schema() if self._marshal else None
+
+        # See TaskWarriorShellout.iter_tasks as to why stderr is a file.
+        with tempfile.TemporaryFile() as stderr:
+            async with self._get_semaphore():
+                try:
+                    proc = await asyncio.create_subprocess_exec(
+                        *command,
+                        env=env,
+                        stdout=subprocess.PIPE,
+                        stderr=stderr,
+                        limit=EXPORT_LINE_LIMIT,
+                    )
+                except FileNotFoundError:
+                    raise FileNotFoundError(
+                        "Unable to find the 'task' command-line tool."
+                    )
+
+                finished = False
+                try:
+                    while True:
+                        line = await proc.stdout.readline()
+                        if not line:
+                            break
+                        task = self._decode_export_line(line)
+                        if task is not None:
+                            yield self._get_task_object(task, schema)
+                    finished = True
+                finally:
+                    if not finished and proc.returncode is None:
+                        try:
+                            proc.kill()
+                        except ProcessLookupError:
+                            pass
+                    await proc.wait()
+
+            if proc.returncode != 0:
+                stderr.seek(0)
+                raise TaskwarriorError(
+                    command, stderr.read(), b'', proc.returncode
+                )
+
+    async def get_task(self, **kw):
+        task_id, task = await self._load_task(**kw)
+        return self._get_pending_id(task_id, task), task
+
+    async def _load_task(self, **kwargs):
+        return self._get_first_task(
+            await self._get_task_objects(*self._get_search_args(kwargs))
+        )
+
+    async def task_add(self, description, tags=None, **kw):
+        """ Add a new task.
+
+        Takes any of the keywords allowed by taskwarrior like proj or prior.
+        """
+        task, annotations, args = self._get_add_args(description, tags, kw)
+        stdout, stderr = await self._execute(*args)
+        self._set_added_uuid(task, stdout)
+
+        for annotation in annotations:
+            await self.task_annotate(task, annotation, readback=False)
+
+        id, added_task = await self.get_task(uuid=task['uuid'])
+        self._check_added_task(added_task, stdout, stderr)
+        self._index_tasks(added_task)
+        return added_task
+
+    async def _get_task_to_write(self, task, lookup, kw):
+        lookup_kw, task = self._get_write_lookup(task, lookup, kw)
+        if lookup_kw is not None:
+            return (await self.get_task(**lookup_kw))[1]
+        return task
+
+    async def _get_written_task(self, task, readback, change):
+        if readback:
+            task = (await self.get_task(uuid=task['uuid']))[1]
+        else:
+            task = self._change_locally(task, change)
+        self._index_tasks(task)
+        return task
+
+    async def task_annotate(self, task, annotation, readback=True):
+        """ Annotates a task. """
+        await self._execute(task['uuid'], 'annotate', '--', annotation)
+        return await self._get_written_task(
+            task, readback, self._annotated(annotation)
+        )
+
+    async def task_denotate(self, task, annotation, readback=True):
+        """ Removes an annotation from a task. """
+        await self._execute(task['uuid'], 'denotate', '--', annotation)
+        return await self._get_written_task(
+            task, readback, self._denotated(annotation)
+        )
+
+    async def task_done(self, task=None, lookup=None, readback=True, **kw):
+        """ Marks a task as done.
+
+        See ``TaskWarriorShellout.task_done``.
+        """
+        task = await self._get_task_to_write(task, lookup, kw)
+        self._check_can_complete(task)
+        await self._execute(task['uuid'], 'done')
+        return await self._get_written_task(task, readback, self._completed)
+
+    async def task_update(self, task, original=None, readback=True):
+        """ Saves changes made to a task.
+
+        See ``TaskWarriorShellout.task_update``.
+        """
+        update = self._prepare_update(task)
+        if update['needs_original']:
+            if original is None:
+                id, original = await self.get_task(uuid=update['uuid'])
+            self._diff_update_annotations(update, original)
+
+        for args in self._get_update_commands(update):
+            await self._execute(*args)
+
+        if readback:
+            id, task = await self.get_task(uuid=update['uuid'])
+        else:
+            id, task = self._update_locally(update)
+        self._index_tasks(task)
+        return id, task
+
+    async def task_delete(self, task=None, lookup=None, readback=True, **kw):
+        """ Marks a task as deleted.
+
+        Accepts the same arguments as ``task_done``.
+        """
+        task = await self._get_task_to_write(task, lookup, kw)
+        self._check_can_delete(task)
+        await self._execute(task['uuid'], 'delete')
+        return await self._get_written_task(task, readback, self._deleted)
+
+    async def task_start(self, task=None, lookup=None, readback=True, **kw):
+        """ Marks a task as started.
+
+        Accepts the same arguments as ``task_done``.
+        """
+        task = await self._get_task_to_write(task, lookup, kw)
+        await self._execute(task['uuid'], 'start')
+        return await self._get_written_task(task, readback, self._started)
+
+    async def task_stop(self, task=None, lookup=None, readback=True, **kw):
+        """ Marks a task as stopped.
+
+        Accepts the same arguments as ``task_done``.
+        """
+        task = await self._get_task_to_write(task, lookup, kw)
+        await self._execute(task['uuid'], 'stop')
+        return await self._get_written_task(task, readback, self._stopped)
+
+    async def task_info(self, **kw):
+        id, task = await self.get_task(**kw)
+        out, err = await self._execute(id, 'info')
+        if err:
+            return err
+        return out
+
+
+class AsyncTaskWarriorBatch(TaskWarriorBatch):
+    """ Task changes queued up by ``AsyncTaskWarriorShellout.batch``.
+
+    Queue changes as with ``TaskWarriorBatch``, inside ``async with``
+    rather than ``with``; ``flush`` is a coroutine.
+    """
+
+    def __enter__(self):
+        raise TypeError("Use 'async with' with AsyncTaskWarriorBatch.")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.flush()
+
+    async def flush(self):
+        """ Apply every queued change; returns the resulting tasks. """
+        existing = self._get_existing()
+        originals = []
+        if existing:
+            originals = await self.warrior._get_json(
+                *(existing + ['export'])
+            )
+        to_import = self._get_imports(originals)
+        await self.warrior.task_import(to_import.values())
+        self._clear()
+        return self._finish(
+            await self.warrior._get_tasks_by_uuid(to_import.keys())
+        )
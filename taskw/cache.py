@@ -0,0 +1,130 @@
+""" Caching what taskwarrior exports.
+
+A ``TaskCache`` keeps the output of recent `task ... export` commands, so
+that asking for the same tasks again doesn't cost another taskwarrior
+process.  Everything cached is dropped as soon as pending.data,
+completed.data or undo.data change (whoever changes them), and entries
+expire after ``ttl`` seconds regardless.
+
+``TaskWarriorShellout(cache_size=...)`` sets one up; see its ``cache``
+attribute for hit and miss counts.
+
+"""
+import collections
+import os
+import threading
+import time
+
+
+# How long, in seconds, cached exports are used for by default.
+DEFAULT_CACHE_TTL = 60
+
+# The files whose changes invalidate a ``TaskCache``.
+WATCHED_FILES = ('pending.data', 'completed.data', 'undo.data')
+
+
+class TaskCache(object):
+    """ An LRU cache of exports, invalidated by changes to the data files.
+
+    ``location`` is taskwarrior's data directory.  At most ``max_size``
+    exports are kept, for ``ttl`` seconds each.
+
+    """
+
+    def __init__(self, location, max_size, ttl=DEFAULT_CACHE_TTL):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1.")
+        self.location = location
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Outputs and their expiry times, least recently used first.
+        self._entries = collections.OrderedDict()
+        # What the data files looked like when the entries were exported.
+        self._signature = None
+        # Exports may run in several threads at once; see LoadStrategy.
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_signature(self):
+        """ Returns the size, modification time and inode of each of the
+        data files, as a tuple.
+
+        """
+        signature = []
+        for name in WATCHED_FILES:
+            try:
+                stat = os.stat(os.path.join(self.location, name))
+            except FileNotFoundError:
+                signature.append(None)
+            else:
+                signature.append(
+                    (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+                )
+        return tuple(signature)
+
+    def get(self, key, signature):
+        """ Returns what was cached under ``key``, or None
+
+        ``signature`` is the current ``get_signature()``.
+
+        """
+        with self._lock:
+            self._check_signature(signature)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, signature):
+        """ Cache ``value`` under ``key``
+
+        ``signature`` is what ``get_signature()`` returned before ``value``
+        was exported.  If the data files have changed since, ``value`` may
+        already be stale and isn't cached.
+
+        """
+        if self.get_signature() != signature:
+            return
+        with self._lock:
+            self._check_signature(signature)
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """ Forget everything cached """
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        """ Returns the hit, miss and invalidation counts, and the number of
+        cached exports, as a dict.
+
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'size': len(self._entries),
+        }
+
+    def _check_signature(self, signature):
+        if signature != self._signature:
+            self._clear()
+            self._signature = signature
+
+    def _clear(self):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
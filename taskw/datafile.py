@@ -0,0 +1,630 @@
+""" Indexed, memory-mapped access to taskwarrior's .data files.
+
+``TaskDataFile`` finds a task by UUID (or by line number) by decoding just
+that task's record, using an index of where each record starts.  The index
+is kept next to the data file as a hidden ``.<name>.index`` file so that
+other processes can reuse it, and is rebuilt whenever the data file's size,
+modification time or inode change.
+
+Writes go through the same index:  new records are appended, and a changed
+record is patched where it stands, so that line numbers (and with them,
+task IDs) never move.  Anything that has to move records rewrites the file
+from the first change onwards, in place, as taskwarrior itself does.
+
+Every write holds the same POSIX (fcntl) lock that taskwarrior takes on a
+data file it changes, and every read a shared one, so neither taskwarrior
+nor taskw sees a file half written; see ``locked``.  The file is never
+replaced by another:  a taskwarrior process waiting for the lock has the
+file open already, and would write to the replaced one.
+
+"""
+import contextlib
+import json
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; writes go unlocked there.
+    fcntl = None
+
+import taskw.utils
+
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the layout of persisted indexes changes.
+INDEX_VERSION = 1
+
+# When data files are flushed to disk with fsync():  after every write,
+# only after records are moved (the riskiest writes), or never.
+FSYNC_ALWAYS = 'always'
+FSYNC_REWRITES = 'rewrites'
+FSYNC_NEVER = 'never'
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_REWRITES, FSYNC_NEVER)
+
+
+def pread(fd, size, offset):
+    """ Read up to ``size`` bytes of ``fd`` from ``offset``
+
+    ``os.pread`` where there is one; elsewhere (Windows), a seek and a read,
+    which moves the descriptor's position.
+
+    """
+    if hasattr(os, 'pread'):
+        return os.pread(fd, size, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    chunks = []
+    while size > 0:
+        chunk = os.read(fd, size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def validate_fsync(fsync):
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError(
+            "Unknown fsync policy, %s. Must be one of %s." %
+            (fsync, ', '.join(FSYNC_POLICIES)))
+    return fsync
+
+
+UUID_ATTRIBUTE = re.compile(br'[\[ ]uuid:"([^"]*)"')
+
+# A lock for each data file, keyed on real path.  POSIX locks belong to the
+# whole process and are dropped as soon as *any* descriptor of the file is
+# closed, so threads must not even read a file while another one writes it.
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+# The open, locked file for each data file being written by this process.
+_held = {}
+
+
+def get_thread_lock(filename):
+    """ Returns the lock serializing this process' access to ``filename`` """
+    filename = os.path.realpath(filename)
+    with _thread_locks_lock:
+        return _thread_locks.setdefault(filename, threading.RLock())
+
+
+@contextlib.contextmanager
+def locked(filename):
+    """ Open ``filename`` for writing, holding taskwarrior's lock on it.
+
+    Taskwarrior takes a POSIX write lock (``fcntl(F_SETLKW)``) on each data
+    file it changes; this takes the same one, so neither can change the
+    file while the other is.  The file is created if it doesn't exist.
+
+    Yields the file, opened 'r+b'.  Everything done to the file while it is
+    locked must go through that object; closing any other descriptor of the
+    file would release the lock.  Nested calls yield the same object.
+
+    """
+    key = os.path.realpath(filename)
+    with get_thread_lock(filename):
+        if key in _held:
+            yield _held[key]
+            return
+
+        while True:
+            f = os.fdopen(os.open(filename, os.O_RDWR | os.O_CREAT), 'r+b')
+            try:
+                if fcntl is not None:
+                    fcntl.lockf(f.fileno(), fcntl.LOCK_EX)
+                # Someone may have replaced the file while we waited, in
+                # which case we hold the lock on a file nobody will read.
+                current = os.stat(filename)
+                if current.st_ino == os.fstat(f.fileno()).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            except BaseException:
+                f.close()
+                raise
+            f.close()
+
+        _held[key] = f
+        try:
+            yield f
+        finally:
+            del _held[key]
+            # This releases the lock.
+            f.close()
+
+
+def _lock_shared(f):
+    """ Keep writers (taskwarrior included) out of ``f`` until it is closed """
+    if fcntl is not None:
+        fcntl.lockf(f.fileno(), fcntl.LOCK_SH)
+
+
+class TaskDataFile(object):
+    """ One taskwarrior .data file, indexed by UUID. """
+
+    def __init__(self, filename, fsync=FSYNC_REWRITES):
+        self.filename = filename
+        self.fsync = validate_fsync(fsync)
+        directory, name = os.path.split(filename)
+        self.index_filename = os.path.join(directory, '.%s.index' % name)
+        self._signature = None
+        self._offsets = []
+        self._uuids = {}
+
+    def __len__(self):
+        with self._open() as data:
+            return len(self._offsets)
+
+    def __iter__(self):
+        """ Decode every task, in file order """
+        with get_thread_lock(self.filename):
+            with open(self.filename, 'rb') as f:
+                _lock_shared(f)
+                data = f.read()
+        for line in data.splitlines(True):
+            yield self._decode(line)
+
+    def get(self, uuid):
+        """ Returns the line number and task with the given UUID
+
+        Line numbers start at 1.  Returns ``(None, None)`` if no task in
+        this file has that UUID.
+
+        """
+        with self._open() as data:
+            line = self._uuids.get(str(uuid))
+            if line is None:
+                return None, None
+            return line, self._read(data, line)
+
+    def line(self, line):
+        """ Returns the task on the given line, or ``None`` """
+        with self._open() as data:
+            if not 1 <= line <= len(self._offsets):
+                return None
+            return self._read(data, line)
+
+    def append(self, records):
+        """ Append encoded records to the file
+
+        Returns the line number of the first of them.
+
+        """
+        with locked(self.filename) as f:
+            size = self._refresh_locked(f)
+            first = len(self._offsets) + 1
+            position = size
+            if size and pread(f.fileno(), 1, size - 1) != b'\n':
+                # Don't glue the first new record to an unterminated line.
+                records = ['\n'] + list(records)
+
+            encoded = [record.encode('utf-8') for record in records]
+            f.seek(size)
+            f.write(b''.join(encoded))
+            self._flush(f)
+
+            for record in encoded:
+                if record != b'\n':
+                    self._index_record(len(self._offsets) + 1, record)
+                    self._offsets.append(position)
+                position += len(record)
+            self._signature = self._get_signature(f.fileno())
+        return first
+
+    def replace(self, line, record):
+        """ Replace the record on the given line with an encoded record
+
+        If the record carries a UUID, and another process has since moved
+        the task with that UUID to another line, that line is replaced
+        instead.
+
+        A record of the same length is overwritten where it stands;
+        otherwise, the file is rewritten from that record onwards.
+
+        """
+        encoded = record.encode('utf-8')
+        with locked(self.filename) as f:
+            size = self._refresh_locked(f)
+            match = UUID_ATTRIBUTE.search(encoded)
+            if match is not None:
+                line = self._uuids.get(match.group(1).decode('utf-8'), line)
+            if not 1 <= line <= len(self._offsets):
+                raise IndexError("No record on line %d" % line)
+
+            start, end = self._get_span(size, line)
+            old = pread(f.fileno(), end - start, start)
+            if len(encoded) == len(old):
+                f.seek(start)
+                f.write(encoded)
+                self._flush(f)
+                signature = self._get_signature(f.fileno())
+            else:
+                signature = self._rewrite(f, [(start, end, encoded)])
+
+            self._unindex_record(line, old)
+            self._index_record(line, encoded)
+            self._shift_offsets(line, len(encoded) - len(old))
+            self._signature = signature
+
+    def remove(self, line):
+        """ Remove the record on the given line, moving those following it
+
+        """
+        with locked(self.filename) as f:
+            size = self._refresh_locked(f)
+            if not 1 <= line <= len(self._offsets):
+                raise IndexError("No record on line %d" % line)
+            start, end = self._get_span(size, line)
+            old = pread(f.fileno(), end - start, start)
+            signature = self._rewrite(f, [(start, end, b'')])
+
+            self._unindex_record(line, old)
+            del self._offsets[line - 1]
+            self._shift_offsets(line - 1, -len(old))
+            for uuid, found in list(self._uuids.items()):
+                if found > line:
+                    self._uuids[uuid] = found - 1
+            self._signature = signature
+
+    def compact(self, keep, before_replace=None):
+        """ Rewrite the file with only the tasks for which ``keep`` is true
+
+        ``before_replace`` is called with the tasks being dropped before the
+        file is rewritten (and while it is locked), so that they can be
+        saved elsewhere first.
+
+        Returns the tasks that were dropped, in file order.
+
+        """
+        with locked(self.filename) as f:
+            size = self._refresh_locked(f)
+            dropped = []
+            cuts = []
+            for line in range(1, len(self._offsets) + 1):
+                start, end = self._get_span(size, line)
+                task = self._decode(pread(f.fileno(), end - start, start))
+                if not keep(task):
+                    dropped.append(task)
+                    cuts.append((start, end, b''))
+
+            if dropped:
+                if before_replace is not None:
+                    before_replace(dropped)
+                self._rewrite(f, cuts)
+                # Cheaper to rebuild than to patch for many cuts.
+                self._signature = None
+        return dropped
+
+    def rewrite(self, records):
+        """ Replace the whole file with encoded records, in one write """
+        encoded = b''.join(record.encode('utf-8') for record in records)
+        with locked(self.filename) as f:
+            size = self._get_signature(f.fileno())[0]
+            self._rewrite(f, [(0, size, encoded)])
+            # The index is rebuilt the next time it is needed.
+            self._signature = None
+
+    def _flush(self, f):
+        f.flush()
+        if self.fsync == FSYNC_ALWAYS:
+            os.fsync(f.fileno())
+
+    def _rewrite(self, f, changes):
+        """ Make ``changes`` to the locked file ``f``, in place
+
+        ``changes`` are (start, end, replacement) triples, in file order.
+        Everything from the first change onwards is written again, through
+        ``f`` so that the lock is kept.  Returns the new file's signature.
+
+        """
+        size = self._get_signature(f.fileno())[0]
+        first = changes[0][0] if changes else size
+        old = pread(f.fileno(), size - first, first)
+        pieces = []
+        position = first
+        for start, end, replacement in changes:
+            pieces.append(old[position - first:start - first])
+            pieces.append(replacement)
+            position = end
+        pieces.append(old[position - first:])
+
+        f.seek(first)
+        f.write(b''.join(pieces))
+        f.truncate()
+        f.flush()
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(f.fileno())
+        return self._get_signature(f.fileno())
+
+    def _get_span(self, size, line):
+        start = self._offsets[line - 1]
+        if line < len(self._offsets):
+            end = self._offsets[line]
+        else:
+            end = size
+        return start, end
+
+    def _index_record(self, line, record):
+        match = UUID_ATTRIBUTE.search(record)
+        if match is not None:
+            self._uuids.setdefault(match.group(1).decode('utf-8'), line)
+
+    def _unindex_record(self, line, record):
+        match = UUID_ATTRIBUTE.search(record)
+        if match is not None:
+            uuid = match.group(1).decode('utf-8')
+            if self._uuids.get(uuid) == line:
+                del self._uuids[uuid]
+
+    def _shift_offsets(self, line, delta):
+        """ Move the start of every record after ``line`` by ``delta`` """
+        if delta:
+            offsets = self._offsets
+            for i in range(line, len(offsets)):
+                offsets[i] += delta
+
+    def _decode(self, record):
+        return taskw.utils.decode_task(record.decode('utf-8'))
+
+    def _read(self, data, line):
+        start, end = self._get_span(len(data), line)
+        return self._decode(data[start:end])
+
+    def _open(self, index=True):
+        return _MappedFile(self, index)
+
+    def _get_signature(self, fd):
+        stat = os.fstat(fd)
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+    def _refresh(self, data, signature, save=True):
+        """ Make sure the index matches ``data``, the mapped file """
+        if signature == self._signature:
+            return
+        if not self._load_index(signature):
+            self._build_index(data)
+            if save:
+                self._save_index(signature)
+        self._signature = signature
+
+    def _refresh_locked(self, f):
+        """ Make sure the index matches ``f``, the locked file
+
+        Returns the size of the file.
+
+        """
+        signature = self._get_signature(f.fileno())
+        if signature != self._signature:
+            # Mapping the file would release the lock; read it instead.
+            # There's no point saving an index of a file about to change.
+            self._refresh(
+                pread(f.fileno(), signature[0], 0) if signature[0] else b'',
+                signature,
+                save=False,
+            )
+        return signature[0]
+
+    def _build_index(self, data):
+        offsets = []
+        uuids = {}
+        position = 0
+        size = len(data)
+        while position < size:
+            offsets.append(position)
+            end = data.find(b'\n', position)
+            if end < 0:
+                end = size
+            match = UUID_ATTRIBUTE.search(data, position, end)
+            if match is not None:
+                uuids.setdefault(match.group(1).decode('utf-8'), len(offsets))
+            position = end + 1
+        self._offsets, self._uuids = offsets, uuids
+
+    def _load_index(self, signature):
+        try:
+            with open(self.index_filename, 'r') as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        if (
+            index.get('version') != INDEX_VERSION
+            or index.get('signature') != signature
+        ):
+            return False
+        self._offsets, self._uuids = index['offsets'], index['uuids']
+        return True
+
+    def _save_index(self, signature):
+        index = {
+            'version': INDEX_VERSION,
+            'signature': signature,
+            'offsets': self._offsets,
+            'uuids': self._uuids,
+        }
+        directory = os.path.dirname(self.index_filename)
+        try:
+            fd, temporary = tempfile.mkstemp(
+                dir=directory, prefix='.taskw-index'
+            )
+            with os.fdopen(fd, 'w') as f:
+                json.dump(index, f)
+            os.replace(temporary, self.index_filename)
+        except (IOError, OSError) as e:
+            # The index is only an optimization; carry on without it.
+            logger.debug("Unable to save %s: %s", self.index_filename, e)
+
+
+class _MappedFile(object):
+    """ Maps a data file for the duration of a ``with`` block.
+
+    The mapping is short-lived on purpose:  taskwarrior truncates and
+    rewrites data files, and touching a mapping past the end of a truncated
+    file would crash the process.  A shared lock keeps taskwarrior from
+    doing so meanwhile, and the file's thread lock is held throughout; see
+    ``get_thread_lock``.
+
+    """
+
+    def __init__(self, data_file, index):
+        self.data_file = data_file
+        self.index = index
+        self.lock = get_thread_lock(data_file.filename)
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.file = None
+        self.data = None
+        try:
+            held = _held.get(os.path.realpath(self.data_file.filename))
+            if held is not None:
+                # This thread is writing the file; mapping it would release
+                # the lock, so read it through the locked file instead.
+                signature = self.data_file._get_signature(held.fileno())
+                self.data = pread(held.fileno(), signature[0], 0)
+                if self.index:
+                    self.data_file._refresh(self.data, signature)
+                return self.data
+
+            self.file = open(self.data_file.filename, 'rb')
+            _lock_shared(self.file)
+            signature = self.data_file._get_signature(self.file.fileno())
+            if signature[0]:
+                self.data = mmap.mmap(
+                    self.file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            else:
+                # Empty files can't be mapped.
+                self.data = b''
+            if self.index:
+                self.data_file._refresh(self.data, signature)
+        except Exception:
+            self.__exit__(None, None, None)
+            raise
+        return self.data
+
+    def __exit__(self, type, value, traceback):
+        try:
+            if isinstance(self.data, mmap.mmap):
+                self.data.close()
+            if self.file is not None:
+                self.file.close()
+        finally:
+            self.lock.release()
+
+
+class StagedDataFile(object):
+    """ Changes to a locked ``TaskDataFile``, held back until ``commit``
+
+    Offers the same reads and writes as ``TaskDataFile``, against a copy of
+    the file kept in memory, so that any number of changes cost a single
+    write when they are committed.
+
+    """
+
+    def __init__(self, data_file):
+        self.data_file = data_file
+        # The file is locked by now, so this reads it through the lock.
+        with data_file._open(index=False) as data:
+            self._records = [
+                line.decode('utf-8') for line in data[:].splitlines(True)
+            ]
+        if self._records and not self._records[-1].endswith('\n'):
+            self._records[-1] += '\n'
+        # Records from here on are new; if nothing before them changed,
+        # committing them is a simple append.
+        self._appended_from = len(self._records)
+        self._rewrite_needed = False
+        self._uuids = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        for record in list(self._records):
+            yield taskw.utils.decode_task(record)
+
+    def get(self, uuid):
+        line = self._get_uuids().get(str(uuid))
+        if line is None:
+            return None, None
+        return line, self.line(line)
+
+    def line(self, line):
+        if not 1 <= line <= len(self._records):
+            return None
+        return taskw.utils.decode_task(self._records[line - 1])
+
+    def append(self, records):
+        first = len(self._records) + 1
+        for record in records:
+            self._records.append(record)
+            if self._uuids is not None:
+                self._index(len(self._records), record)
+        return first
+
+    def replace(self, line, record):
+        match = UUID_ATTRIBUTE.search(record.encode('utf-8'))
+        if match is not None:
+            line = self._get_uuids().get(match.group(1).decode('utf-8'), line)
+        if not 1 <= line <= len(self._records):
+            raise IndexError("No record on line %d" % line)
+        self._records[line - 1] = record
+        self._touch(line)
+        self._uuids = None
+
+    def remove(self, line):
+        if not 1 <= line <= len(self._records):
+            raise IndexError("No record on line %d" % line)
+        del self._records[line - 1]
+        self._touch(line)
+        self._uuids = None
+
+    def compact(self, keep, before_replace=None):
+        kept = []
+        dropped = []
+        for record in self._records:
+            task = taskw.utils.decode_task(record)
+            if keep(task):
+                kept.append(record)
+            else:
+                dropped.append(task)
+        if dropped:
+            if before_replace is not None:
+                before_replace(dropped)
+            self._records = kept
+            self._touch(1)
+            self._uuids = None
+        return dropped
+
+    def commit(self):
+        """ Write every change to the file, with a single write """
+        if self._rewrite_needed:
+            self.data_file.rewrite(self._records)
+        elif self._appended_from < len(self._records):
+            self.data_file.append(self._records[self._appended_from:])
+        self._appended_from = len(self._records)
+        self._rewrite_needed = False
+
+    def _touch(self, line):
+        if line <= self._appended_from:
+            self._rewrite_needed = True
+
+    def _index(self, line, record):
+        match = UUID_ATTRIBUTE.search(record.encode('utf-8'))
+        if match is not None:
+            self._uuids.setdefault(match.group(1).decode('utf-8'), line)
+
+    def _get_uuids(self):
+        if self._uuids is None:
+            self._uuids = {}
+            for line, record in enumerate(self._records):
+                self._index(line + 1, record)
+        return self._uuids
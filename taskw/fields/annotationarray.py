@@ -1,7 +1,6 @@
-from dateutil.parser import parse
-
 from .array import ArrayField
 from .base import DirtyableList
+from .date import parse_date
 
 
 class Annotation(str):
@@ -22,7 +21,7 @@ class Annotation(str):
     @property
     def entry(self):
         if self._entry:
-            return parse(self._entry)
+            return parse_date(self._entry)
         return self._entry
 
 
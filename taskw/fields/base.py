@@ -1,4 +1,5 @@
 import copy
+import functools
 import sys
 
 
@@ -45,24 +46,82 @@ class Field(object):
 
 
 class Dirtyable(object):
-    """ Superclass for all objects implementing trackability."""
+    """ Superclass for all objects implementing trackability.
+
+    Nothing is copied until the object is first changed; only then is its
+    original value kept, for ``get_changes`` to compare against.  Changes
+    to the items themselves (rather than to the object holding them) go
+    unnoticed.
+
+    """
+    _dirty = False
+    _original_value = None
 
     def __init__(self, value=None):
-        self._original_value = copy.deepcopy(value)
         super(Dirtyable, self).__init__(value)
 
+    def _touch(self):
+        if not self._dirty:
+            self._original_value = copy.deepcopy(self._base(self))
+            self._dirty = True
+
     def get_changes(self, keep=False):
-        if self._original_value == self:
+        if not self._dirty or self._original_value == self:
             return {}
         result = (self._original_value, self)
         if not keep:
-            self._original_value = copy.deepcopy(self)
+            self._dirty = False
+            self._original_value = None
+        return result
+
+    def __copy__(self):
+        result = self.__class__(self)
+        result._dirty = self._dirty
+        result._original_value = self._original_value
         return result
 
+    def __deepcopy__(self, memo):
+        result = self.__class__(copy.deepcopy(self._base(self), memo))
+        result._dirty = self._dirty
+        result._original_value = copy.deepcopy(self._original_value, memo)
+        return result
+
+
+def _tracked(method):
+    """ Wraps ``method`` to note that it is about to change the object """
+    @functools.wraps(method)
+    def tracked(self, *args, **kwargs):
+        self._touch()
+        return method(self, *args, **kwargs)
+    return tracked
+
 
 class DirtyableList(Dirtyable, list):
-    pass
+    _base = list
+
+    __setitem__ = _tracked(list.__setitem__)
+    __delitem__ = _tracked(list.__delitem__)
+    __iadd__ = _tracked(list.__iadd__)
+    __imul__ = _tracked(list.__imul__)
+    append = _tracked(list.append)
+    extend = _tracked(list.extend)
+    insert = _tracked(list.insert)
+    pop = _tracked(list.pop)
+    remove = _tracked(list.remove)
+    clear = _tracked(list.clear)
+    sort = _tracked(list.sort)
+    reverse = _tracked(list.reverse)
 
 
 class DirtyableDict(Dirtyable, dict):
-    pass
+    _base = dict
+
+    __setitem__ = _tracked(dict.__setitem__)
+    __delitem__ = _tracked(dict.__delitem__)
+    pop = _tracked(dict.pop)
+    popitem = _tracked(dict.popitem)
+    clear = _tracked(dict.clear)
+    update = _tracked(dict.update)
+    setdefault = _tracked(dict.setdefault)
+    if hasattr(dict, '__ior__'):
+        __ior__ = _tracked(dict.__ior__)
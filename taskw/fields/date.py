@@ -9,11 +9,34 @@ from taskw.utils import DATE_FORMAT
 from .base import Field
 
 
+def parse_date(value):
+    """ Parse a date, as taskwarrior writes them or otherwise.
+
+    taskwarrior always exports dates in the form DATE_FORMAT describes,
+    so those are picked apart directly; anything else is left to dateutil.
+
+    """
+    if (
+        len(value) == 16 and value[8] == 'T' and value[15] == 'Z'
+        and value[:8].isdigit() and value[9:15].isdigit()
+    ):
+        try:
+            return datetime.datetime(
+                int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                int(value[9:11]), int(value[11:13]), int(value[13:15]),
+                tzinfo=dateutil.tz.tzutc(),
+            )
+        except ValueError:
+            # Out of range; let dateutil say so.
+            pass
+    return parse(value)
+
+
 class DateField(Field):
     def deserialize(self, value):
         if not value:
             return value
-        value = parse(value)
+        value = parse_date(value)
         if not value.tzinfo:
             value = value.replace(tzinfo=pytz.utc)
         return value
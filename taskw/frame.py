@@ -0,0 +1,174 @@
+""" Columnar snapshots of tasks, for analytics.
+
+A ``TaskFrame`` holds tasks (typically from ``load_tasks``) one NumPy
+array per attribute rather than one dict per task, so that counting,
+grouping and date arithmetic over hundreds of thousands of tasks run
+vectorized::
+
+    frame = tw.load_frame()
+    frame.counts('project')
+    overdue = frame.equals('status', 'pending') & (
+        frame.dates['due'] < numpy.datetime64('now')
+    )
+    ages = frame.dates['end'] - frame.dates['entry']
+
+Dates become ``datetime64[s]`` arrays, in UTC and with NaT where a task
+has no such date; status, project and priority become integer codes into
+a sorted list of the values seen, with -1 where a task has none; tags
+become a boolean matrix with a row per task and a column per tag; and
+urgency and numeric UDAs become float arrays, with NaN where a task has
+no value.
+
+NumPy isn't installed along with taskw; install it to use this module.
+
+"""
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from taskw.fields import NumericField
+from taskw.query import _get_timestamp
+
+
+# Attributes stored as dates, as categories, and as numbers (along with
+# any numeric UDAs).
+DATE_COLUMNS = ('entry', 'due', 'end', 'modified', 'start')
+CATEGORY_COLUMNS = ('status', 'project', 'priority')
+NUMERIC_COLUMNS = ('urgency', )
+
+
+class TaskFrame(object):
+    """ Tasks, as NumPy arrays with an element per task.
+
+    ``tasks`` may be a dict of lists of tasks, as returned by
+    ``load_tasks``, or any iterable of tasks, marshalled or not.  Numeric
+    fields among ``udas`` (as returned by ``TaskRc.get_udas``) get a
+    column in ``numbers``.
+
+    Element ``i`` of every array belongs to the task whose UUID is
+    ``uuids[i]``.
+
+    """
+
+    def __init__(self, tasks=(), udas=None):
+        if numpy is None:
+            raise ImportError("TaskFrame requires numpy to be installed.")
+        if isinstance(tasks, dict):
+            tasks = itertools.chain(*tasks.values())
+        tasks = list(tasks)
+
+        self.uuids = numpy.array(
+            [str(task.get('uuid', '')) for task in tasks], dtype=object
+        )
+        self.dates = dict(
+            (column, self._get_dates(tasks, column))
+            for column in DATE_COLUMNS
+        )
+
+        # Codes index into the sorted values of each column.
+        self.codes = {}
+        self.categories = {}
+        for column in CATEGORY_COLUMNS:
+            self.categories[column], self.codes[column] = (
+                self._get_categories(tasks, column)
+            )
+
+        self.tag_names = sorted(set(
+            tag for task in tasks for tag in (task.get('tags') or ())
+        ))
+        positions = dict(
+            (tag, position) for position, tag in enumerate(self.tag_names)
+        )
+        self.tags = numpy.zeros(
+            (len(tasks), len(self.tag_names)), dtype=bool
+        )
+        for row, task in enumerate(tasks):
+            for tag in task.get('tags') or ():
+                self.tags[row, positions[tag]] = True
+
+        numeric = list(NUMERIC_COLUMNS) + sorted(
+            name for name, field in (udas or {}).items()
+            if isinstance(field, NumericField)
+        )
+        self.numbers = dict(
+            (column, self._get_numbers(tasks, column)) for column in numeric
+        )
+
+    def __len__(self):
+        return len(self.uuids)
+
+    def equals(self, column, value):
+        """ Returns a boolean array, true for tasks whose category
+        ``column`` is ``value``.
+
+        """
+        try:
+            code = self.categories[column].index(value)
+        except ValueError:
+            return numpy.zeros(len(self), dtype=bool)
+        return self.codes[column] == code
+
+    def has_tag(self, tag):
+        """ Returns a boolean array, true for tasks tagged ``tag`` """
+        try:
+            position = self.tag_names.index(tag)
+        except ValueError:
+            return numpy.zeros(len(self), dtype=bool)
+        return self.tags[:, position].copy()
+
+    def counts(self, column, mask=None):
+        """ Count the tasks having each value of a category, or each tag
+
+        ``column`` is one of ``CATEGORY_COLUMNS``, or 'tags'.  If ``mask``
+        (a boolean array) is given, only the tasks it selects are counted.
+
+        Returns a dict mapping each value to its count; tasks without a
+        value aren't counted.
+
+        """
+        if column == 'tags':
+            tags = self.tags if mask is None else self.tags[mask]
+            return dict(zip(self.tag_names, tags.sum(axis=0).tolist()))
+        codes = self.codes[column]
+        if mask is not None:
+            codes = codes[mask]
+        counts = numpy.bincount(
+            codes[codes >= 0], minlength=len(self.categories[column])
+        )
+        return dict(zip(self.categories[column], counts.tolist()))
+
+    def _get_dates(self, tasks, column):
+        timestamps = []
+        for task in tasks:
+            value = task.get(column)
+            timestamp = _get_timestamp(value) if value else None
+            timestamps.append(None if timestamp is None else int(timestamp))
+        return numpy.array(timestamps, dtype='datetime64[s]')
+
+    def _get_categories(self, tasks, column):
+        values = [task.get(column) or None for task in tasks]
+        categories = sorted(set(values) - set([None]))
+        positions = dict(
+            (value, position) for position, value in enumerate(categories)
+        )
+        codes = numpy.fromiter(
+            (positions.get(value, -1) for value in values),
+            dtype=numpy.int32,
+            count=len(values),
+        )
+        return categories, codes
+
+    def _get_numbers(self, tasks, column):
+        numbers = numpy.full(len(tasks), numpy.nan)
+        for row, task in enumerate(tasks):
+            value = task.get(column)
+            if value is None or value == '':
+                continue
+            try:
+                numbers[row] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return numbers
@@ -0,0 +1,245 @@
+""" Indexed snapshots of tasks.
+
+A ``TaskIndex`` holds tasks (typically from ``load_tasks``) along with
+hash indexes on their UUID, status, project and tags, and sorted indexes
+on their dates, so that lookups cost O(1) and date ranges O(log n + k)
+rather than a scan of every task::
+
+    index = tw.load_index()
+    index.get('c1c431ea-f0dc-4683-9a20-e64fcfa65fd1')
+    index.lookup('tags', 'errand')
+    index.range('due', before=datetime.datetime(2024, 1, 1))
+    index.filter({'project': 'work', 'due.before': 'tomorrow'})
+
+Indexes built by a warrior's ``load_index`` are kept up to date as tasks
+are added or changed through that warrior; changes made by anything else
+(including ``task_import``) are only seen by loading a new index.
+
+"""
+import bisect
+import itertools
+
+from taskw.query import (
+    MODIFIER_ALIASES,
+    Filter,
+    _get_timestamp,
+    _unquote,
+)
+
+
+# Attributes indexed by value, and by date.  Tasks are always indexed by
+# UUID.
+HASHED_FIELDS = ('status', 'project', 'tags')
+SORTED_FIELDS = ('due', 'entry', 'modified')
+
+
+class TaskIndex(object):
+    """ Tasks, indexed by UUID, status, project, tags and date.
+
+    ``tasks`` may be a dict of lists of tasks, as returned by
+    ``load_tasks``, or any iterable of tasks.  Every task must have a
+    UUID.  ``udas`` are passed on to ``taskw.query.Filter``.
+
+    """
+
+    def __init__(self, tasks=(), udas=None,
+                 hashed_fields=HASHED_FIELDS, sorted_fields=SORTED_FIELDS):
+        self.udas = udas
+        self._tasks = {}
+        # The order tasks were first added in, keyed on UUID.
+        self._positions = {}
+        self._counter = itertools.count()
+        self._hashed = dict((attribute, {}) for attribute in hashed_fields)
+        # Sorted lists of (timestamp, position, UUID).
+        self._sorted = dict((attribute, []) for attribute in sorted_fields)
+        # What each task was indexed under, so it can be unindexed even if
+        # it was changed in place since.
+        self._keys = {}
+
+        if isinstance(tasks, dict):
+            tasks = itertools.chain(*tasks.values())
+        # Later tasks replace earlier ones with the same UUID, as ``add``
+        # would; the sorted indexes are sorted once, at the end.
+        latest = {}
+        for task in tasks:
+            latest[str(task['uuid'])] = task
+        for uuid, task in latest.items():
+            self._add(uuid, task, list.append)
+        for index in self._sorted.values():
+            index.sort()
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __iter__(self):
+        return iter(self._tasks.values())
+
+    def __contains__(self, uuid):
+        return str(uuid) in self._tasks
+
+    def add(self, task):
+        """ Add a task, replacing any task with the same UUID """
+        uuid = str(task['uuid'])
+        self.discard(uuid)
+        self._add(uuid, task, bisect.insort)
+
+    def _add(self, uuid, task, insert):
+        position = self._positions.setdefault(uuid, next(self._counter))
+        hashed = []
+        for attribute, index in self._hashed.items():
+            value = task.get(attribute)
+            if value is None or value == '':
+                continue
+            if isinstance(value, (list, tuple)):
+                values = [str(item) for item in value]
+            else:
+                values = [str(value)]
+            for value in values:
+                uuids = index.get(value)
+                if uuids is None:
+                    uuids = index[value] = set()
+                uuids.add(uuid)
+                hashed.append((attribute, value))
+        ranged = []
+        for attribute, index in self._sorted.items():
+            value = task.get(attribute)
+            if value is None or value == '':
+                continue
+            timestamp = _get_timestamp(value)
+            if timestamp is None:
+                continue
+            entry = (timestamp, position, uuid)
+            insert(index, entry)
+            ranged.append((attribute, entry))
+
+        self._tasks[uuid] = task
+        self._keys[uuid] = (hashed, ranged)
+
+    def discard(self, uuid):
+        """ Remove the task with the given UUID, if there is one """
+        uuid = str(uuid)
+        if uuid not in self._tasks:
+            return
+        hashed, ranged = self._keys.pop(uuid)
+        for attribute, value in hashed:
+            uuids = self._hashed[attribute][value]
+            uuids.discard(uuid)
+            if not uuids:
+                del self._hashed[attribute][value]
+        for attribute, entry in ranged:
+            index = self._sorted[attribute]
+            del index[bisect.bisect_left(index, entry)]
+        del self._tasks[uuid]
+
+    def get(self, uuid, default=None):
+        """ Returns the task with the given UUID """
+        return self._tasks.get(str(uuid), default)
+
+    def lookup(self, attribute, value):
+        """ Returns the tasks whose ``attribute`` is ``value``
+
+        For tags, returns the tasks having the tag ``value``.
+
+        """
+        if attribute == 'uuid':
+            task = self.get(value)
+            return [task] if task is not None else []
+        return self._get_tasks(
+            self._hashed[attribute].get(str(value), ()), ordered=True
+        )
+
+    def range(self, attribute, after=None, before=None):
+        """ Returns the tasks whose date ``attribute`` lies strictly between
+        ``after`` and ``before``, earliest first.
+
+        Either bound may be left out, and may be anything a filter would
+        take as a date.
+
+        """
+        return self._get_tasks(
+            self._get_range(attribute, after, before), ordered=False
+        )
+
+    def filter(self, filter_dict):
+        """ Returns the tasks matching ``filter_dict``, in the order they
+        were added; see ``taskw.query.Filter``.
+
+        The indexes narrow down which tasks the filter is tried against.
+
+        """
+        query = Filter(filter_dict, udas=self.udas)
+        if isinstance(filter_dict, dict):
+            filter_dict = filter_dict.items()
+
+        candidates = [
+            uuids for uuids in (
+                self._get_candidates(key, value) for key, value in filter_dict
+            )
+            if uuids is not None
+        ]
+        if not candidates:
+            return query.filter(self._tasks.values())
+
+        candidates.sort(key=len)
+        uuids = set(candidates[0]).intersection(*candidates[1:])
+        return query.filter(self._get_tasks(uuids, ordered=True))
+
+    def _get_tasks(self, uuids, ordered):
+        if ordered:
+            uuids = sorted(uuids, key=self._positions.__getitem__)
+        return [self._tasks[uuid] for uuid in uuids]
+
+    def _get_range(self, attribute, after, before):
+        index = self._sorted[attribute]
+        start, end = 0, len(index)
+        if after is not None:
+            # Past every entry at ``after`` itself.
+            start = bisect.bisect_left(
+                index, (_get_timestamp(after, query=True), float('inf'))
+            )
+        if before is not None:
+            end = bisect.bisect_left(
+                index, (_get_timestamp(before, query=True), )
+            )
+        return [uuid for timestamp, position, uuid in index[start:end]]
+
+    def _get_candidates(self, key, value):
+        """ The UUIDs of the tasks which may match a single filter clause, or
+        None if the indexes can't tell.
+
+        """
+        if isinstance(value, list) or value is None or value == '':
+            return None
+        attribute, _, modifier = key.partition('.')
+        modifier = MODIFIER_ALIASES.get(modifier, modifier)
+
+        if attribute in self._sorted and modifier in ('before', 'after'):
+            bounds = {modifier: value}
+            return self._get_range(
+                attribute, bounds.get('after'), bounds.get('before')
+            )
+
+        if attribute == 'uuid' and modifier in ('', 'is'):
+            value = _unquote(str(value))
+            if value in self._tasks:
+                return [value]
+            elif modifier == 'is' or len(value) == 36:
+                return []
+            return None
+        if attribute not in self._hashed:
+            return None
+        index = self._hashed[attribute]
+        value = _unquote(str(value))
+        if modifier == 'is' or (
+            attribute == 'tags' and modifier in ('', 'has', 'word')
+        ):
+            return index.get(value, ())
+        if modifier in ('', 'startswith'):
+            # A left match; there are few enough distinct values to check
+            # each of them.
+            return set().union(*[
+                uuids for indexed, uuids in index.items()
+                if indexed.startswith(value)
+            ])
+        return None
+
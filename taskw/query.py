@@ -0,0 +1,314 @@
+""" Evaluating ``filter_tasks`` filters in Python.
+
+``Filter`` understands the same filter dicts ``filter_tasks`` does, and
+matches them against tasks already in memory rather than having
+taskwarrior do so::
+
+    tasks = tw.load_tasks()['pending']
+    work = Filter({'project': 'work', 'tags.has': 'urgent'})
+    urgent = work.filter(tasks)
+
+A filter is compiled once, when it is created, so running it over and over
+again costs little more than the comparisons themselves.
+
+Attributes are matched the way taskwarrior matches them:  a bare
+``attribute`` matches values starting with the one given (or equal to it,
+for dates and numbers), and the modifiers ``is``, ``isnt``, ``has``,
+``hasnt``, ``startswith``, ``endswith``, ``word``, ``noword``, ``before``,
+``after``, ``none`` and ``any`` are supported, along with their aliases.
+``and``, ``or`` and ``xor`` take a list of ``(key, value)`` clauses.
+
+"""
+import calendar
+import datetime
+import functools
+import re
+import time
+
+import dateutil.parser
+import dateutil.tz
+
+from taskw.fields import (
+    AnnotationArrayField,
+    ArrayField,
+    CommaSeparatedUUIDField,
+    DateField,
+    NumericField,
+)
+from taskw.task import Task
+from taskw.utils import DATE_FORMAT, get_annotation_value
+
+
+MODIFIER_ALIASES = {
+    'equals': 'is',
+    'not': 'isnt',
+    'contains': 'has',
+    'left': 'startswith',
+    'right': 'endswith',
+    'below': 'before',
+    'under': 'before',
+    'above': 'after',
+    'over': 'after',
+}
+
+# Modifiers which match tasks lacking the attribute altogether.
+NEGATIVE_MODIFIERS = set(['isnt', 'hasnt', 'noword'])
+
+WORD_MODIFIERS = set(['word', 'noword'])
+
+# How the value of a task is compared to the filter's, for each modifier
+# and kind of attribute.
+STRING_COMPARISONS = {
+    '': lambda actual, expected: actual.startswith(expected),
+    'is': lambda actual, expected: actual == expected,
+    'isnt': lambda actual, expected: actual != expected,
+    'has': lambda actual, expected: expected in actual,
+    'hasnt': lambda actual, expected: expected not in actual,
+    'startswith': lambda actual, expected: actual.startswith(expected),
+    'endswith': lambda actual, expected: actual.endswith(expected),
+    'word': lambda actual, expected: expected.search(actual) is not None,
+    'noword': lambda actual, expected: expected.search(actual) is None,
+    'before': lambda actual, expected: actual < expected,
+    'after': lambda actual, expected: actual > expected,
+}
+ORDERED_COMPARISONS = {
+    '': lambda actual, expected: actual == expected,
+    'is': lambda actual, expected: actual == expected,
+    'isnt': lambda actual, expected: actual != expected,
+    'before': lambda actual, expected: actual < expected,
+    'after': lambda actual, expected: actual > expected,
+}
+LIST_COMPARISONS = {
+    '': lambda actual, expected: expected in actual,
+    'is': lambda actual, expected: expected in actual,
+    'isnt': lambda actual, expected: expected not in actual,
+    'has': lambda actual, expected: expected in actual,
+    'hasnt': lambda actual, expected: expected not in actual,
+    'word': lambda actual, expected: expected in actual,
+    'noword': lambda actual, expected: expected not in actual,
+}
+
+
+def _all(clauses, task):
+    for clause in clauses:
+        if not clause(task):
+            return False
+    return True
+
+
+def _any(clauses, task):
+    for clause in clauses:
+        if clause(task):
+            return True
+    return False
+
+
+def _odd(clauses, task):
+    return sum(1 for clause in clauses if clause(task)) % 2 == 1
+
+
+OPERATORS = {
+    'and': _all,
+    'or': _any,
+    'xor': _odd,
+}
+
+
+class Filter(object):
+    """ A filter dict, compiled to match tasks in memory.
+
+    ``udas`` are the task's user defined attributes, as returned by
+    ``TaskRc.get_udas``; they tell date and numeric UDAs apart from
+    strings.
+
+    """
+
+    def __init__(self, filter_dict, udas=None):
+        self.filter_dict = filter_dict
+        self.fields = Task.FIELDS.copy()
+        self.fields.update(udas or {})
+
+        if isinstance(filter_dict, dict):
+            filter_dict = filter_dict.items()
+        self._clauses = [
+            self._compile(key, value) for key, value in filter_dict
+        ]
+
+    def __call__(self, task):
+        """ Returns True if ``task`` matches the filter """
+        return _all(self._clauses, task)
+
+    def filter(self, tasks):
+        """ Returns the tasks (from any iterable) which match the filter """
+        return [task for task in tasks if self(task)]
+
+    def _compile(self, key, value):
+        if isinstance(value, list):
+            if key not in OPERATORS:
+                raise ValueError(
+                    "Unknown operator, %s. Must be one of %s." %
+                    (key, ', '.join(sorted(OPERATORS))))
+            clauses = [self._compile(k, v) for k, v in value]
+            return functools.partial(OPERATORS[key], clauses)
+
+        attribute, _, modifier = key.partition('.')
+        modifier = MODIFIER_ALIASES.get(modifier, modifier)
+        field = self.fields.get(attribute)
+
+        if modifier in ('none', 'any') or value is None or value == '':
+            present = modifier == 'any' or modifier in NEGATIVE_MODIFIERS
+            return lambda task: _is_present(task.get(attribute)) == present
+
+        if isinstance(field, AnnotationArrayField):
+            # Annotations are searched, rather than compared whole.
+            comparisons = STRING_COMPARISONS
+            expected = _unquote(_get_string(value))
+        elif isinstance(field, (ArrayField, CommaSeparatedUUIDField)):
+            comparisons = LIST_COMPARISONS
+            get = _get_list
+            expected = _unquote(_get_string(value))
+        elif isinstance(field, DateField):
+            comparisons = ORDERED_COMPARISONS
+            get = _get_timestamp
+            expected = _get_timestamp(value, query=True)
+        elif isinstance(field, NumericField):
+            comparisons = ORDERED_COMPARISONS
+            get = _get_number
+            expected = _get_number(value)
+            if expected is None:
+                raise ValueError("%s is not a number." % (value, ))
+        else:
+            comparisons = STRING_COMPARISONS
+            get = _get_string
+            expected = _unquote(_get_string(value))
+
+        if modifier not in comparisons:
+            raise ValueError(
+                "The '%s' modifier can't be used with %s." %
+                (modifier, attribute))
+        compare = comparisons[modifier]
+        missing = modifier in NEGATIVE_MODIFIERS
+        if comparisons is STRING_COMPARISONS and modifier in WORD_MODIFIERS:
+            expected = re.compile(r'\b%s\b' % re.escape(expected))
+
+        if isinstance(field, AnnotationArrayField):
+            def clause(task):
+                actual = _get_annotations(task)
+                if not actual:
+                    return missing
+                if missing:
+                    return all(compare(a, expected) for a in actual)
+                return any(compare(a, expected) for a in actual)
+            return clause
+
+        def clause(task):
+            actual = task.get(attribute)
+            if actual is None or actual == '':
+                return missing
+            actual = get(actual)
+            if actual is None:
+                return missing
+            return compare(actual, expected)
+        return clause
+
+
+def filter_tasks(tasks, filter_dict, udas=None):
+    """ Returns the tasks which match ``filter_dict``; see ``Filter`` """
+    return Filter(filter_dict, udas=udas).filter(tasks)
+
+
+def _is_present(value):
+    return value is not None and value != '' and value != []
+
+
+def _unquote(value):
+    # Quotes protect values from the shell and taskwarrior's parser; they
+    # aren't part of the value.
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+def _get_string(value):
+    if isinstance(value, datetime.date):
+        return str(_get_timestamp(value))
+    return str(value)
+
+
+def _get_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _get_list(value):
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(item) for item in value]
+
+
+def _get_annotations(task):
+    annotations = task.get('annotations')
+    if annotations is None:
+        # The .data files keep each annotation in an attribute of its own.
+        annotations = [
+            value for key, value in sorted(task.items())
+            if key.startswith('annotation_')
+        ]
+    return [get_annotation_value(annotation) for annotation in annotations]
+
+
+def _get_timestamp(value, query=False):
+    """ Seconds since the epoch for a date, in any of the forms tasks (and
+    filters, if ``query``) carry them in.
+
+    """
+    if isinstance(value, datetime.datetime):
+        if not value.tzinfo:
+            #  Dates not having timezone information should be
+            #  assumed to be in local time
+            value = value.replace(tzinfo=dateutil.tz.tzlocal())
+        return value.timestamp()
+    elif isinstance(value, datetime.date):
+        return calendar.timegm(value.timetuple())
+    elif isinstance(value, (int, float)):
+        return value
+    try:
+        return _parse_timestamp(str(value))
+    except ValueError:
+        if query:
+            return _parse_named_date(str(value))
+        return None
+
+
+@functools.lru_cache(maxsize=65536)
+def _parse_timestamp(value):
+    if value.isdigit():
+        # As stored in the .data files.
+        return int(value)
+    try:
+        return calendar.timegm(time.strptime(value, DATE_FORMAT))
+    except ValueError:
+        pass
+    try:
+        parsed = dateutil.parser.parse(value)
+    except (ValueError, OverflowError):
+        raise ValueError("Unable to parse %r as a date." % value)
+    if not parsed.tzinfo:
+        parsed = parsed.replace(tzinfo=dateutil.tz.tzlocal())
+    return parsed.timestamp()
+
+
+def _parse_named_date(value):
+    """ Understands the simplest of taskwarrior's named dates """
+    now = datetime.datetime.now(dateutil.tz.tzlocal())
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    days = {'yesterday': -1, 'today': 0, 'tomorrow': 1}
+    if value == 'now':
+        return now.timestamp()
+    elif value in days:
+        return (today + datetime.timedelta(days=days[value])).timestamp()
+    raise ValueError(
+        "Unable to evaluate %r as a date; use a datetime instead." % value
+    )
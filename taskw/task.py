@@ -20,11 +20,24 @@ from taskw.fields.base import Dirtyable, DirtyableList, DirtyableDict
 # Sentinel value for not specifying a default
 UNSPECIFIED = object()
 
+# How attributes no schema knows of are converted (that is, not at all).
+DEFAULT_FIELD = Field()
+
 
 logger = logging.getLogger(__name__)
 
 
 class Task(dict):
+    """ A task, with its fields marshalled into Python objects.
+
+    Fields are deserialized the first time they are read, so marshalling a
+    large export costs little more than the fields actually used.
+
+    Fields are converted according to ``schema``, a ``TaskSchema``; pass
+    the same one to every task rather than ``udas``, which builds a new
+    one for each.
+
+    """
     FIELDS = {
         'annotations': AnnotationArrayField(label='Annotations'),
         'depends': CommaSeparatedUUIDField(label='Depends Upon'),
@@ -64,31 +77,29 @@ class Task(dict):
         'wait': DateField(label='Wait'),
     }
 
-    def __init__(self, data, udas=None):
-        udas = udas or {}
-        self._fields = self.FIELDS.copy()
-        self._fields.update(udas)
+    def __init__(self, data, udas=None, schema=None):
+        if schema is None:
+            schema = TaskSchema(udas)
+        # Shared with every other task using the same schema; never changed.
+        self._fields = schema.fields
         self._changes = []
 
-        processed = {}
-        for k, v in data.items():
-            processed[k] = self._deserialize(k, v, self._fields)
-
-        super(Task, self).__init__(processed)
+        # Fields still holding the value they were given, serialized.
+        self._serialized_fields = set(data)
+        super(Task, self).__init__(data)
 
     @classmethod
-    def from_stub(cls, data, udas=None):
+    def from_stub(cls, data, udas=None, schema=None):
         """ Create a Task from an already deserialized dict. """
 
-        udas = udas or {}
-        fields = cls.FIELDS.copy()
-        fields.update(udas)
+        if schema is None:
+            schema = TaskSchema(udas)
 
         processed = {}
         for k, v in data.items():
-            processed[k] = cls._serialize(k, v, fields)
+            processed[k] = cls._serialize(k, v, schema.fields)
 
-        return cls(processed, udas)
+        return cls(processed, schema=schema)
 
     @classmethod
     def from_input(cls, input_file=sys.stdin, modify=False, udas=None):
@@ -114,7 +125,7 @@ class Task(dict):
         fields = fields or {}
         converter = fields.get(field, None)
         if not converter:
-            return default if default else Field()
+            return default if default else DEFAULT_FIELD
         return converter
 
     @classmethod
@@ -135,6 +146,75 @@ class Task(dict):
             return False
         return True
 
+    def _deserialize_all(self):
+        for key in list(self._serialized_fields):
+            self[key]
+
+    def __getitem__(self, key):
+        value = super(Task, self).__getitem__(key)
+        if key in self._serialized_fields:
+            value = self._deserialize(key, value, self._fields)
+            super(Task, self).__setitem__(key, value)
+            self._serialized_fields.discard(key)
+        return value
+
+    def __delitem__(self, key):
+        super(Task, self).__delitem__(key)
+        self._serialized_fields.discard(key)
+
+    def __iter__(self):
+        # Overridden so that dict(task) and {**task} go through
+        # __getitem__, rather than copying serialized values.
+        return super(Task, self).__iter__()
+
+    def __eq__(self, other):
+        self._deserialize_all()
+        if isinstance(other, Task):
+            other._deserialize_all()
+        return super(Task, self).__eq__(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        self._deserialize_all()
+        return super(Task, self).__repr__()
+
+    def items(self):
+        self._deserialize_all()
+        return super(Task, self).items()
+
+    def values(self):
+        self._deserialize_all()
+        return super(Task, self).values()
+
+    def copy(self):
+        self._deserialize_all()
+        return super(Task, self).copy()
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return super(Task, self).pop(key, *default)
+
+    def popitem(self):
+        self._deserialize_all()
+        return super(Task, self).popitem()
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        return super(Task, self).setdefault(key, default)
+
+    def clear(self):
+        super(Task, self).clear()
+        self._serialized_fields.clear()
+
     def get(self, key, default=None):
         try:
             return self[key]
@@ -170,8 +250,11 @@ class Task(dict):
                 if serialized else t
             )
 
-        # Check for changes on subordinate items
-        for k, v in self.items():
+        # Check for changes on subordinate items; those not deserialized
+        # yet can't have changed.
+        for k, v in super(Task, self).items():
+            if k in self._serialized_fields:
+                continue
             if isinstance(v, Dirtyable):
                 result = v.get_changes(keep=keep)
                 if result:
@@ -248,5 +331,25 @@ class Task(dict):
                 raise ValueError("%s is a read-only field", key)
 
             super(Task, self).__setitem__(key, value)
+            self._serialized_fields.discard(key)
             return True
         return False
+
+
+class TaskSchema(object):
+    """ The fields tasks are marshalled with:  ``Task.FIELDS``, along with
+    ``udas``.
+
+    A schema is built once and shared by every task using it, so creating
+    a task doesn't copy ``Task.FIELDS`` or build any UDA fields.
+
+    """
+
+    def __init__(self, udas=None):
+        self.udas = udas or {}
+        self.fields = Task.FIELDS.copy()
+        self.fields.update(self.udas)
+
+    def get_field(self, key):
+        """ Returns the field converting ``key``'s values """
+        return self.fields.get(key) or DEFAULT_FIELD
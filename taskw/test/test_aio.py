@@ -0,0 +1,212 @@
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from unittest import TestCase
+
+import pytest
+
+# taskw.aio needs Python 3.6, and these tests asyncio.run.
+if sys.version_info < (3, 7):
+    pytest.skip("requires Python 3.7", allow_module_level=True)
+
+from taskw.aio import AsyncTaskWarriorShellout  # noqa: E402
+from taskw.exceptions import TaskwarriorError  # noqa: E402
+from taskw.warrior import TaskWarriorShellout  # noqa: E402
+
+
+UUID = 'c3f8a9c4-6d6f-4d5e-9d3c-4a1b2f3e4d5c'
+
+# A stand-in 'task' binary: exports a single pending task (unless the
+# filter says 'fail' or 'hang'), saves what it is given to import, fails on
+# 'fail', keeps track of how many copies are running on 'slow' and waits to
+# be killed on 'hang'.
+FAKE_TASK = """#!/bin/sh
+dir=%(dir)s
+for last; do :; done
+case "$*" in
+    *status:waiting*) echo '[]'; exit 0 ;;
+esac
+case "$last" in
+    export)
+        echo '['
+        echo '{"id": 1, "uuid": "%(uuid)s", "description": "foo",' \\
+            '"status": "pending"}'
+        case "$*" in
+            *fail*) echo 'nope' >&2; exit 2 ;;
+            *hang*) echo $$ > $dir/pid; exec sleep 30 ;;
+        esac
+        echo ']'
+        ;;
+    import)
+        cat >> $dir/imported
+        ;;
+    fail)
+        echo 'nope' >&2
+        exit 2
+        ;;
+    slow)
+        touch $dir/running.$$
+        ls $dir | grep -c running >> $dir/peaks
+        sleep 0.2
+        rm $dir/running.$$
+        ;;
+    hang)
+        echo $$ > $dir/pid
+        exec sleep 30
+        ;;
+esac
+"""
+
+
+class TestAsyncTaskWarriorShellout(TestCase):
+    def setUp(self):
+        self.bindir = tempfile.mkdtemp()
+        executable = os.path.join(self.bindir, 'task')
+        with open(executable, 'w') as f:
+            f.write(FAKE_TASK % {'dir': self.bindir, 'uuid': UUID})
+        os.chmod(executable, 0o755)
+        self.original_path = os.environ.get('PATH', '')
+        os.environ['PATH'] = os.pathsep.join([self.bindir, self.original_path])
+        TaskWarriorShellout.set_version('2.5.1')
+
+        self.taskrc = os.path.join(self.bindir, 'taskrc')
+        with open(self.taskrc, 'w') as f:
+            f.write('data.location=%s\n' % self.bindir)
+
+    def tearDown(self):
+        os.environ['PATH'] = self.original_path
+        TaskWarriorShellout.set_version(None)
+        shutil.rmtree(self.bindir)
+
+    def get_warrior(self, **kwargs):
+        return AsyncTaskWarriorShellout(config_filename=self.taskrc, **kwargs)
+
+    def test_load_tasks(self):
+        tasks = asyncio.run(self.get_warrior().load_tasks())
+        assert set(tasks.keys()) == set(['pending', 'completed'])
+        assert [t['uuid'] for t in tasks['pending']] == [UUID]
+
+    def test_get_task_marshal(self):
+        tw = self.get_warrior(marshal=True)
+        id, task = asyncio.run(tw.get_task(uuid=UUID))
+        assert id == 1
+        assert str(task['uuid']) == UUID
+
+    def test_task_done_locally(self):
+        tw = self.get_warrior()
+        task = asyncio.run(
+            tw.task_done(uuid=UUID, lookup=False, readback=False)
+        )
+        assert task['status'] == 'completed'
+
+    def test_error(self):
+        with self.assertRaises(TaskwarriorError):
+            asyncio.run(self.get_warrior()._execute('fail'))
+
+    def test_concurrency_limit(self):
+        tw = self.get_warrior(max_concurrency=2)
+
+        async def run():
+            await asyncio.gather(*[tw._execute('slow') for i in range(5)])
+
+        asyncio.run(run())
+        with open(os.path.join(self.bindir, 'peaks')) as f:
+            peaks = [int(line) for line in f]
+        assert len(peaks) == 5
+        assert max(peaks) <= 2
+
+    def test_cancel_kills_process(self):
+        tw = self.get_warrior()
+        pidfile = os.path.join(self.bindir, 'pid')
+
+        async def run():
+            call = asyncio.ensure_future(tw._execute('hang'))
+            while not os.path.exists(pidfile):
+                await asyncio.sleep(0.01)
+            call.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await call
+
+        started = time.time()
+        asyncio.run(run())
+        assert time.time() - started < 10
+
+        with open(pidfile) as f:
+            pid = int(f.read())
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+    def test_filter_by(self):
+        tw = self.get_warrior()
+        tasks = asyncio.run(tw.filter_by(lambda t: t['description'] == 'foo'))
+        # Exported once per status by the stand-in binary.
+        assert set(t['uuid'] for t in tasks) == set([UUID])
+        assert asyncio.run(tw.filter_by(lambda t: False)) == []
+
+    def test_iter_tasks(self):
+        tw = self.get_warrior(marshal=True)
+
+        async def run():
+            return [task async for task in tw.iter_tasks({'project': 'a'})]
+
+        tasks = asyncio.run(run())
+        assert [str(t['uuid']) for t in tasks] == [UUID]
+
+    def test_iter_tasks_error(self):
+        tw = self.get_warrior()
+
+        async def run():
+            return [task async for task in tw.iter_tasks({'project': 'fail'})]
+
+        with self.assertRaises(TaskwarriorError) as e:
+            asyncio.run(run())
+        assert e.exception.stderr.strip() == b'nope'
+
+    def test_iter_tasks_close_kills(self):
+        tw = self.get_warrior(max_concurrency=1)
+        pidfile = os.path.join(self.bindir, 'pid')
+
+        async def run():
+            tasks = tw.iter_tasks({'project': 'hang'})
+            first = await tasks.__anext__()
+            while not os.path.exists(pidfile):
+                await asyncio.sleep(0.01)
+            await tasks.aclose()
+            # Its slot is free again.
+            await tw.filter_tasks({})
+            return first
+
+        assert asyncio.run(run())['uuid'] == UUID
+        with open(pidfile) as f:
+            pid = int(f.read())
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+    def test_batch(self):
+        tw = self.get_warrior()
+
+        async def run():
+            async with tw.batch() as batch:
+                added = batch.task_add('bar')
+                batch.task_annotate(UUID, 'baz')
+            return added, batch
+
+        added, batch = asyncio.run(run())
+        with open(os.path.join(self.bindir, 'imported')) as f:
+            imported = [json.loads(line) for line in f]
+        assert [t['uuid'] for t in imported] == [added['uuid'], UUID]
+        assert imported[1]['annotations'][0]['description'] == 'baz'
+        assert [t['uuid'] for t in batch.tasks] == [UUID]
+
+    def test_batch_needs_async_with(self):
+        with self.assertRaises(TypeError):
+            with self.get_warrior().batch():
+                pass
+
+    def test_max_concurrency_validated(self):
+        with self.assertRaises(ValueError):
+            self.get_warrior(max_concurrency=0)
@@ -0,0 +1,472 @@
+""" Timings of taskw's performance-sensitive paths.
+
+These are slow, so they only run when the TASKW_BENCHMARK environment
+variable is set::
+
+    TASKW_BENCHMARK=1 python -m pytest -s taskw/test/test_benchmarks.py
+
+TASKW_BENCHMARK_TASKS sets the size of the generated task databases.
+
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import uuid
+from unittest import TestCase
+
+import dateutil.parser
+import pytest
+
+from taskw.fields.date import parse_date
+from taskw.frame import TaskFrame
+from taskw.test.test_datafile import write_tasks
+from taskw.index import TaskIndex
+from taskw.query import Filter
+from taskw.record import TaskRecord
+from taskw.task import Task, TaskSchema
+from taskw.taskrc import TaskRc
+from taskw.undo import UndoJournal, iter_entries
+from taskw.test.test_utils import (
+    reference_decode_task,
+    reference_encode_task,
+)
+from taskw.utils import decode_task, encode_task
+from taskw.warrior import (
+    LoadStrategy,
+    TaskWarriorDirect,
+    TaskWarriorShellout,
+)
+
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get('TASKW_BENCHMARK'),
+    reason="Set TASKW_BENCHMARK to run benchmarks",
+)
+
+BENCHMARK_TASKS = int(os.environ.get('TASKW_BENCHMARK_TASKS', 50000))
+
+
+def best_of(func, repeat=3):
+    """ Returns the fastest of ``repeat`` runs of ``func``, in seconds """
+    timings = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def report(name, timings):
+    print('')
+    for label, seconds in sorted(timings.items(), key=lambda t: t[1]):
+        print('%s %-10s %8.3fs' % (name, label, seconds))
+
+
+class TestShelloutBenchmark(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not TaskWarriorShellout.can_use():
+            raise pytest.skip.Exception("'task' is not installed")
+
+        cls.dname = tempfile.mkdtemp(prefix='taskw-benchmark')
+        cls.fname = os.path.join(cls.dname, 'taskrc')
+        with open(cls.fname, 'w') as f:
+            f.write('data.location=%s\ngc=off\n' % cls.dname)
+
+        # A mix of statuses, roughly as an old database would have.
+        statuses = ['completed'] * 7 + ['pending'] * 2 + ['deleted']
+        cls.tw = TaskWarriorShellout(config_filename=cls.fname)
+        cls.tw.task_import(
+            {
+                'description': 'task %d' % i,
+                'status': statuses[i % len(statuses)],
+                'project': 'project%d' % (i % 20),
+            }
+            for i in range(BENCHMARK_TASKS)
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dname)
+
+    def test_load_tasks(self):
+        timings = dict(
+            (strategy, best_of(
+                lambda: self.tw.load_tasks(strategy=strategy)
+            ))
+            for strategy in [
+                LoadStrategy.SERIAL, LoadStrategy.THREADS, LoadStrategy.SINGLE
+            ]
+        )
+        report('load_tasks', timings)
+
+    def test_filter_tasks_many(self):
+        filters = [{'project': 'project%d' % i} for i in range(8)]
+        timings = dict(
+            (strategy, best_of(
+                lambda: self.tw.filter_tasks_many(filters, strategy=strategy)
+            ))
+            for strategy in [LoadStrategy.SERIAL, LoadStrategy.THREADS]
+        )
+        report('filter_tasks_many', timings)
+
+    def test_filter_in_memory(self):
+        filter_dict = {'project': 'project3', 'status': 'pending'}
+        tasks = sum(self.tw.load_tasks().values(), [])
+        query = Filter(filter_dict)
+        timings = {
+            'taskwarrior': best_of(lambda: self.tw.filter_tasks(filter_dict)),
+            'in memory': best_of(lambda: query.filter(tasks)),
+        }
+        report('filter_tasks', timings)
+
+    def test_cache(self):
+        filter_dict = {'project': 'project3', 'status': 'pending'}
+        cached = TaskWarriorShellout(config_filename=self.fname, cache_size=8)
+        cached.filter_tasks(filter_dict)
+        timings = {
+            'uncached': best_of(lambda: self.tw.filter_tasks(filter_dict)),
+            'cached': best_of(lambda: cached.filter_tasks(filter_dict)),
+        }
+        report('filter_tasks', timings)
+
+    def test_iter_tasks_memory(self):
+        peaks = {}
+        for label, load in [
+            ('filter', lambda: len(self.tw.filter_tasks({}))),
+            ('iter', lambda: sum(1 for task in self.tw.iter_tasks())),
+        ]:
+            tracemalloc.start()
+            load()
+            peaks[label] = tracemalloc.get_traced_memory()[1] / 2.0 ** 20
+            tracemalloc.stop()
+        print('')
+        for label, peak in sorted(peaks.items()):
+            print('peak memory %-6s %8.1fMiB' % (label, peak))
+
+
+class TestCodecBenchmark(TestCase):
+    tasks = [
+        {
+            'description': 'Buy milk and eggs',
+            'entry': '1325011643',
+            'project': 'home',
+            'status': 'pending',
+            'tags': ['errand', 'food'],
+            'uuid': 'c1c431ea-f0dc-4683-9a20-e64fcfa65fd1',
+        },
+        {
+            'description': 'Read http://taskwarrior.org/ "docs" [again]',
+            'annotation_1325011643': 'C:\\tasks\\notes.txt',
+            'entry': '1325011643',
+            'status': 'completed',
+            'uuid': 'd2d542fb-01ed-4794-ab31-f75fd0fb76e2',
+        },
+    ]
+
+    def test_encode_task(self):
+        timings = dict(
+            (label, best_of(
+                lambda: [encode(task) for task in self.tasks * 10000]
+            ))
+            for label, encode in [
+                ('original', reference_encode_task), ('current', encode_task),
+            ]
+        )
+        report('encode_task', timings)
+
+    def test_decode_task(self):
+        lines = [encode_task(task) for task in self.tasks] * 10000
+        timings = dict(
+            (label, best_of(lambda: [decode(line) for line in lines]))
+            for label, decode in [
+                ('original', reference_decode_task), ('current', decode_task),
+            ]
+        )
+        report('decode_task', timings)
+
+    def test_parse_date(self):
+        dates = [
+            time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(1325011643 + i * 61))
+            for i in range(1000000)
+        ]
+        timings = dict(
+            (label, best_of(lambda: [parse(date) for date in dates], 1))
+            for label, parse in [
+                ('dateutil', dateutil.parser.parse), ('current', parse_date),
+            ]
+        )
+        report('parse_date (1M)', timings)
+
+
+class TestTaskBenchmark(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # As exported by taskwarrior.
+        cls.tasks = [
+            {
+                'id': i + 1,
+                'description': 'task %d' % i,
+                'due': '20120101T120000Z',
+                'entry': '20111227T184723Z',
+                'modified': '20111227T184723Z',
+                'project': 'home',
+                'status': 'pending',
+                'tags': ['errand', 'food'],
+                'urgency': 4.2,
+                'uuid': str(uuid.uuid4()),
+            }
+            for i in range(100000)
+        ]
+
+    def test_marshal(self):
+        timings = {
+            'eager': best_of(lambda: [
+                list(Task(task).values()) for task in self.tasks
+            ], 1),
+            'lazy': best_of(lambda: [
+                Task(task)['description'] for task in self.tasks
+            ], 1),
+        }
+        report('Task (100k)', timings)
+
+    def test_schema(self):
+        fd, taskrc = tempfile.mkstemp(prefix='taskw-benchmark-taskrc')
+        with os.fdopen(fd, 'w') as f:
+            for i in range(20):
+                f.write('uda.field%d.type=numeric\n' % i)
+        try:
+            config = TaskRc(taskrc)
+        finally:
+            os.remove(taskrc)
+        schema = TaskSchema(config.get_udas())
+        timings = {
+            'udas per task': best_of(lambda: [
+                Task(task, udas=config.get_udas()) for task in self.tasks
+            ], 1),
+            'shared schema': best_of(lambda: [
+                Task(task, schema=schema) for task in self.tasks
+            ], 1),
+        }
+        report('Task, 20 UDAs (100k)', timings)
+
+    def test_frame(self):
+        pytest.importorskip('numpy')
+        frame = TaskFrame(self.tasks)
+
+        def count_in_python():
+            counts = {}
+            for task in self.tasks:
+                if task['status'] == 'pending':
+                    for tag in task['tags']:
+                        counts[tag] = counts.get(tag, 0) + 1
+            return counts
+
+        timings = {
+            'build': best_of(lambda: TaskFrame(self.tasks), 1),
+            'python': best_of(count_in_python),
+            'frame': best_of(lambda: frame.counts(
+                'tags', frame.equals('status', 'pending')
+            )),
+        }
+        report('tags by status (100k)', timings)
+
+    def test_memory(self):
+        schema = TaskSchema()
+
+        def read(task):
+            task = Task(task, schema=schema)
+            task.values()
+            return task
+
+        sizes = {}
+        for label, marshal in [
+            ('dict', dict),
+            ('Task', lambda task: Task(task, schema=schema)),
+            ('Task (read)', read),
+            ('TaskRecord', lambda task: TaskRecord(task, schema)),
+        ]:
+            tracemalloc.start()
+            tasks = [marshal(task) for task in self.tasks]
+            sizes[label] = tracemalloc.get_traced_memory()[0] / 2.0 ** 20
+            tracemalloc.stop()
+            del tasks
+        print('')
+        for label, size in sorted(sizes.items(), key=lambda s: s[1]):
+            print('memory (100k) %-12s %8.1fMiB' % (label, size))
+
+
+class TestQueryBenchmark(TestCase):
+    def test_filter(self):
+        tasks = [
+            {
+                'description': 'task %d' % i,
+                'due': '201201%02dT120000Z' % (i % 28 + 1),
+                'project': 'project%d' % (i % 20),
+                'status': ['pending', 'completed'][i % 2],
+                'tags': ['tag%d' % (i % 7)],
+            }
+            for i in range(BENCHMARK_TASKS)
+        ]
+        timings = {}
+        for label, filter_dict in [
+            ('project', {'project': 'project3'}),
+            ('tags', {'tags.has': 'tag3', 'status': 'pending'}),
+            ('due', {'due.before': '2012-01-10'}),
+            ('or', {'or': [('project', 'project1'), ('project', 'project2')]}),
+        ]:
+            query = Filter(filter_dict)
+            timings[label] = best_of(lambda: query.filter(tasks))
+        report('filter (%d tasks)' % len(tasks), timings)
+
+
+class TestIndexBenchmark(TestCase):
+    def test_queries(self):
+        tasks = [
+            {
+                'description': 'task %d' % i,
+                'due': '201201%02dT120000Z' % (i % 28 + 1),
+                'project': 'project%d' % (i % 200),
+                'status': ['pending', 'completed'][i % 2],
+                'tags': ['tag%d' % (i % 70)],
+                'uuid': str(uuid.uuid4()),
+            }
+            for i in range(BENCHMARK_TASKS)
+        ]
+        started = time.perf_counter()
+        index = TaskIndex(tasks)
+        print('\nTaskIndex built in %.3fs' % (time.perf_counter() - started))
+
+        timings = {}
+        for label, filter_dict in [
+            ('project', {'project.is': 'project3'}),
+            ('tags', {'tags.has': 'tag3', 'status': 'pending'}),
+            ('due', {'due.before': '20120102T000000Z'}),
+        ]:
+            query = Filter(filter_dict)
+            timings['scan ' + label] = best_of(lambda: query.filter(tasks))
+            timings['index ' + label] = best_of(
+                lambda: index.filter(filter_dict)
+            )
+        report('filter (%d tasks)' % len(tasks), timings)
+
+
+class TestDirectBenchmark(TestCase):
+    def setUp(self):
+        self.dname = tempfile.mkdtemp(prefix='taskw-benchmark')
+        fname = os.path.join(self.dname, 'taskrc')
+        with open(fname, 'w') as f:
+            f.write('data.location=%s\n' % self.dname)
+
+        with open(os.path.join(self.dname, 'pending.data'), 'w') as f:
+            f.writelines(
+                encode_task({
+                    'description': 'task %d' % i,
+                    'entry': '1325011643',
+                    'status': 'pending',
+                    'uuid': str(uuid.uuid4()),
+                })
+                for i in range(BENCHMARK_TASKS)
+            )
+        for name in ['completed.data', 'undo.data']:
+            open(os.path.join(self.dname, name), 'w').close()
+        self.tw = TaskWarriorDirect(config_filename=fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.dname)
+
+    def test_writes(self):
+        count = 100
+        timings = {}
+        timings['add'] = best_of(
+            lambda: [self.tw.task_add('new task') for i in range(count)], 1
+        )
+        timings['done'] = best_of(
+            lambda: [self.tw.task_done(id=i + 1) for i in range(count)], 1
+        )
+        timings['compact'] = best_of(self.tw.compact, 1)
+        report('direct (per %d)' % count, timings)
+
+    def test_transaction(self):
+        count = 1000
+        timings = {}
+        timings['separately'] = best_of(
+            lambda: [self.tw.task_add('new task') for i in range(count)], 1
+        )
+
+        def add_in_transaction():
+            with self.tw.transaction():
+                for i in range(count):
+                    self.tw.task_add('new task')
+        timings['transaction'] = best_of(add_in_transaction, 1)
+        report('task_add (per %d)' % count, timings)
+
+    def test_undo(self):
+        journal = UndoJournal(os.path.join(self.dname, 'undo.data'))
+        for task in self.tw.load_tasks()['pending']:
+            journal.record(None, task)
+        journal.flush()
+
+        timings = {}
+        timings['read all'] = best_of(
+            lambda: list(iter_entries(journal.filename))
+        )
+        timings['read last'] = best_of(
+            lambda: next(iter_entries(journal.filename, reverse=True))
+        )
+        timings['undo'] = best_of(self.tw.undo, 1)
+        report('undo.data', timings)
+
+    def test_watcher(self):
+        watcher = self.tw.watch(inotify=False)
+
+        def change():
+            self.tw.task_add('new task')
+            watcher.refresh()
+
+        timings = {
+            'reload': best_of(watcher.reload),
+            'refresh': best_of(change),
+        }
+        report('watcher', timings)
+
+    def test_changes_since(self):
+        cursor = self.tw.changes_since(0)[1]
+        for i in range(10):
+            self.tw.task_add('new task')
+        timings = {
+            'load_tasks': best_of(self.tw.load_tasks),
+            'changes': best_of(lambda: self.tw.changes_since(cursor)),
+        }
+        report('changes_since', timings)
+
+    def test_parallel_writers(self):
+        count = 100
+        timings = {}
+        for workers in [1, 2, 4, 8]:
+            processes = [
+                multiprocessing.Process(
+                    target=write_tasks,
+                    args=(self.tw.config_filename, worker, count),
+                )
+                for worker in range(workers)
+            ]
+            started = time.perf_counter()
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+                assert process.exitcode == 0
+            elapsed = time.perf_counter() - started
+            timings['%d writers' % workers] = elapsed / (workers * count)
+        report('direct seconds/task', timings)
+
+        tasks = self.tw.load_tasks()
+        added = sum(
+            1 for task in sum(tasks.values(), [])
+            if task['description'].startswith('worker ')
+        )
+        assert added == count * (1 + 2 + 4 + 8)
@@ -0,0 +1,289 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from taskw.datafile import StagedDataFile, TaskDataFile, locked, pread
+from taskw.utils import encode_task
+from taskw.warrior import TaskWarriorDirect
+
+
+def make_task(i, **kwargs):
+    task = {
+        'description': 'task %d' % i,
+        'status': 'pending',
+        'uuid': '00000000-0000-4000-8000-%012d' % i,
+    }
+    task.update(kwargs)
+    return task
+
+
+class TestTaskDataFile(TestCase):
+    def setUp(self):
+        self.dname = tempfile.mkdtemp(prefix='taskw-tests-datafile')
+        self.filename = os.path.join(self.dname, 'pending.data')
+        self.write([make_task(i) for i in range(1, 4)])
+
+    def tearDown(self):
+        shutil.rmtree(self.dname)
+
+    def write(self, tasks, mode='w'):
+        with open(self.filename, mode) as f:
+            f.writelines(encode_task(task) for task in tasks)
+
+    def test_get(self):
+        data_file = TaskDataFile(self.filename)
+        line, task = data_file.get(make_task(2)['uuid'])
+        assert line == 2
+        assert task == make_task(2)
+
+    def test_get_missing(self):
+        data_file = TaskDataFile(self.filename)
+        assert data_file.get(make_task(9)['uuid']) == (None, None)
+
+    def test_line(self):
+        data_file = TaskDataFile(self.filename)
+        assert data_file.line(3) == make_task(3)
+        assert data_file.line(4) is None
+        assert data_file.line(0) is None
+
+    def test_iter(self):
+        data_file = TaskDataFile(self.filename)
+        assert list(data_file) == [make_task(i) for i in range(1, 4)]
+        assert len(data_file) == 3
+
+    def test_empty(self):
+        self.write([])
+        data_file = TaskDataFile(self.filename)
+        assert list(data_file) == []
+        assert len(data_file) == 0
+        assert data_file.get(make_task(1)['uuid']) == (None, None)
+
+    def test_sees_appended_tasks(self):
+        data_file = TaskDataFile(self.filename)
+        data_file.get(make_task(1)['uuid'])
+        self.write([make_task(4)], mode='a')
+        assert data_file.get(make_task(4)['uuid']) == (4, make_task(4))
+
+    def test_sees_rewritten_file(self):
+        data_file = TaskDataFile(self.filename)
+        data_file.get(make_task(1)['uuid'])
+        self.write([make_task(3), make_task(1)])
+        assert data_file.get(make_task(1)['uuid']) == (2, make_task(1))
+        assert data_file.get(make_task(2)['uuid']) == (None, None)
+
+    def test_index_is_persisted(self):
+        TaskDataFile(self.filename).get(make_task(1)['uuid'])
+        assert os.path.exists(os.path.join(self.dname, '.pending.data.index'))
+
+        data_file = TaskDataFile(self.filename)
+        data_file._build_index = None  # Must not be needed.
+        assert data_file.get(make_task(3)['uuid']) == (3, make_task(3))
+
+    def test_stale_persisted_index_is_ignored(self):
+        TaskDataFile(self.filename).get(make_task(1)['uuid'])
+        self.write([make_task(2)])
+        assert TaskDataFile(self.filename).get(make_task(2)['uuid']) == (
+            1, make_task(2),
+        )
+
+    def test_unwritable_directory(self):
+        os.chmod(self.dname, 0o500)
+        try:
+            data_file = TaskDataFile(self.filename)
+            assert data_file.get(make_task(2)['uuid'])[0] == 2
+        finally:
+            os.chmod(self.dname, 0o700)
+
+    def read(self):
+        with open(self.filename) as f:
+            return f.read()
+
+    def test_append(self):
+        data_file = TaskDataFile(self.filename)
+        assert data_file.append([encode_task(make_task(4))]) == 4
+        assert data_file.get(make_task(4)['uuid']) == (4, make_task(4))
+        assert list(data_file) == [make_task(i) for i in range(1, 5)]
+
+    def test_append_after_unterminated_line(self):
+        with open(self.filename, 'a') as f:
+            f.write(encode_task(make_task(4)).rstrip('\n'))
+        data_file = TaskDataFile(self.filename)
+        assert data_file.append([encode_task(make_task(5))]) == 5
+        assert list(data_file) == [make_task(i) for i in range(1, 6)]
+
+    def test_replace_same_length(self):
+        data_file = TaskDataFile(self.filename)
+        changed = dict(make_task(2), status='deleted')
+        data_file.replace(2, encode_task(changed))
+        assert data_file.get(changed['uuid']) == (2, changed)
+        assert data_file.line(3) == make_task(3)
+
+    def test_replace_longer(self):
+        data_file = TaskDataFile(self.filename)
+        changed = dict(make_task(2), description='a much longer description')
+        data_file.replace(2, encode_task(changed))
+        assert data_file.get(changed['uuid']) == (2, changed)
+        assert data_file.get(make_task(3)['uuid']) == (3, make_task(3))
+        assert self.read() == ''.join(
+            encode_task(task) for task in [make_task(1), changed, make_task(3)]
+        )
+
+    def test_replace_keeps_index(self):
+        data_file = TaskDataFile(self.filename)
+        data_file.replace(1, encode_task(dict(make_task(1), status='x')))
+        data_file._build_index = None  # Must not be needed.
+        assert data_file.line(3) == make_task(3)
+
+    def test_remove(self):
+        data_file = TaskDataFile(self.filename)
+        data_file.remove(2)
+        assert data_file.get(make_task(2)['uuid']) == (None, None)
+        assert data_file.get(make_task(3)['uuid']) == (2, make_task(3))
+        assert list(data_file) == [make_task(1), make_task(3)]
+
+    def test_compact(self):
+        data_file = TaskDataFile(self.filename)
+        dropped = data_file.compact(lambda task: task['uuid'].endswith('2'))
+        assert dropped == [make_task(1), make_task(3)]
+        assert list(data_file) == [make_task(2)]
+        assert data_file.get(make_task(2)['uuid']) == (1, make_task(2))
+
+    def test_rewritten_in_place(self):
+        # As a taskwarrior process waiting for the lock would have it.
+        with open(self.filename, 'rb') as waiting:
+            inode = os.fstat(waiting.fileno()).st_ino
+            data_file = TaskDataFile(self.filename)
+            data_file.remove(1)
+            data_file.replace(1, encode_task(
+                dict(make_task(2), description='a much longer description')
+            ))
+            assert os.stat(self.filename).st_ino == inode
+            waiting.seek(0)
+            assert waiting.read().decode('utf-8') == self.read()
+        assert [task['description'] for task in data_file] == [
+            'a much longer description', 'task 3',
+        ]
+
+    def test_pread_without_os_pread(self):
+        original = os.pread
+        del os.pread
+        try:
+            with open(self.filename, 'rb') as f:
+                data = f.read()
+                assert pread(f.fileno(), 10, 5) == data[5:15]
+                assert pread(f.fileno(), 10, len(data) - 4) == data[-4:]
+        finally:
+            os.pread = original
+
+
+class TestStagedDataFile(TestCase):
+    def setUp(self):
+        self.dname = tempfile.mkdtemp(prefix='taskw-tests-datafile')
+        self.filename = os.path.join(self.dname, 'pending.data')
+        with open(self.filename, 'w') as f:
+            f.writelines(encode_task(make_task(i)) for i in range(1, 4))
+        self.data_file = TaskDataFile(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.dname)
+
+    def read(self):
+        with open(self.filename) as f:
+            return f.read()
+
+    def test_changes_are_held_back(self):
+        before = self.read()
+        with locked(self.filename):
+            staged = StagedDataFile(self.data_file)
+            assert staged.append([encode_task(make_task(4))]) == 4
+            staged.remove(1)
+            assert self.read() == before
+            assert staged.get(make_task(4)['uuid']) == (3, make_task(4))
+            assert list(staged) == [make_task(i) for i in range(2, 5)]
+        assert self.read() == before
+
+    def test_commit_appends(self):
+        with locked(self.filename):
+            staged = StagedDataFile(self.data_file)
+            staged.append([encode_task(make_task(i)) for i in range(4, 7)])
+            staged.commit()
+        assert list(self.data_file) == [make_task(i) for i in range(1, 7)]
+        assert self.data_file.get(make_task(6)['uuid'])[0] == 6
+
+    def test_commit_rewrites(self):
+        changed = dict(make_task(2), description='a much longer description')
+        with locked(self.filename):
+            staged = StagedDataFile(self.data_file)
+            staged.replace(2, encode_task(changed))
+            staged.append([encode_task(make_task(4))])
+            staged.commit()
+        assert list(self.data_file) == [
+            make_task(1), changed, make_task(3), make_task(4),
+        ]
+
+    def test_fsync_validated(self):
+        with self.assertRaises(ValueError):
+            TaskDataFile(self.filename, fsync='sometimes')
+
+
+def write_tasks(taskrc, worker, count):
+    """ Add ``count`` tasks, completing every other one and compacting """
+    tw = TaskWarriorDirect(config_filename=taskrc)
+    for i in range(count):
+        task = tw.task_add('worker %d task %d' % (worker, i))
+        if i % 2:
+            tw.task_done(uuid=task['uuid'])
+        if i % 10 == 9:
+            tw.compact()
+
+
+class TestConcurrentWriters(TestCase):
+    workers = 4
+    tasks_per_worker = 20
+
+    def setUp(self):
+        self.dname = tempfile.mkdtemp(prefix='taskw-tests-datafile')
+        self.taskrc = os.path.join(self.dname, 'taskrc')
+        with open(self.taskrc, 'w') as f:
+            f.write('data.location=%s\n' % self.dname)
+        for name in ['pending', 'completed', 'undo']:
+            open(os.path.join(self.dname, name + '.data'), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dname)
+
+    def test_consistency(self):
+        processes = [
+            multiprocessing.Process(
+                target=write_tasks,
+                args=(self.taskrc, worker, self.tasks_per_worker),
+            )
+            for worker in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+
+        tw = TaskWarriorDirect(config_filename=self.taskrc)
+        tasks = tw.load_tasks()
+        total = self.workers * self.tasks_per_worker
+        assert len(tasks['pending']) == total // 2
+        assert len(tasks['completed']) == total // 2
+
+        descriptions = set(
+            task['description'] for task in sum(tasks.values(), [])
+        )
+        assert descriptions == set(
+            'worker %d task %d' % (worker, i)
+            for worker in range(self.workers)
+            for i in range(self.tasks_per_worker)
+        )
+
+        with open(os.path.join(self.dname, 'undo.data')) as f:
+            undo = f.read()
+        assert undo.count('\nnew ') == total + total // 2
+        assert undo.count('\nold ') == total // 2
@@ -1,12 +1,14 @@
 import os
 import shutil
 import tempfile
+import time
 import datetime
 import dateutil.tz
 
 import pytest
 
 from taskw import TaskWarriorDirect, TaskWarriorShellout
+from taskw.undo import iter_entries
 
 
 TASK = {'description': "task 2 http://www.google.com/",
@@ -343,6 +345,230 @@ class TestDBDirect(_BaseTestDB):
     def should_skip(self):
         return False
 
+    def test_ids_survive_completion(self):
+        self.tw.task_add("foobar1")
+        self.tw.task_add("foobar2")
+        self.tw.task_done(id=1)
+        id, task = self.tw.get_task(id=2)
+        assert task['description'] == 'foobar2'
+
+    def test_compact(self):
+        self.tw.task_add("foobar1")
+        self.tw.task_add("foobar2")
+        self.tw.task_done(id=1)
+        assert self.tw.compact() == 1
+        assert self.tw.compact() == 0
+
+        id, task = self.tw.get_task(id=1)
+        assert task['description'] == 'foobar2'
+        tasks = self.tw.load_tasks()
+        assert len(tasks['pending']) == 1
+        assert len(tasks['completed']) == 1
+        assert tasks['completed'][0]['description'] == 'foobar1'
+
+    def read_data(self, name):
+        with open(os.path.join(self.dname, name + '.data')) as f:
+            return f.read()
+
+    def test_transaction(self):
+        with self.tw.transaction():
+            self.tw.task_add("foobar1")
+            task = self.tw.task_add("foobar2")
+            self.tw.task_done(uuid=task['uuid'])
+            # Nothing is written until the transaction ends...
+            assert self.read_data('pending') == ''
+            assert self.read_data('undo') == ''
+            # ...but the transaction sees its own changes.
+            id, task = self.tw.get_task(id=1)
+            assert task['description'] == 'foobar1'
+
+        tasks = self.tw.load_tasks()
+        assert len(tasks['pending']) == 1
+        assert len(tasks['completed']) == 1
+        assert self.read_data('undo').count('\nnew ') == 3
+
+    def test_transaction_rollback(self):
+        self.tw.task_add("foobar1")
+        with pytest.raises(RuntimeError):
+            with self.tw.transaction():
+                self.tw.task_add("foobar2")
+                self.tw.task_done(id=1)
+                raise RuntimeError()
+
+        tasks = self.tw.load_tasks()
+        assert [t['description'] for t in tasks['pending']] == ['foobar1']
+        assert tasks['completed'] == []
+        assert self.read_data('undo').count('\nnew ') == 1
+
+    def test_nested_transaction(self):
+        with self.tw.transaction():
+            self.tw.task_add("foobar1")
+            with self.tw.transaction():
+                self.tw.task_add("foobar2")
+            assert self.read_data('pending') == ''
+        assert len(self.tw.load_tasks()['pending']) == 2
+
+    def test_transaction_compact(self):
+        self.tw.task_add("foobar1")
+        self.tw.task_add("foobar2")
+        with self.tw.transaction():
+            self.tw.task_done(id=1)
+            assert self.tw.compact() == 1
+        tasks = self.tw.load_tasks()
+        assert [t['description'] for t in tasks['pending']] == ['foobar2']
+        assert [t['description'] for t in tasks['completed']] == ['foobar1']
+
+    def test_undo_entries(self):
+        task = self.tw.task_add("foobar")
+        self.tw.task_update(dict(task, priority='L'))
+        self.tw.task_done(uuid=task['uuid'])
+
+        entries = list(iter_entries(os.path.join(self.dname, 'undo.data')))
+        assert [e.old for e in entries[:1]] == [None]
+        assert entries[1].old == entries[0].new
+        assert entries[1].new['priority'] == 'L'
+        assert entries[2].old == entries[1].new
+        assert entries[2].new['status'] == 'completed'
+
+    def test_undo(self):
+        task = self.tw.task_add("foobar")
+        self.tw.task_update(dict(task, priority='L'))
+        self.tw.task_done(uuid=task['uuid'])
+
+        self.tw.undo()
+        id, task = self.tw.get_task(uuid=task['uuid'])
+        assert task['status'] == 'pending'
+        assert task['priority'] == 'L'
+
+        self.tw.undo()
+        assert 'priority' not in self.tw.get_task(uuid=task['uuid'])[1]
+
+        self.tw.undo()
+        assert self.tw.load_tasks()['pending'] == []
+        assert self.read_data('undo') == ''
+        assert self.tw.undo() is None
+
+    def test_undo_after_compact(self):
+        task = self.tw.task_add("foobar")
+        self.tw.task_done(uuid=task['uuid'])
+        self.tw.compact()
+        self.tw.undo()
+
+        tasks = self.tw.load_tasks()
+        assert tasks['completed'] == []
+        assert self.tw.get_task(id=1)[1]['uuid'] == task['uuid']
+
+    def test_undo_in_transaction(self):
+        self.tw.task_add("foobar1")
+        with self.tw.transaction():
+            self.tw.task_add("foobar2")
+            self.tw.undo()
+            self.tw.undo()
+        assert self.tw.load_tasks()['pending'] == []
+        assert self.read_data('undo') == ''
+
+    def test_changes_since(self):
+        task1 = self.tw.task_add("foobar1")
+        tasks, cursor = self.tw.changes_since(datetime.datetime(2012, 1, 1))
+        assert [t['uuid'] for t in tasks] == [task1['uuid']]
+
+        task2 = self.tw.task_add("foobar2")
+        self.tw.task_add("foobar3")
+        self.tw.task_delete(uuid=task2['uuid'])
+        self.tw.task_done(uuid=task1['uuid'])
+        tasks, cursor = self.tw.changes_since(cursor)
+        assert [(t['description'], t['status']) for t in tasks] == [
+            ('foobar3', 'pending'),
+            ('foobar2', 'deleted'),
+            ('foobar1', 'completed'),
+        ]
+        assert self.tw.changes_since(cursor)[0] == []
+
+    def test_changes_since_time(self):
+        self.tw.task_add("foobar1")
+        assert self.tw.changes_since(time.time() + 60)[0] == []
+        assert len(self.tw.changes_since(time.time() - 60)[0]) == 1
+
+    def test_changes_since_undo(self):
+        self.tw.task_add("foobar1")
+        self.tw.task_add("foobar2")
+        cursor = self.tw.changes_since(time.time() - 60)[1]
+        self.tw.undo()
+        # The cursor's offset is past the end of undo.data now, so changes
+        # are found by time instead.
+        tasks, cursor = self.tw.changes_since(cursor)
+        assert 'foobar2' not in [t['description'] for t in tasks]
+        self.tw.task_add("foobar3")
+        tasks = self.tw.changes_since(cursor)[0]
+        assert [t['description'] for t in tasks] == ['foobar3']
+
+    def test_filtering(self):
+        self.tw.task_add("foobar1")
+        self.tw.task_add("foo?bar", project='work')
+        self.tw.task_add("foobar3", tags=['some'])
+        self.tw.task_done(id=3)
+
+        tasks = self.tw.filter_tasks({'description.contains': 'oo?ba'})
+        assert [task['id'] for task in tasks] == [2]
+        tasks = self.tw.filter_tasks({
+            'or': [('project', 'work'), ('tags.has', 'some')],
+        })
+        assert [task['description'] for task in tasks] == [
+            'foo?bar', 'foobar3',
+        ]
+        assert 'id' not in tasks[1]
+        tasks = self.tw.filter_tasks({'status': 'pending'})
+        assert [task['id'] for task in tasks] == [1, 2]
+
+    def test_index_is_kept_up_to_date(self):
+        self.tw.task_add("foobar1")
+        index = self.tw.load_index()
+        task = self.tw.task_add("foobar2", tags=['some'])
+        self.tw.task_done(id=1)
+        self.tw.task_update(dict(task, project='work'))
+
+        assert len(index) == 2
+        assert [t['description'] for t in index.lookup('project', 'work')] == [
+            'foobar2',
+        ]
+        assert len(index.lookup('status', 'completed')) == 1
+
+        self.tw.undo()
+        assert index.lookup('project', 'work') == []
+
+    def test_index_ignores_rolled_back_changes(self):
+        index = self.tw.load_index()
+        with pytest.raises(RuntimeError):
+            with self.tw.transaction():
+                self.tw.task_add("foobar")
+                raise RuntimeError()
+        assert len(index) == 0
+
+        with self.tw.transaction():
+            self.tw.task_add("foobar")
+        assert len(index) == 1
+
+    def test_load_frame(self):
+        numpy = pytest.importorskip('numpy')
+        self.tw.task_add("foobar1", project='work', tags=['some'])
+        self.tw.task_add("foobar2")
+        self.tw.task_done(id=1)
+        frame = self.tw.load_frame()
+        assert len(frame) == 2
+        assert frame.counts('status') == {'completed': 1, 'pending': 1}
+        assert list(frame.has_tag('some')) == [False, True]
+        assert numpy.isnat(frame.dates['end']).tolist() == [True, False]
+
+    def test_filter_by(self):
+        self.tw.task_add("foobar1")
+        self.tw.task_add("foobar2")
+        tasks = self.tw.filter_by(lambda task: task['description'][-1] == '2')
+        assert [task['description'] for task in tasks] == ['foobar2']
+
+    def test_fsync_validated(self):
+        with pytest.raises(ValueError):
+            TaskWarriorDirect(config_filename=self.fname, fsync='sometimes')
+
 
 class TestDBShellout(_BaseTestDB):
     class_to_test = TaskWarriorShellout
@@ -511,6 +737,142 @@ class TestDBShellout(_BaseTestDB):
         assert len(task['annotations']) == 1
         assert task['annotations'][0]['description'] == original['description']
 
+    def test_batch(self):
+        existing = self.tw.task_add("foobar1")
+        with self.tw.batch() as batch:
+            added = batch.task_add(
+                "foobar2",
+                project="some_project",
+                annotations=['one', 'two'],
+            )
+            existing['priority'] = 'L'
+            batch.task_update(existing)
+            batch.task_annotate(existing, 'three')
+
+        assert len(batch.tasks) == 2
+        tasks = dict((task['uuid'], task) for task in batch.tasks)
+        assert tasks[added['uuid']]['project'] == 'some_project'
+        assert [
+            a['description'] for a in tasks[added['uuid']]['annotations']
+        ] == ['one', 'two']
+        assert tasks[existing['uuid']]['priority'] == 'L'
+        assert [
+            a['description'] for a in tasks[existing['uuid']]['annotations']
+        ] == ['three']
+        assert len(self.tw.load_tasks()['pending']) == 2
+
+    def test_batch_discarded_on_error(self):
+        with pytest.raises(RuntimeError):
+            with self.tw.batch() as batch:
+                batch.task_add("foobar")
+                raise RuntimeError()
+        assert len(self.tw.load_tasks()['pending']) == 0
+
+    def test_done_trusting_local_task(self):
+        task = self.tw.task_add("foobar")
+        done = self.tw.task_done(task=task, readback=False)
+        assert done['status'] == 'completed'
+        assert done['end'] is not None
+
+        _, exported = self.tw.get_task(uuid=task['uuid'])
+        assert exported['status'] == 'completed'
+
+    def test_done_without_lookup(self):
+        task = self.tw.task_add("foobar")
+        self.tw.task_done(uuid=task['uuid'], lookup=False)
+        tasks = self.tw.load_tasks()
+        assert len(tasks['completed']) == 1
+
+    def test_done_trusting_local_task_validates(self):
+        task = self.tw.task_add("foobar")
+        task = self.tw.task_done(task=task)
+        with pytest.raises(ValueError):
+            self.tw.task_done(task=task, readback=False)
+
+    def test_start_stop_trusting_local_task(self):
+        task = self.tw.task_add("foobar")
+        started = self.tw.task_start(task=task, readback=False)
+        assert 'start' in started
+        stopped = self.tw.task_stop(task=started, readback=False)
+        assert 'start' not in stopped
+        _, exported = self.tw.get_task(uuid=task['uuid'])
+        assert 'start' not in exported
+
+    def test_update_trusting_original(self):
+        task = self.tw.task_add("foobar", annotations=['one'])
+        changed = dict(task, priority='L', annotations=['two'])
+        id, updated = self.tw.task_update(
+            changed, original=task, readback=False
+        )
+        assert updated['priority'] == 'L'
+        assert [a['description'] for a in updated['annotations']] == ['two']
+
+        _, exported = self.tw.get_task(uuid=task['uuid'])
+        assert exported['priority'] == 'L'
+        assert [a['description'] for a in exported['annotations']] == ['two']
+
+    def test_task_import(self):
+        uuids = self.tw.task_import(
+            (
+                {
+                    'description': 'foobar%s' % i,
+                    'annotations': ['note %s' % i],
+                }
+                for i in range(5)
+            ),
+            chunk_size=2,
+        )
+        assert len(uuids) == 5
+        tasks = self.tw.load_tasks()['pending']
+        assert sorted(task['uuid'] for task in tasks) == sorted(uuids)
+        for task in tasks:
+            assert len(task['annotations']) == 1
+
+    def test_task_import_annotations(self):
+        uuids = self.tw.task_import([
+            {'description': 'foobar', 'annotations': ['one', 'two', 'three']},
+        ])
+        id, task = self.tw.get_task(uuid=uuids[0])
+        assert [a['description'] for a in task['annotations']] == [
+            'one', 'two', 'three',
+        ]
+
+    def test_task_import_marshal(self):
+        task = self.tw_marshal._stub_task("foobar", tags=['one'])
+        uuids = self.tw_marshal.task_import([task])
+        id, imported = self.tw_marshal.get_task(uuid=uuids[0])
+        assert imported['tags'] == ['one']
+
+    def test_load_tasks_strategies(self):
+        self.tw.task_add("foobar1")
+        task = self.tw.task_add("foobar2")
+        self.tw.task_add("foobar3", wait="tomorrow")
+        self.tw.task_done(uuid=task['uuid'])
+        results = [
+            self.tw.load_tasks(strategy=strategy)
+            for strategy in ['serial', 'threads', 'single']
+        ]
+        for tasks in results:
+            assert len(tasks['pending']) == 2
+            assert len(tasks['completed']) == 1
+
+    def test_filter_tasks_many(self):
+        self.tw.task_add("foobar1")
+        self.tw.task_add("foobar2")
+        results = self.tw.filter_tasks_many([
+            {'description.contains': 'foobar1'},
+            {'description.contains': 'foobar'},
+        ], strategy='threads')
+        assert [len(tasks) for tasks in results] == [1, 2]
+
+    def test_iter_tasks(self):
+        self.tw.task_add("foobar1")
+        self.tw.task_add("foobar2")
+        tasks = list(self.tw.iter_tasks({'description.contains': 'foobar2'}))
+        assert len(tasks) == 1
+        assert tasks[0]['description'] == 'foobar2'
+        assert len(list(self.tw.iter_tasks())) == 2
+
     def test_remove_uda_string_marshal(self):
         # Check that a string UDA is removed from a task when its
         # value is set to None
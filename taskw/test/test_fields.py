@@ -1,8 +1,9 @@
+import copy
 import datetime
 import uuid
 import sys
 
-from dateutil.tz import tzlocal
+from dateutil.tz import tzlocal, tzutc
 from pytz import UTC, timezone
 
 from taskw import fields
@@ -287,6 +288,17 @@ class TestDateField(TestCase):
 
         self.assertEqual(actual_value, expected_value)
 
+    def test_deserialize_taskwarrior_format(self):
+        actual_value = self.field.deserialize('20140302T091003Z')
+        expected_value = datetime.datetime(2014, 3, 2, 9, 10, 3, tzinfo=UTC)
+
+        self.assertEqual(actual_value, expected_value)
+        self.assertEqual(actual_value.tzinfo, tzutc())
+
+    def test_deserialize_taskwarrior_format_out_of_range(self):
+        with self.assertRaises(ValueError):
+            self.field.deserialize('20141302T091003Z')
+
     def test_serialize_none(self):
         actual_value = self.field.serialize(None)
         expected_value = None
@@ -343,6 +355,48 @@ class TestDateField(TestCase):
         self.assertEqual(actual_value, expected_value)
 
 
+class TestDirtyable(TestCase):
+    def test_unchanged_is_not_copied(self):
+        value = fields.base.DirtyableList(['one', 'two'])
+        self.assertEqual(value.get_changes(), {})
+        self.assertIsNone(value._original_value)
+
+    def test_list_changes(self):
+        value = fields.base.DirtyableList(['one', 'two'])
+        value.append('three')
+        value[0] = 'zero'
+        self.assertEqual(
+            value.get_changes(keep=True),
+            (['one', 'two'], ['zero', 'two', 'three']),
+        )
+        self.assertEqual(
+            value.get_changes(),
+            (['one', 'two'], ['zero', 'two', 'three']),
+        )
+        self.assertEqual(value.get_changes(), {})
+
+    def test_dict_changes(self):
+        value = fields.base.DirtyableDict({'one': 1})
+        value.update(two=2)
+        self.assertEqual(
+            value.get_changes(), ({'one': 1}, {'one': 1, 'two': 2})
+        )
+
+    def test_changed_back(self):
+        value = fields.base.DirtyableList(['one'])
+        value.append('two')
+        value.remove('two')
+        self.assertEqual(value.get_changes(), {})
+
+    def test_copies_keep_changes(self):
+        value = fields.base.DirtyableList(['one'])
+        value += ['two']
+        for copied in [copy.copy(value), copy.deepcopy(value)]:
+            self.assertEqual(copied.get_changes(), (['one'], ['one', 'two']))
+        unchanged = copy.deepcopy(fields.base.DirtyableList(['one']))
+        self.assertEqual(unchanged.get_changes(), {})
+
+
 class TestNumericField(TestCase):
     def setUp(self):
         self.field = fields.NumericField()
@@ -0,0 +1,104 @@
+import pytest
+
+from taskw.fields import NumericField, StringField
+from taskw.task import Task
+from taskw.test.test_index import make_task
+
+numpy = pytest.importorskip('numpy')
+
+from taskw.frame import TaskFrame  # noqa: E402
+
+
+class TestTaskFrame(object):
+    def setup(self):
+        self.tasks = {
+            'pending': [
+                make_task(i, priority='H' if i == 1 else '', size=str(i))
+                for i in range(1, 6)
+            ],
+            'completed': [
+                make_task(
+                    6, status='completed', due='', end='20120110T120000Z',
+                    tags=['tag0', 'tag2'], urgency=1.5,
+                )
+            ],
+        }
+        self.frame = TaskFrame(
+            self.tasks, udas={'size': NumericField(), 'note': StringField()}
+        )
+
+    def test_uuids(self):
+        assert len(self.frame) == 6
+        assert list(self.frame.uuids) == [
+            make_task(i)['uuid'] for i in range(1, 7)
+        ]
+
+    def test_dates(self):
+        due = self.frame.dates['due']
+        assert due.dtype == numpy.dtype('datetime64[s]')
+        assert due[0] == numpy.datetime64('2012-01-01T12:00:00')
+        assert numpy.isnat(due[5])
+        # As stored in the data files, in seconds since the epoch.
+        assert self.frame.dates['entry'][0] == numpy.datetime64(
+            '2011-12-27T18:47:23'
+        )
+        assert numpy.isnat(self.frame.dates['start']).all()
+        age = self.frame.dates['end'][5] - self.frame.dates['entry'][5]
+        assert age == numpy.timedelta64(1185157, 's')
+
+    def test_categories(self):
+        assert self.frame.categories['status'] == ['completed', 'pending']
+        assert list(self.frame.codes['status']) == [1, 1, 1, 1, 1, 0]
+        assert self.frame.categories['priority'] == ['H']
+        assert list(self.frame.codes['priority']) == [0, -1, -1, -1, -1, -1]
+        assert list(self.frame.equals('project', 'home')) == [
+            False, False, True, False, False, True,
+        ]
+        assert not self.frame.equals('project', 'nowhere').any()
+
+    def test_tags(self):
+        assert self.frame.tag_names == ['tag0', 'tag1', 'tag2']
+        assert self.frame.tags.shape == (6, 3)
+        assert list(self.frame.has_tag('tag1')) == [
+            True, False, True, False, True, False,
+        ]
+        assert not self.frame.has_tag('tag9').any()
+
+    def test_counts(self):
+        assert self.frame.counts('project') == {
+            'home': 2, 'home.garden': 2, 'work': 2,
+        }
+        assert self.frame.counts('tags') == {'tag0': 3, 'tag1': 3, 'tag2': 1}
+        pending = self.frame.equals('status', 'pending')
+        assert self.frame.counts('project', pending) == {
+            'home': 1, 'home.garden': 2, 'work': 2,
+        }
+        assert self.frame.counts('tags', pending) == {
+            'tag0': 2, 'tag1': 3, 'tag2': 0,
+        }
+
+    def test_numbers(self):
+        assert sorted(self.frame.numbers) == ['size', 'urgency']
+        size = self.frame.numbers['size']
+        assert list(size[:5]) == [1.0, 2.0, 3.0, 4.0, 5.0]
+        assert numpy.isnan(size[5])
+        assert numpy.nansum(self.frame.numbers['urgency']) == 1.5
+
+    def test_marshalled(self):
+        udas = {'size': NumericField()}
+        tasks = [
+            Task(dict(task, entry='20111227T184723Z'), udas=udas)
+            for task in self.tasks['pending']
+        ]
+        frame = TaskFrame(tasks, udas=udas)
+        assert (frame.dates['due'] == self.frame.dates['due'][:5]).all()
+        assert (frame.dates['entry'] == self.frame.dates['entry'][:5]).all()
+        assert list(frame.uuids) == list(self.frame.uuids[:5])
+        assert list(frame.numbers['size']) == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+    def test_empty(self):
+        frame = TaskFrame()
+        assert len(frame) == 0
+        assert frame.dates['due'].shape == (0, )
+        assert frame.tags.shape == (0, 0)
+        assert frame.counts('status') == {}
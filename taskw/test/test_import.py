@@ -0,0 +1,56 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+
+# Wall-clock seconds that ``import taskw`` may take in a fresh interpreter.
+IMPORT_TIME_BUDGET = 1.0
+
+
+class TestImport(TestCase):
+    def setUp(self):
+        # A stand-in 'task' binary that records every invocation.
+        self.bindir = tempfile.mkdtemp()
+        self.calls = os.path.join(self.bindir, 'calls')
+        executable = os.path.join(self.bindir, 'task')
+        with open(executable, 'w') as f:
+            f.write('#!/bin/sh\necho x >> %s\necho 2.5.1\n' % self.calls)
+        os.chmod(executable, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.bindir)
+
+    def _import_taskw(self, statement='import taskw'):
+        env = os.environ.copy()
+        env['PATH'] = os.pathsep.join([self.bindir, env.get('PATH', '')])
+        env.pop('TASKW_BACKEND', None)
+        output = subprocess.check_output(
+            [
+                sys.executable, '-c',
+                'import time; start = time.perf_counter(); %s; '
+                'print(time.perf_counter() - start)' % statement,
+            ],
+            env=env,
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+        )
+        return float(output)
+
+    def test_import_does_not_run_task(self):
+        self._import_taskw()
+        assert not os.path.exists(self.calls)
+
+    def test_import_default_does_not_run_task(self):
+        self._import_taskw('from taskw import TaskWarrior')
+        assert not os.path.exists(self.calls)
+
+    def test_import_time_budget(self):
+        # Take the best of a few runs to keep noisy machines from failing.
+        elapsed = min(self._import_taskw() for _ in range(3))
+        assert elapsed < IMPORT_TIME_BUDGET, (
+            "import taskw took %.3fs; budget is %.3fs" % (
+                elapsed, IMPORT_TIME_BUDGET,
+            )
+        )
@@ -0,0 +1,109 @@
+import datetime
+
+import pytz
+
+from taskw.index import TaskIndex
+from taskw.test import test_datafile
+
+
+def make_task(i, **kwargs):
+    # test_datafile's tasks, along with the attributes indexes look at.
+    fields = {
+        'due': '201201%02dT120000Z' % i,
+        'entry': '1325011643',
+        'project': ['home', 'home.garden', 'work'][i % 3],
+        'tags': ['tag%d' % (i % 2)],
+    }
+    fields.update(kwargs)
+    return test_datafile.make_task(i, **fields)
+
+
+def descriptions(tasks):
+    return [task['description'] for task in tasks]
+
+
+class TestTaskIndex(object):
+    def setup(self):
+        self.index = TaskIndex({
+            'pending': [make_task(i) for i in range(1, 6)],
+            'completed': [make_task(6, status='completed', due='')],
+        })
+
+    def test_get(self):
+        assert len(self.index) == 6
+        assert self.index.get(make_task(2)['uuid']) == make_task(2)
+        assert make_task(2)['uuid'] in self.index
+        assert self.index.get(make_task(9)['uuid']) is None
+
+    def test_lookup(self):
+        assert descriptions(self.index.lookup('tags', 'tag1')) == [
+            'task 1', 'task 3', 'task 5',
+        ]
+        assert descriptions(self.index.lookup('project', 'home')) == [
+            'task 3', 'task 6',
+        ]
+        assert descriptions(self.index.lookup('status', 'completed')) == [
+            'task 6',
+        ]
+
+    def test_range(self):
+        tasks = self.index.range('due', after='20120102T000000Z')
+        assert descriptions(tasks) == [
+            'task 2', 'task 3', 'task 4', 'task 5',
+        ]
+        assert descriptions(self.index.range(
+            'due',
+            after=datetime.datetime(2012, 1, 2, 12, tzinfo=pytz.utc),
+            before=datetime.datetime(2012, 1, 4, 12, tzinfo=pytz.utc),
+        )) == ['task 3']
+
+    def test_filter(self):
+        assert descriptions(self.index.filter({
+            'project': 'home',
+            'tags': 'tag1',
+            'due.after': '20120102T000000Z',
+        })) == ['task 3']
+        assert descriptions(self.index.filter({'status': 'completed'})) == [
+            'task 6',
+        ]
+        assert descriptions(self.index.filter({
+            'description.contains': '4',
+        })) == ['task 4']
+        assert descriptions(self.index.filter({
+            'uuid': make_task(5)['uuid'],
+        })) == ['task 5']
+        tasks = self.index.lookup('uuid', make_task(2)['uuid'])
+        assert descriptions(tasks) == ['task 2']
+
+    def test_add_replaces(self):
+        self.index.add(make_task(1, project='work', tags=['new'], due=''))
+        assert len(self.index) == 6
+        assert descriptions(self.index.lookup('tags', 'new')) == ['task 1']
+        assert descriptions(self.index.lookup('tags', 'tag1')) == [
+            'task 3', 'task 5',
+        ]
+        assert descriptions(self.index.range('due')) == [
+            'task 2', 'task 3', 'task 4', 'task 5',
+        ]
+        # Tasks keep their place.
+        assert descriptions(self.index.filter({'project': 'work'})) == [
+            'task 1', 'task 2', 'task 5',
+        ]
+
+    def test_changed_in_place(self):
+        task = self.index.get(make_task(1)['uuid'])
+        task['tags'] = ['changed']
+        self.index.add(task)
+        assert self.index.lookup('tags', 'tag1')[0]['description'] == 'task 3'
+        assert descriptions(self.index.lookup('tags', 'changed')) == [
+            'task 1',
+        ]
+
+    def test_discard(self):
+        self.index.discard(make_task(3)['uuid'])
+        self.index.discard(make_task(9)['uuid'])
+        assert len(self.index) == 5
+        assert descriptions(self.index.lookup('project', 'home')) == [
+            'task 6',
+        ]
+        assert 'task 3' not in descriptions(self.index.range('due'))
@@ -0,0 +1,166 @@
+import datetime
+import uuid
+
+import pytest
+import pytz
+
+from taskw.fields import DateField, NumericField
+from taskw.query import Filter, filter_tasks
+from taskw.task import Task
+
+
+TASKS = [
+    {
+        'id': 1,
+        'description': 'Buy milk',
+        'due': '20120101T120000Z',
+        'project': 'home.shopping',
+        'status': 'pending',
+        'tags': ['errand', 'food'],
+        'annotations': [
+            {'entry': '20120101T120000Z', 'description': 'semi-skimmed'},
+        ],
+        'uuid': 'c1c431ea-f0dc-4683-9a20-e64fcfa65fd1',
+    },
+    {
+        'id': 2,
+        'description': 'Write report',
+        'due': '20120201T120000Z',
+        'project': 'work',
+        'status': 'pending',
+        'uuid': 'd2d542fb-01ed-4794-ab31-f75fd0fb76e2',
+    },
+    {
+        'description': 'Read "the docs" [again]',
+        'end': '1325419200',
+        'project': 'work',
+        'status': 'completed',
+        'tags': ['reading'],
+        'uuid': 'e3e653fc-12fe-48a5-bc42-086e1fc87f93',
+    },
+]
+
+
+def descriptions(filter_dict, tasks=TASKS, udas=None):
+    return [
+        task['description']
+        for task in filter_tasks(tasks, filter_dict, udas=udas)
+    ]
+
+
+class TestFilter(object):
+    def test_empty(self):
+        assert len(descriptions({})) == 3
+
+    def test_status(self):
+        assert descriptions({'status': 'completed'}) == [
+            'Read "the docs" [again]',
+        ]
+
+    def test_project_matches_left(self):
+        assert descriptions({'project': 'home'}) == ['Buy milk']
+        assert descriptions({'project.is': 'home'}) == []
+        assert descriptions({'project.isnt': 'work'}) == ['Buy milk']
+
+    def test_contains(self):
+        assert descriptions({'description.contains': 'milk'}) == ['Buy milk']
+        assert descriptions({'description.has': '"the docs"'}) == [
+            'Read "the docs" [again]',
+        ]
+        assert descriptions({'description.hasnt': 'e'}) == ['Buy milk']
+
+    def test_word(self):
+        assert descriptions({'description.word': 'Read'}) == [
+            'Read "the docs" [again]',
+        ]
+        assert descriptions({'description.word': 'Rea'}) == []
+
+    def test_tags(self):
+        assert descriptions({'tags': 'food'}) == ['Buy milk']
+        assert descriptions({'tags.has': 'reading'}) == [
+            'Read "the docs" [again]',
+        ]
+        assert descriptions({'tags.hasnt': 'food'}) == [
+            'Write report', 'Read "the docs" [again]',
+        ]
+        assert descriptions({'tags.none': ''}) == ['Write report']
+
+    def test_annotations(self):
+        assert descriptions({'annotations.has': 'skimmed'}) == ['Buy milk']
+
+    def test_annotations_in_data_files(self):
+        task = {'description': 'foo', 'annotation_1325011643': 'bar baz'}
+        assert descriptions({'annotations.word': 'baz'}, [task]) == ['foo']
+
+    def test_dates(self):
+        assert descriptions({'due.before': '2012-01-15'}) == ['Buy milk']
+        assert descriptions({
+            'due.after': datetime.datetime(2012, 1, 15, tzinfo=pytz.utc),
+        }) == ['Write report']
+        assert descriptions({
+            'end.before': datetime.date(2012, 1, 2),
+        }) == ['Read "the docs" [again]']
+
+    def test_marshalled_tasks(self):
+        tasks = [Task(task) for task in TASKS[:2]]
+        assert descriptions({'due.before': '2012-01-15'}, tasks) == [
+            'Buy milk',
+        ]
+        assert descriptions({'tags': 'food'}, tasks) == ['Buy milk']
+        assert descriptions({
+            'uuid': uuid.UUID('d2d542fb-01ed-4794-ab31-f75fd0fb76e2'),
+        }, tasks) == ['Write report']
+
+    def test_missing_attributes(self):
+        assert descriptions({'due.any': ''}) == ['Buy milk', 'Write report']
+        assert descriptions({'due.none': ''}) == ['Read "the docs" [again]']
+        assert descriptions({'due.before': 'tomorrow'}) == [
+            'Buy milk', 'Write report',
+        ]
+
+    def test_id(self):
+        assert descriptions({'id': 2}) == ['Write report']
+
+    def test_udas(self):
+        udas = {'estimate': NumericField(), 'review': DateField()}
+        tasks = [
+            {'description': 'a', 'estimate': '5', 'review': '1325419200'},
+            {'description': 'b', 'estimate': '10'},
+        ]
+        assert descriptions({'estimate.above': 6}, tasks, udas) == ['b']
+        assert descriptions(
+            {'review.before': '20120102T000000Z'}, tasks, udas
+        ) == ['a']
+
+    def test_or(self):
+        assert descriptions({
+            'or': [
+                ('description.has', 'milk'),
+                ('description.has', 'report'),
+            ],
+        }) == ['Buy milk', 'Write report']
+
+    def test_and_or(self):
+        assert descriptions({
+            'and': [('project', 'work')],
+            'or': [('status', 'pending'), ('status', 'waiting')],
+        }) == ['Write report']
+
+    def test_unknown_operator(self):
+        with pytest.raises(ValueError):
+            Filter({'nand': [('status', 'pending')]})
+
+    def test_unknown_modifier(self):
+        with pytest.raises(ValueError):
+            Filter({'project.sideways': 'home'})
+
+    def test_unknown_named_date(self):
+        with pytest.raises(ValueError):
+            Filter({'due.before': 'eom'})
+
+    def test_compiled_filter_is_reusable(self):
+        query = Filter({'status': 'pending'})
+        assert query(TASKS[0])
+        assert not query(TASKS[2])
+        assert len(query.filter(TASKS)) == 2
+        assert len(query.filter(iter(TASKS))) == 2
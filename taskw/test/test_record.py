@@ -0,0 +1,65 @@
+import copy
+import datetime
+import pickle
+import uuid
+
+import pytest
+from dateutil.tz import tzutc
+
+from taskw.fields import NumericField
+from taskw.query import Filter
+from taskw.record import TaskRecord
+from taskw.task import Task, TaskSchema
+
+
+DATA = {
+    'description': 'Go to Camelot',
+    'entry': '20180618T030242Z',
+    'estimate': '5',
+    'tags': ['quest', 'knights'],
+    'uuid': 'daa3ff05-f716-482e-bc35-3e1601e50778',
+}
+
+
+class TestTaskRecord(object):
+    def setup(self):
+        self.schema = TaskSchema({'estimate': NumericField()})
+        self.record = TaskRecord(DATA, self.schema)
+
+    def test_fields(self):
+        assert self.record['description'] == 'Go to Camelot'
+        assert self.record.entry == datetime.datetime(
+            2018, 6, 18, 3, 2, 42, tzinfo=tzutc()
+        )
+        assert self.record['uuid'] == uuid.UUID(DATA['uuid'])
+        assert self.record['tags'] == ('quest', 'knights')
+        assert self.record['estimate'] == 5
+        assert self.record.get('due') is None
+        assert 'due' not in self.record
+        with pytest.raises(KeyError):
+            self.record['due']
+
+    def test_same_as_task(self):
+        task = Task(DATA, udas={'estimate': NumericField()})
+        assert sorted(self.record) == sorted(task)
+        assert len(self.record) == 5
+        assert self.record.serialized() == task.serialized()
+
+    def test_read_only(self):
+        with pytest.raises(AttributeError):
+            self.record.description = 'Go home'
+        with pytest.raises(TypeError):
+            self.record['description'] = 'Go home'
+
+    def test_compact(self):
+        assert not hasattr(self.record, '__dict__')
+        assert TaskRecord({'description': 'foo'})._extra is None
+        assert TaskRecord(DATA, self.schema)._schema is self.record._schema
+
+    def test_copies(self):
+        assert copy.copy(self.record) == self.record
+        assert pickle.loads(pickle.dumps(self.record)) == self.record
+
+    def test_filter(self):
+        query = Filter({'tags': 'quest', 'entry.before': '2019-01-01'})
+        assert query(self.record)
@@ -7,7 +7,8 @@ from unittest import TestCase
 import pytz
 from dateutil.tz import tzutc
 
-from taskw.task import Task
+from taskw.fields import NumericField
+from taskw.task import Task, TaskSchema
 
 
 class TestTaskDirtyability(TestCase):
@@ -202,3 +203,51 @@ class TestTaskMarshalling(TestCase):
         assert on_modify_task.get('status') == "pending"
         assert on_modify_task.get('start') == datetime.datetime(2018, 10, 12, 11, 6, 5, tzinfo=tzutc())
         assert on_modify_task.get('uuid') == uuid.UUID("daa3ff05-f716-482e-bc35-3e1601e50778")
+
+
+class TestTaskLaziness(TestCase):
+    def setUp(self):
+        self.data = {
+            'uuid': 'daa3ff05-f716-482e-bc35-3e1601e50778',
+            'description': 'Go to Camelot',
+            'entry': '20180618T030242Z',
+            'tags': ['quest'],
+        }
+        self.task = Task(self.data)
+
+    def test_deserialized_on_access(self):
+        assert self.task._serialized_fields == set(self.data)
+        assert self.task['entry'] == datetime.datetime(
+            2018, 6, 18, 3, 2, 42, tzinfo=tzutc()
+        )
+        assert 'entry' not in self.task._serialized_fields
+        assert self.task['entry'] is self.task['entry']
+
+    def test_whole_task(self):
+        expected = {
+            'uuid': uuid.UUID('daa3ff05-f716-482e-bc35-3e1601e50778'),
+            'description': 'Go to Camelot',
+            'entry': datetime.datetime(2018, 6, 18, 3, 2, 42, tzinfo=tzutc()),
+            'tags': ['quest'],
+        }
+        assert self.task == expected
+        assert Task(self.data) == Task(self.data)
+        assert dict(Task(self.data)) == expected
+        assert dict(Task(self.data).items()) == expected
+        assert Task(self.data).copy() == expected
+        assert Task(self.data).pop('entry') == expected['entry']
+
+    def test_unread_fields_are_unchanged(self):
+        self.task['description'] = 'Go to Camelot again'
+        assert list(self.task.get_changes().keys()) == ['description']
+        assert self.task.serialized() == dict(
+            self.data, description='Go to Camelot again'
+        )
+
+    def test_shared_schema(self):
+        schema = TaskSchema({'size': NumericField()})
+        first = Task(self.data, schema=schema)
+        second = Task.from_stub({'size': 3}, schema=schema)
+        assert first._fields is second._fields is schema.fields
+        assert second['size'] == 3
+        assert 'size' not in Task.FIELDS
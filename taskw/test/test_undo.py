@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import taskw.undo
+from taskw.test.test_datafile import make_task
+from taskw.undo import (
+    UndoEntry,
+    UndoJournal,
+    format_entry,
+    iter_entries,
+    read_entries,
+    starts_entry,
+)
+
+
+ENTRIES = [
+    UndoEntry(1325011643, None, make_task(1)),
+    UndoEntry(1325011644, make_task(1), make_task(1, status='completed')),
+    UndoEntry(1325011645, None, make_task(2)),
+]
+
+
+class TestUndoJournal(TestCase):
+    def setUp(self):
+        self.dname = tempfile.mkdtemp(prefix='taskw-tests-undo')
+        self.filename = os.path.join(self.dname, 'undo.data')
+        with open(self.filename, 'w') as f:
+            f.writelines(format_entry(entry) for entry in ENTRIES)
+        self.chunk_size = taskw.undo.READ_CHUNK_SIZE
+
+    def tearDown(self):
+        taskw.undo.READ_CHUNK_SIZE = self.chunk_size
+        shutil.rmtree(self.dname)
+
+    def read(self):
+        with open(self.filename) as f:
+            return f.read()
+
+    def test_format(self):
+        assert format_entry(ENTRIES[1]) == (
+            'time 1325011644\n'
+            'old [description:"task 1" status:"pending" '
+            'uuid:"00000000-0000-4000-8000-000000000001"]\n'
+            'new [description:"task 1" status:"completed" '
+            'uuid:"00000000-0000-4000-8000-000000000001"]\n'
+            '---\n'
+        )
+
+    def test_iter_entries(self):
+        assert list(iter_entries(self.filename)) == ENTRIES
+
+    def test_iter_entries_reversed(self):
+        assert list(iter_entries(self.filename, reverse=True)) == (
+            ENTRIES[::-1]
+        )
+
+    def test_iter_entries_small_chunks(self):
+        taskw.undo.READ_CHUNK_SIZE = 7
+        assert list(iter_entries(self.filename)) == ENTRIES
+        assert list(iter_entries(self.filename, reverse=True)) == (
+            ENTRIES[::-1]
+        )
+
+    def test_iter_entries_missing_file(self):
+        os.remove(self.filename)
+        assert list(iter_entries(self.filename)) == []
+
+    def test_read_entries(self):
+        entries, offset = read_entries(self.filename)
+        assert entries == ENTRIES
+        assert offset == os.path.getsize(self.filename)
+
+        entry = format_entry(UndoEntry(1325011646, None, make_task(3)))
+        with open(self.filename, 'a') as f:
+            f.write(entry[:-1])
+        assert read_entries(self.filename, offset) == ([], offset)
+        with open(self.filename, 'a') as f:
+            f.write('\n')
+        entries, offset = read_entries(self.filename, offset)
+        assert entries == [UndoEntry(1325011646, None, make_task(3))]
+        assert offset == os.path.getsize(self.filename)
+
+    def test_starts_entry(self):
+        offset = len(format_entry(ENTRIES[0]))
+        assert starts_entry(self.filename, 0)
+        assert starts_entry(self.filename, offset)
+        assert not starts_entry(self.filename, offset - 1)
+        assert not starts_entry(self.filename, offset * 10)
+
+    def test_record_is_buffered(self):
+        journal = UndoJournal(self.filename)
+        task = make_task(3)
+        journal.record(None, task, when=1325011646)
+        task['status'] = 'completed'
+        assert list(journal.entries()) == ENTRIES
+
+        journal.flush()
+        assert list(journal.entries()) == ENTRIES + [
+            UndoEntry(1325011646, None, make_task(3)),
+        ]
+
+    def test_discard(self):
+        journal = UndoJournal(self.filename)
+        journal.record(None, make_task(3))
+        journal.discard()
+        journal.flush()
+        assert list(journal.entries()) == ENTRIES
+
+    def test_pop(self):
+        journal = UndoJournal(self.filename)
+        assert journal.pop() == ENTRIES[2]
+        assert journal.pop() == ENTRIES[1]
+        # Nothing is dropped from the file until the journal is flushed.
+        assert list(journal.entries()) == ENTRIES
+
+        journal.flush()
+        assert self.read() == format_entry(ENTRIES[0])
+
+    def test_pop_unflushed(self):
+        journal = UndoJournal(self.filename)
+        journal.record(None, make_task(3), when=1325011646)
+        assert journal.pop() == UndoEntry(1325011646, None, make_task(3))
+        assert journal.pop() == ENTRIES[2]
+
+    def test_pop_empty(self):
+        open(self.filename, 'w').close()
+        assert UndoJournal(self.filename).pop() is None
@@ -1,5 +1,7 @@
 import datetime
 import random
+import re
+import uuid
 
 import dateutil.tz
 import pytz
@@ -9,8 +11,11 @@ from taskw.utils import (
     decode_task,
     encode_task,
     encode_task_experimental,
+    encode_task_json,
     DATE_FORMAT,
     clean_ctrl_chars,
+    decode_replacements,
+    encode_replacements,
 )
 
 TASK = {'description': "task 2 http://www.google.com/",
@@ -164,6 +169,61 @@ class TestUtils(object):
 
         assert actual_encoded_task == expected_encoded_task
 
+    def test_encode_task_json(self):
+        arbitrary_uuid = uuid.uuid4()
+        task = {
+            'description': 'foo\x00bar',
+            'due': datetime.datetime(2014, 3, 2, tzinfo=pytz.utc),
+            'depends': [arbitrary_uuid, arbitrary_uuid],
+            'tags': ['one', 'two'],
+            'annotations': [
+                'new',
+                {'description': 'old', 'entry': '20140101T000000Z'},
+            ],
+            'priority': None,
+            'urgency': 4.5,
+        }
+
+        actual_encoded = encode_task_json(task, entry='20140302T000000Z')
+        expected_encoded = {
+            'description': 'foobar',
+            'due': '20140302T000000Z',
+            'depends': '%s,%s' % (arbitrary_uuid, arbitrary_uuid),
+            'tags': ['one', 'two'],
+            'annotations': [
+                {'description': 'new', 'entry': '20140302T000000Z'},
+                {'description': 'old', 'entry': '20140101T000000Z'},
+            ],
+            'urgency': 4.5,
+        }
+
+        assert actual_encoded == expected_encoded
+
+    def test_encode_task_json_annotation_entries(self):
+        task = {
+            'description': 'foo',
+            'annotations': [
+                'one',
+                {'description': 'two', 'entry': '20140302T000001Z'},
+                'three',
+                'four',
+            ],
+        }
+        encoded = encode_task_json(task, entry='20140302T000000Z')
+        # Annotations sharing a date would overwrite each other.
+        assert [a['entry'] for a in encoded['annotations']] == [
+            '20140302T000000Z',
+            '20140302T000001Z',
+            '20140302T000002Z',
+            '20140302T000003Z',
+        ]
+        encoded = encode_task_json(
+            {'annotations': ['one', 'two']}, entry='1393718400'
+        )
+        assert [a['entry'] for a in encoded['annotations']] == [
+            '1393718400', '1393718401',
+        ]
+
     def test_convert_dict_to_override_args(self):
         overrides = {
             'one': {
@@ -196,3 +256,85 @@ class TestCleanExecArg(object):
         # input = bytes(range(0x20))
         input = b'\x00\x01\x02\x03\x04\x05\x06\x07\x08\t\n\x0b\x0c\r\x0e\x0f\x10\x11\x12\x13\x14\x15\x16\x17\x18\x19\x1a\x1b\x1c\x1d\x1e\x1f'  # For python 2 compatibility
         assert b"\t\n\v\f\r" == clean_ctrl_chars(input)
+
+
+def reference_encode_task(task):
+    """ ``encode_task`` as it was before it was made single-pass """
+    task = task.copy()
+    if 'tags' in task:
+        task['tags'] = ','.join(task['tags'])
+    for k in task:
+        for unsafe, safe in encode_replacements.items():
+            if isinstance(task[k], str):
+                task[k] = task[k].replace(unsafe, safe)
+
+        if isinstance(task[k], datetime.datetime):
+            task[k] = task[k].strftime("%Y%m%dT%M%H%SZ")
+
+    return "[%s]\n" % " ".join([
+        "%s:\"%s\"" % (k, v)
+        for k, v in sorted(task.items(), key=lambda item: item[0])
+    ])
+
+
+def reference_decode_task(line):
+    """ ``decode_task`` as it was before it was made single-pass """
+    task = {}
+    for key, value in re.findall(r'(\w+):"(.*?)(?<!\\)"', line):
+        value = value.replace('\\"', '"')
+        task[key] = value
+        for unsafe, safe in decode_replacements.items():
+            task[key] = task[key].replace(unsafe, safe)
+    if 'tags' in task:
+        task['tags'] = task['tags'].split(',')
+    return task
+
+
+# Characters that give the escaping code something to do.
+FUZZ_ALPHABET = ['a', 'b', ' ', '_', ':', '\\', '/', '"', '[', ']', '\n', '&',
+                 ';', ',', 'é', '&dquot;', '&open;', '&close;', '\\/', '\\"']
+
+
+class TestCodecParity(object):
+    """ The fast codec must agree with the original one on any input """
+    iterations = 3000
+
+    def random_text(self, rng, length=8):
+        return ''.join(
+            rng.choice(FUZZ_ALPHABET) for i in range(rng.randint(0, length))
+        )
+
+    def random_task(self, rng):
+        task = dict(
+            (rng.choice(['description', 'project', 'annotation_1', 'x']),
+             self.random_text(rng))
+            for i in range(rng.randint(1, 4))
+        )
+        if rng.random() < 0.3:
+            task['tags'] = [self.random_text(rng, 3) for i in range(2)]
+        if rng.random() < 0.2:
+            task['entry'] = datetime.datetime(2011, 1, 2, 3, 4, 5)
+        return task
+
+    def test_encode(self):
+        rng = random.Random(1)
+        for i in range(self.iterations):
+            task = self.random_task(rng)
+            assert encode_task(task) == reference_encode_task(task), task
+
+    def test_decode_round_trip(self):
+        rng = random.Random(2)
+        for i in range(self.iterations):
+            line = reference_encode_task(self.random_task(rng))
+            assert decode_task(line) == reference_decode_task(line), line
+
+    def test_decode_garbage(self):
+        rng = random.Random(3)
+        pieces = FUZZ_ALPHABET + ['key:"', '" ', '"]', '[', 'x:""']
+        for i in range(self.iterations):
+            line = ''.join(
+                rng.choice(pieces) for j in range(rng.randint(0, 20))
+            )
+            if rng.random() < 0.5:
+                line = '[' + line
+            assert decode_task(line) == reference_decode_task(line), line
@@ -1,9 +1,22 @@
+import json
 import tempfile
 import os
+import re
 import shutil
+from distutils.version import LooseVersion
 from unittest import TestCase
 
-from taskw.warrior import TaskWarrior
+import taskw.warrior
+from taskw.exceptions import TaskwarriorError
+from taskw.record import TaskRecord
+from taskw.warrior import (
+    ChangeCursor,
+    LoadStrategy,
+    TaskWarrior,
+    TaskWarriorDirect,
+    TaskWarriorShellout,
+    get_default_backend,
+)
 
 
 class TestTaskWarrior(TestCase):
@@ -49,3 +62,402 @@ class TestTaskWarrior(TestCase):
         assert tasks['pending'][0]['recur'] == 'weekly'
         assert tasks['pending'][0]['parent'] is not None
 
+
+class TestVersionCache(TestCase):
+    def setUp(self):
+        # A stand-in 'task' binary that records every invocation.
+        self.bindir = tempfile.mkdtemp()
+        self.calls = os.path.join(self.bindir, 'calls')
+        self.executable = os.path.join(self.bindir, 'task')
+        self._write_executable('2.5.1')
+        self.original_path = os.environ.get('PATH', '')
+        os.environ['PATH'] = os.pathsep.join([self.bindir, self.original_path])
+        TaskWarriorShellout.clear_version_cache()
+
+    def tearDown(self):
+        os.environ['PATH'] = self.original_path
+        TaskWarriorShellout.set_version(None)
+        TaskWarriorShellout.clear_version_cache()
+        shutil.rmtree(self.bindir)
+
+    def _write_executable(self, version):
+        with open(self.executable, 'w') as f:
+            f.write('#!/bin/sh\necho x >> %s\necho %s\n' % (
+                self.calls, version
+            ))
+        os.chmod(self.executable, 0o755)
+
+    def _count_calls(self):
+        if not os.path.exists(self.calls):
+            return 0
+        with open(self.calls) as f:
+            return len(f.readlines())
+
+    def test_probes_once(self):
+        assert TaskWarriorShellout.get_version() == LooseVersion('2.5.1')
+        assert TaskWarriorShellout.get_version() == LooseVersion('2.5.1')
+        assert TaskWarriorShellout.can_use()
+        assert self._count_calls() == 1
+
+    def test_probes_again_when_binary_changes(self):
+        TaskWarriorShellout.get_version()
+        os.remove(self.executable)
+        self._write_executable('2.5.3')
+        assert TaskWarriorShellout.get_version() == LooseVersion('2.5.3')
+        assert self._count_calls() == 2
+
+    def test_override(self):
+        TaskWarriorShellout.set_version('2.4.4')
+        assert TaskWarriorShellout.get_version() == LooseVersion('2.4.4')
+        assert self._count_calls() == 0
+
+        TaskWarriorShellout.set_version(None)
+        assert TaskWarriorShellout.get_version() == LooseVersion('2.5.1')
+
+    def test_clear(self):
+        TaskWarriorShellout.get_version()
+        TaskWarriorShellout.clear_version_cache()
+        TaskWarriorShellout.get_version()
+        assert self._count_calls() == 2
+
+
+class TestDefaultBackend(TestCase):
+    def setUp(self):
+        self.original_backend = os.environ.pop('TASKW_BACKEND', None)
+        self.original_probed = taskw.warrior._probed_backend
+
+    def tearDown(self):
+        os.environ.pop('TASKW_BACKEND', None)
+        if self.original_backend is not None:
+            os.environ['TASKW_BACKEND'] = self.original_backend
+        taskw.warrior._probed_backend = self.original_probed
+
+    def test_pinned_direct(self):
+        os.environ['TASKW_BACKEND'] = 'direct'
+        taskrc = os.path.join(os.path.dirname(__file__), 'data/empty.taskrc')
+        warrior = TaskWarrior(config_filename=taskrc)
+        assert type(warrior) is TaskWarriorDirect
+        assert warrior.config_filename == taskrc
+        assert isinstance(warrior, TaskWarrior)
+        assert TaskWarrior.load_config(taskrc) == warrior.config
+
+    def test_subclass_backend(self):
+        os.environ['TASKW_BACKEND'] = 'direct'
+        taskrc = os.path.join(os.path.dirname(__file__), 'data/empty.taskrc')
+
+        class Mine(TaskWarriorDirect):
+            def load_tasks(self, command='all'):
+                return {'pending': [], 'completed': []}
+
+        warrior = Mine(config_filename=taskrc)
+        assert type(warrior) is Mine
+        assert warrior.filter_by(lambda task: True) == []
+
+    def test_subclass_default(self):
+        class Mine(TaskWarrior):
+            pass
+
+        with self.assertRaises(TypeError):
+            Mine()
+
+    def test_instantiation_only(self):
+        os.environ['TASKW_BACKEND'] = 'carrier-pigeon'
+        # Nothing but instantiating TaskWarrior picks a backend.
+        assert taskw.TaskWarrior is TaskWarrior
+        with self.assertRaises(ValueError):
+            TaskWarrior()
+
+    def test_pinned_unknown(self):
+        os.environ['TASKW_BACKEND'] = 'carrier-pigeon'
+        with self.assertRaises(ValueError):
+            get_default_backend()
+
+    def test_probe_is_cached(self):
+        taskw.warrior._probed_backend = TaskWarriorDirect
+        assert get_default_backend() is TaskWarriorDirect
+
+
+class _ExportingShellout(TaskWarriorShellout):
+    """ Answers exports from a fixed list of tasks instead of running task """
+    tasks = [
+        {'id': 1, 'uuid': 'a', 'status': 'pending', 'description': 'one'},
+        {'id': 2, 'uuid': 'b', 'status': 'waiting', 'description': 'two'},
+        {'id': 0, 'uuid': 'c', 'status': 'completed', 'description': 'three'},
+        {'id': 0, 'uuid': 'd', 'status': 'deleted', 'description': 'four'},
+    ]
+
+    def _execute(self, *args, stdin=None):
+        self.calls.append(args)
+        statuses = re.findall('status:(\\w+)', ' '.join(args[:-1]))
+        words = re.findall('description.contains:(\\w+)', ' '.join(args))
+        return json.dumps([
+            task for task in self.tasks
+            if (not statuses or task['status'] in statuses)
+            and all(word in task['description'] for word in words)
+        ]), ''
+
+
+class TestLoadStrategy(TestCase):
+    def setUp(self):
+        TaskWarriorShellout.set_version('2.5.1')
+        taskrc = os.path.join(os.path.dirname(__file__), 'data/empty.taskrc')
+        self.tw = _ExportingShellout(config_filename=taskrc)
+        self.tw.calls = []
+
+    def tearDown(self):
+        TaskWarriorShellout.set_version(None)
+
+    def _uuids(self, tasks):
+        return dict(
+            (db, sorted(t['uuid'] for t in loaded))
+            for db, loaded in tasks.items()
+        )
+
+    def test_strategies_agree(self):
+        expected = {'pending': ['a', 'b'], 'completed': ['c']}
+        for strategy in [
+            LoadStrategy.SERIAL, LoadStrategy.THREADS, LoadStrategy.SINGLE,
+        ]:
+            tasks = self.tw.load_tasks(strategy=strategy)
+            assert self._uuids(tasks) == expected, strategy
+
+    def test_single_export(self):
+        tasks = self.tw.load_tasks('pending', strategy=LoadStrategy.SINGLE)
+        assert self._uuids(tasks) == {'pending': ['a', 'b']}
+        assert len(self.tw.calls) == 1
+
+    def test_default_strategy(self):
+        self.tw.load_strategy = LoadStrategy.THREADS
+        self.tw.load_tasks()
+        assert len(self.tw.calls) == 3
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            self.tw.load_tasks(strategy='sometimes')
+
+    def test_filter_tasks_many(self):
+        results = self.tw.filter_tasks_many([
+            {'description.contains': 'one'},
+            {'description.contains': 'o'},
+            {'description.contains': 'nothing'},
+        ], strategy=LoadStrategy.THREADS)
+        assert [[t['uuid'] for t in r] for r in results] == [
+            ['a'], ['a', 'b', 'd'], [],
+        ]
+
+
+class TestChangesSince(TestCase):
+    def setUp(self):
+        TaskWarriorShellout.set_version('2.5.1')
+        taskrc = os.path.join(os.path.dirname(__file__), 'data/empty.taskrc')
+        self.tw = _ExportingShellout(config_filename=taskrc)
+        self.tw.calls = []
+
+    def tearDown(self):
+        TaskWarriorShellout.set_version(None)
+
+    def test_changes_since(self):
+        tasks, cursor = self.tw.changes_since(1325011643)
+        assert len(tasks) == 4
+        assert self.tw.calls[-1] == (
+            '( modified.after:20111227T184722Z '
+            'or entry.after:20111227T184722Z )',
+            'export',
+        )
+        assert cursor.offset is None
+
+        # Picked up again a second early.
+        self.tw.changes_since(ChangeCursor(1325011700, None))
+        assert 'modified.after:20111227T184819Z' in self.tw.calls[-1][0]
+
+    def test_cursor_from_json(self):
+        cursor = self.tw.changes_since(1325011643)[1]
+        assert ChangeCursor.get(json.loads(json.dumps(cursor))) == cursor
+
+
+UUID_A = '6c3d5d3e-8f1e-4a8b-9d3e-1c2b3a4d5e6f'
+UUID_B = '7d4e6e4f-9a2f-4b9c-8e4f-2d3c4b5e6f7a'
+
+
+class TestIterTasks(TestCase):
+    def setUp(self):
+        # A stand-in 'task' binary printing an export the way taskwarrior
+        # does, failing halfway through or hanging after the first task.
+        self.bindir = tempfile.mkdtemp()
+        executable = os.path.join(self.bindir, 'task')
+        with open(executable, 'w') as f:
+            f.write('\n'.join([
+                '#!/bin/sh',
+                'echo $$ > %s/pid' % self.bindir,
+                'echo "["',
+                'echo \'{"id":1,"uuid":"%s","description":"one\\\\nline"},\''
+                % UUID_A,
+                'case "$*" in',
+                '  *hang*) exec sleep 30 ;;',
+                'esac',
+                'echo \'{"id":2,"uuid":"%s","description":"two"}\'' % UUID_B,
+                'echo "]"',
+                'case "$*" in',
+                '  *fail*) echo "oops" >&2; exit 2 ;;',
+                'esac',
+                '',
+            ]))
+        os.chmod(executable, 0o755)
+        self.original_path = os.environ.get('PATH', '')
+        os.environ['PATH'] = os.pathsep.join([self.bindir, self.original_path])
+        TaskWarriorShellout.set_version('2.5.1')
+        taskrc = os.path.join(os.path.dirname(__file__), 'data/empty.taskrc')
+        self.tw = TaskWarriorShellout(config_filename=taskrc)
+
+    def tearDown(self):
+        os.environ['PATH'] = self.original_path
+        TaskWarriorShellout.set_version(None)
+        shutil.rmtree(self.bindir)
+
+    def test_iter_tasks(self):
+        tasks = list(self.tw.iter_tasks())
+        assert [t['uuid'] for t in tasks] == [UUID_A, UUID_B]
+        assert tasks[0]['description'] == 'one\nline'
+
+    def test_iter_tasks_marshal(self):
+        self.tw._marshal = True
+        tasks = list(self.tw.iter_tasks({'project': 'foo'}))
+        assert [t['description'] for t in tasks] == ['one\nline', 'two']
+
+    def test_iter_tasks_compact(self):
+        self.tw._marshal = 'compact'
+        tasks = list(self.tw.iter_tasks())
+        assert [type(t) for t in tasks] == [TaskRecord] * 2
+        assert tasks[1].description == 'two'
+        assert tasks[0]._schema is tasks[1]._schema
+
+    def test_iter_tasks_schema(self):
+        taskrc = os.path.join(self.bindir, 'taskrc')
+        with open(taskrc, 'w') as f:
+            f.write('uda.size.type=numeric\n')
+        self.tw = TaskWarriorShellout(config_filename=taskrc, marshal=True)
+        first, second = self.tw.iter_tasks()
+        assert first._fields is second._fields
+        assert 'size' in first._fields
+
+        # Read again once the taskrc changes, and only then.
+        with open(taskrc, 'w') as f:
+            f.write('uda.weight.type=numeric\nuda.size.type=numeric\n')
+        third, fourth = self.tw.iter_tasks()
+        assert third._fields is fourth._fields
+        assert third._fields is not first._fields
+        assert 'weight' in third._fields
+        assert 'weight' in self.tw.config.get_udas()
+        assert list(self.tw.iter_tasks())[0]._fields is third._fields
+
+    def test_iter_tasks_error(self):
+        tasks = self.tw.iter_tasks({'project': 'fail'})
+        with self.assertRaises(TaskwarriorError) as e:
+            list(tasks)
+        assert e.exception.stderr == b'oops'
+
+    def test_iter_tasks_close_kills(self):
+        tasks = self.tw.iter_tasks({'project': 'hang'})
+        assert next(tasks)['uuid'] == UUID_A
+        tasks.close()
+        with open(os.path.join(self.bindir, 'pid')) as f:
+            pid = int(f.read())
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+class TestCache(TestCase):
+    def setUp(self):
+        # A stand-in 'task' binary logging its arguments and exporting a
+        # single task.
+        self.bindir = tempfile.mkdtemp()
+        executable = os.path.join(self.bindir, 'task')
+        with open(executable, 'w') as f:
+            f.write('\n'.join([
+                '#!/bin/sh',
+                'echo "$*" >> %s/calls' % self.bindir,
+                'echo \'[{"id":1,"uuid":"%s","description":"one"}]\''
+                % UUID_A,
+                '',
+            ]))
+        os.chmod(executable, 0o755)
+        self.original_path = os.environ.get('PATH', '')
+        os.environ['PATH'] = os.pathsep.join([self.bindir, self.original_path])
+        TaskWarriorShellout.set_version('2.5.1')
+        self.taskrc = os.path.join(self.bindir, 'taskrc')
+        with open(self.taskrc, 'w') as f:
+            f.write('data.location=%s\n' % self.bindir)
+        self.tw = TaskWarriorShellout(
+            config_filename=self.taskrc, cache_size=2,
+        )
+
+    def tearDown(self):
+        os.environ['PATH'] = self.original_path
+        TaskWarriorShellout.set_version(None)
+        shutil.rmtree(self.bindir)
+
+    def _count_calls(self):
+        with open(os.path.join(self.bindir, 'calls')) as f:
+            return len(f.readlines())
+
+    def test_hits(self):
+        assert self.tw.get_task(uuid=UUID_A)[1]['description'] == 'one'
+        assert self.tw.get_task(uuid=UUID_A)[1]['description'] == 'one'
+        assert self._count_calls() == 1
+        assert self.tw.cache.stats() == {
+            'hits': 1, 'misses': 1, 'invalidations': 0, 'size': 1,
+        }
+
+    def test_hits_are_copies(self):
+        self.tw.filter_tasks({'project': 'foo'})[0]['description'] = 'two'
+        tasks = self.tw.filter_tasks({'project': 'foo'})
+        assert tasks[0]['description'] == 'one'
+        assert self._count_calls() == 1
+
+    def test_writes_invalidate(self):
+        self.tw.get_task(uuid=UUID_A)
+        self.tw.sync()
+        self.tw.get_task(uuid=UUID_A)
+        assert self._count_calls() == 3
+        assert self.tw.cache.invalidations == 1
+
+    def test_data_changes_invalidate(self):
+        self.tw.get_task(uuid=UUID_A)
+        with open(os.path.join(self.bindir, 'pending.data'), 'w') as f:
+            f.write('[description:"elsewhere"]\n')
+        self.tw.get_task(uuid=UUID_A)
+        assert self._count_calls() == 2
+
+    def test_overridden_data_changes_invalidate(self):
+        taskrc = os.path.join(self.bindir, 'elsewhere.taskrc')
+        with open(taskrc, 'w') as f:
+            f.write('data.location=%s\n' % os.path.join(self.bindir, 'no'))
+        tw = TaskWarriorShellout(
+            config_filename=taskrc,
+            config_overrides={'data.location': self.bindir},
+            cache_size=2,
+        )
+        tw.get_task(uuid=UUID_A)
+        with open(os.path.join(self.bindir, 'pending.data'), 'w') as f:
+            f.write('[description:"elsewhere"]\n')
+        tw.get_task(uuid=UUID_A)
+        assert self._count_calls() == 2
+
+    def test_ttl(self):
+        self.tw.cache.ttl = 0
+        self.tw.get_task(uuid=UUID_A)
+        self.tw.get_task(uuid=UUID_A)
+        assert self._count_calls() == 2
+
+    def test_lru(self):
+        for project in ['a', 'b', 'a', 'c', 'a', 'b']:
+            self.tw.filter_tasks({'project': project})
+        assert self._count_calls() == 4
+        assert len(self.tw.cache) == 2
+
+    def test_disabled(self):
+        tw = TaskWarriorShellout(config_filename=self.taskrc)
+        assert tw.cache is None
+        tw.get_task(uuid=UUID_A)
+        tw.get_task(uuid=UUID_A)
+        assert self._count_calls() == 2
@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+from taskw.warrior import TaskWarriorDirect, TaskWarriorShellout
+
+
+class TestTaskWatcher(TestCase):
+    def setUp(self):
+        self.dname = tempfile.mkdtemp(prefix='taskw-tests-watcher')
+        self.fname = os.path.join(self.dname, 'taskrc')
+        with open(self.fname, 'w') as f:
+            f.write('data.location=%s\n' % self.dname)
+        for piece in ['completed', 'pending', 'undo']:
+            open(os.path.join(self.dname, '%s.data' % piece), 'w').close()
+
+        self.tw = TaskWarriorDirect(config_filename=self.fname)
+        self.first = self.tw.task_add('first')
+        self.watcher = self.tw.watch(interval=0.01, inotify=False)
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.dname)
+
+    def test_load(self):
+        assert len(self.watcher.tasks) == 1
+        task = self.watcher.tasks.get(self.first['uuid'])
+        assert task['description'] == 'first'
+        # As stored in the data files, so without an ID.
+        assert 'id' not in task
+        assert self.watcher.refresh() == set()
+
+    def test_incremental(self):
+        tasks = self.watcher.tasks
+        second = self.tw.task_add('second')
+        assert self.watcher.refresh() == set([second['uuid']])
+        self.tw.task_done(uuid=self.first['uuid'])
+        assert self.watcher.refresh() == set([self.first['uuid']])
+
+        # Applied to the same index, rather than loaded again.
+        assert self.watcher.tasks is tasks
+        assert len(tasks) == 2
+        assert tasks.get(self.first['uuid'])['status'] == 'completed'
+        assert [t['description'] for t in tasks.lookup(
+            'status', 'pending'
+        )] == ['second']
+
+    def test_undo_reloads(self):
+        second = self.tw.task_add('second')
+        self.watcher.refresh()
+        self.tw.undo()
+        assert self.watcher.refresh() == set([second['uuid']])
+        assert second['uuid'] not in self.watcher.tasks
+
+    def test_undo_then_more_changes(self):
+        undo = os.path.join(self.dname, 'undo.data')
+        second = self.tw.task_add('second')
+        self.watcher.refresh()
+        size = os.path.getsize(undo)
+        self.tw.undo()
+        # As long as the undone entry, so the offset still lands where an
+        # entry starts, and the next entry is read as if nothing happened.
+        third = self.tw.task_add('thirds')
+        assert os.path.getsize(undo) == size
+        fourth = self.tw.task_add('fourth')
+        assert self.watcher.refresh() == set([
+            second['uuid'], third['uuid'], fourth['uuid'],
+        ])
+        assert sorted(t['description'] for t in self.watcher.tasks) == [
+            'first', 'fourth', 'thirds',
+        ]
+
+        # And where the offset lands mid-entry.
+        self.tw.undo()
+        self.tw.undo()
+        fifth = self.tw.task_add('fifth')
+        sixth = self.tw.task_add('sixth, and then some more')
+        assert self.watcher.refresh() == set([
+            third['uuid'], fourth['uuid'], fifth['uuid'], sixth['uuid'],
+        ])
+        assert sorted(t['description'] for t in self.watcher.tasks) == [
+            'fifth', 'first', 'sixth, and then some more',
+        ]
+
+    def test_compact_reloads(self):
+        self.tw.task_done(uuid=self.first['uuid'])
+        self.watcher.refresh()
+        tasks = self.watcher.tasks
+        self.tw.compact()
+        assert self.watcher.refresh() == set()
+        assert self.watcher.tasks is not tasks
+        assert self.watcher.tasks.get(self.first['uuid'])['status'] == (
+            'completed'
+        )
+
+    def test_partial_entry(self):
+        with open(os.path.join(self.dname, 'undo.data'), 'a') as f:
+            f.write('time 1325011643\nnew [description:"half"')
+        assert self.watcher.refresh() == set()
+        assert len(self.watcher.tasks) == 1
+
+    def test_overridden_location(self):
+        taskrc = os.path.join(self.dname, 'elsewhere.taskrc')
+        with open(taskrc, 'w') as f:
+            f.write('data.location=%s\n' % os.path.join(self.dname, 'no'))
+        TaskWarriorShellout.set_version('2.5.1')
+        try:
+            tw = TaskWarriorShellout(
+                config_filename=taskrc,
+                config_overrides={'data.location': self.dname},
+            )
+        finally:
+            TaskWarriorShellout.set_version(None)
+        with tw.watch(inotify=False) as watcher:
+            assert watcher.location == self.dname
+            assert len(watcher.tasks) == 1
+            assert watcher.tasks.get(self.first['uuid']) is not None
+
+    def test_wait_timeout(self):
+        assert self.watcher.wait(timeout=0.05) == set()
+
+    def _wait_for_add(self, watcher):
+        added = []
+        writer = threading.Timer(
+            0.1, lambda: added.append(self.tw.task_add('second'))
+        )
+        writer.start()
+        try:
+            changed = watcher.wait(timeout=5)
+        finally:
+            writer.join()
+        assert changed == set([added[0]['uuid']])
+
+    def test_wait_polling(self):
+        assert not self.watcher.using_inotify
+        self._wait_for_add(self.watcher)
+
+    def test_wait_inotify(self):
+        with self.tw.watch() as watcher:
+            if not watcher.using_inotify:
+                self.skipTest("inotify is not available")
+            self._wait_for_add(watcher)
@@ -0,0 +1,309 @@
+""" Reading and writing taskwarrior's undo.data journal.
+
+Every change to a task is recorded as an entry like::
+
+    time 1325011643
+    old [description:"foo" status:"pending" ...]
+    new [description:"foo" status:"completed" ...]
+    ---
+
+``old`` is left out when the task was added.  ``task undo`` reverts the
+most recent entry and drops it from the file.
+
+Entries can be read oldest first (to replay changes) or newest first (to
+roll them back); either way the file is streamed a chunk at a time rather
+than read whole.  ``read_entries`` picks up where an earlier read left off.
+
+"""
+import collections
+import os
+import time
+
+import taskw.datafile
+import taskw.utils
+
+
+# How much of undo.data is read at once.
+READ_CHUNK_SIZE = 1 << 16
+
+ENTRY_SEPARATOR = b'---'
+
+UndoEntry = collections.namedtuple('UndoEntry', ['time', 'old', 'new'])
+
+
+def format_entry(entry):
+    """ Returns the undo.data text for an ``UndoEntry`` """
+    text = "time %d\n" % entry.time
+    if entry.old is not None:
+        text += "old " + taskw.utils.encode_task(entry.old)
+    return text + "new " + taskw.utils.encode_task(entry.new) + "---\n"
+
+
+def iter_entries(filename, reverse=False):
+    """ Yields each ``UndoEntry`` in ``filename``, oldest first
+
+    Pass ``reverse=True`` to start with the most recent one instead.
+    Entries appended once iteration has started are not seen.
+
+    """
+    with _UndoFile(filename) as (fd, size):
+        lines = _iter_lines(fd, size, reverse)
+        for offset, entry in _iter_entries(lines, reverse):
+            yield entry
+
+
+def read_entries(filename, offset=0):
+    """ Returns the entries written to ``filename`` from byte ``offset`` on,
+    and the offset just past the last of them.
+
+    An entry still being written is left for next time.
+
+    """
+    entries = []
+    end = offset
+    with _UndoFile(filename) as (fd, size):
+        lines = []
+        for position, line in _iter_lines(fd, size, False, start=offset):
+            lines.append((position, line))
+            # The newline ending an entry is written last.
+            if line.strip() == ENTRY_SEPARATOR and position + len(line) < size:
+                entries.extend(
+                    entry for start, entry in _iter_entries(lines, False)
+                )
+                lines = []
+                end = position + len(line) + 1
+    return entries, end
+
+
+def get_end(filename):
+    """ Returns the offset just past the last entry in ``filename``
+
+    That is, its size once any entry being written to it is complete.
+
+    """
+    with _UndoFile(filename) as (fd, size):
+        return size
+
+
+def starts_entry(filename, offset):
+    """ Returns True if an entry starts at ``offset`` in ``filename``, or
+    the file ends there.
+
+    An offset from an earlier ``read_entries`` no longer does once the
+    file has been rewritten, or cut short by ``task undo``.
+
+    """
+    if offset == 0:
+        return True
+    with _UndoFile(filename) as (fd, size):
+        if offset > size:
+            return False
+        separator = ENTRY_SEPARATOR + b'\n'
+        position = offset - len(separator)
+        return (
+            position >= 0 and
+            taskw.datafile.pread(fd, len(separator), position) == separator
+        )
+
+
+def get_tail(filename, offset, length=4096):
+    """ Returns up to ``length`` bytes of ``filename`` just before ``offset``
+
+    Comparing them with what was there before tells whether the file read
+    up to ``offset`` is still the same one, even where an entry happens to
+    start at ``offset`` after ``task undo`` (see ``starts_entry``).
+
+    """
+    with _UndoFile(filename) as (fd, size):
+        if offset > size:
+            return b''
+        start = max(offset - length, 0)
+        return taskw.datafile.pread(fd, offset - start, start)
+
+
+class UndoJournal(object):
+    """ Buffers changes to tasks, and writes them to undo.data together
+
+    ``record`` a change as it is made, then ``flush`` the journal once the
+    operation (or transaction) making it is complete.
+
+    """
+
+    def __init__(self, filename, fsync=taskw.datafile.FSYNC_REWRITES):
+        self.filename = filename
+        self.fsync = taskw.datafile.validate_fsync(fsync)
+        self._pending = []
+        # Where undo.data is cut short at the next flush, having had
+        # entries popped off its end.
+        self._truncate = None
+
+    def record(self, old, new, when=None):
+        """ Remember that a task changed from ``old`` (None if it was just
+        added) to ``new``.
+
+        """
+        if when is None:
+            when = int(time.time())
+        # Encoded right away, as the tasks may well change again.
+        self._pending.append(format_entry(UndoEntry(when, old, new)))
+
+    def pop(self):
+        """ Forget the most recent entry, and return it
+
+        Entries not flushed yet go first.  Returns None if there are none
+        left.  undo.data should be locked, or taskwarrior could append an
+        entry meanwhile which the next flush would drop.
+
+        """
+        if self._pending:
+            lines = self._pending.pop().encode('utf-8').split(b'\n')
+            for offset, entry in _iter_entries(enumerate(lines), False):
+                return entry
+
+        with _UndoFile(self.filename) as (fd, size):
+            if self._truncate is not None:
+                size = min(size, self._truncate)
+            lines = _iter_lines(fd, size, reverse=True)
+            for offset, entry in _iter_entries(lines, reverse=True):
+                self._truncate = offset
+                return entry
+        return None
+
+    def flush(self):
+        """ Write every recorded entry, with a single write """
+        if not self._pending and self._truncate is None:
+            return
+
+        text = ''.join(self._pending)
+        with taskw.datafile.locked(self.filename) as f:
+            if self._truncate is not None:
+                f.truncate(self._truncate)
+            f.seek(0, os.SEEK_END)
+            f.write(text.encode('utf-8'))
+            f.flush()
+            if self.fsync == taskw.datafile.FSYNC_ALWAYS:
+                os.fsync(f.fileno())
+        self.discard()
+
+    def discard(self):
+        """ Forget every entry which hasn't been written yet """
+        self._pending = []
+        self._truncate = None
+
+    def entries(self, reverse=False):
+        """ Yields the entries written so far; see ``iter_entries`` """
+        return iter_entries(self.filename, reverse=reverse)
+
+
+class _UndoFile(object):
+    """ A descriptor of undo.data and its size, locked against writers
+
+    If this thread is writing the file, its locked descriptor is used:
+    closing any other one would release the lock.
+
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = taskw.datafile.get_thread_lock(filename)
+
+    def __enter__(self):
+        self.file = None
+        with self.lock:
+            held = taskw.datafile._held.get(os.path.realpath(self.filename))
+            if held is not None:
+                fd = held.fileno()
+            else:
+                try:
+                    self.file = open(self.filename, 'rb')
+                except FileNotFoundError:
+                    return -1, 0
+                taskw.datafile._lock_shared(self.file)
+                fd = self.file.fileno()
+            return fd, os.fstat(fd).st_size
+
+    def __exit__(self, type, value, traceback):
+        if self.file is not None:
+            # Closing releases this process' locks on the file, so wait
+            # until no other thread is holding one.
+            with self.lock:
+                self.file.close()
+
+
+def _iter_lines(fd, size, reverse, start=0):
+    """ Yields the offset and contents of each line in the first ``size``
+    bytes of ``fd``, going forwards from ``start`` unless ``reverse``.
+
+    """
+    if not reverse:
+        position = start
+        offset = start
+        remainder = b''
+        while position < size:
+            length = min(READ_CHUNK_SIZE, size - position)
+            chunk = taskw.datafile.pread(fd, length, position)
+            if not chunk:
+                break
+            position += len(chunk)
+            lines = (remainder + chunk).split(b'\n')
+            remainder = lines.pop()
+            for line in lines:
+                yield offset, line
+                offset += len(line) + 1
+        if remainder:
+            yield offset, remainder
+        return
+
+    position = size
+    # Where the line being yielded ends.
+    cursor = size
+    remainder = b''
+    while position > 0:
+        length = min(READ_CHUNK_SIZE, position)
+        position -= length
+        chunk = taskw.datafile.pread(fd, length, position)
+        lines = (chunk + remainder).split(b'\n')
+        # The first line may carry on into the previous chunk.
+        remainder = lines.pop(0)
+        for line in reversed(lines):
+            cursor -= len(line)
+            yield cursor, line
+            cursor -= 1
+    if remainder:
+        yield 0, remainder
+
+
+def _iter_entries(lines, reverse):
+    """ Yields the offset and ``UndoEntry`` of each entry in ``lines``,
+    as yielded by ``_iter_lines``.
+
+    """
+    fields = {}
+    start = None
+    for offset, line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line == ENTRY_SEPARATOR:
+            if not reverse and 'new' in fields:
+                yield start, _make_entry(fields)
+            fields = {}
+            continue
+
+        key, _, value = line.partition(b' ')
+        key = key.decode('utf-8')
+        fields[key] = value.decode('utf-8')
+        if key == 'time':
+            start = offset
+            if reverse and 'new' in fields:
+                yield start, _make_entry(fields)
+                fields = {}
+
+
+def _make_entry(fields):
+    old = fields.get('old')
+    return UndoEntry(
+        int(fields.get('time', 0)),
+        taskw.utils.decode_task(old) if old is not None else None,
+        taskw.utils.decode_task(fields['new']),
+    )
@@ -2,6 +2,7 @@
 
 import datetime
 import re
+import uuid
 from collections import OrderedDict
 from operator import itemgetter
 
@@ -36,6 +37,18 @@ decode_replacements = OrderedDict([
     if k not in ('\n')  # We skip these.
 ])
 
+# Matches anything ``encode_task`` has to escape.
+ENCODE_CHARACTERS = re.compile(
+    '|'.join(re.escape(unsafe) for unsafe in encode_replacements)
+)
+
+# Matches anything ``decode_task`` has to unescape:  a run of backslashes
+# (along with a quote or slash following it), or an entity.
+DECODE_ESCAPES = re.compile(r'(\\+)(/|"?)|&dquot;|&open;|&close;')
+
+# Matches one key:"value" pair of a record.
+TASK_FIELD = re.compile(r'(\w+):"(.*?)(?<!\\)"')
+
 logical_replacements = OrderedDict([
     ('?', '\\?'),
     ('+', '\\+'),
@@ -48,18 +61,28 @@ logical_replacements = OrderedDict([
 ])
 
 
-def encode_task_value(key, value, query=False):
-    if value is None:
-        value = ''
-    elif isinstance(value, datetime.datetime):
+def format_now():
+    """ The current time in taskwarrior's (UTC) date format """
+    return datetime.datetime.utcnow().strftime(DATE_FORMAT)
+
+
+def encode_date_value(value):
+    """ Render a date or datetime in taskwarrior's (UTC) date format """
+    if isinstance(value, datetime.datetime):
         if not value.tzinfo:
             #  Dates not having timezone information should be
             #  assumed to be in local time
             value = value.replace(tzinfo=dateutil.tz.tzlocal())
         #  All times should be converted to UTC before serializing
-        value = value.astimezone(pytz.utc).strftime(DATE_FORMAT)
+        return value.astimezone(pytz.utc).strftime(DATE_FORMAT)
+    return value.strftime(DATE_FORMAT)
+
+
+def encode_task_value(key, value, query=False):
+    if value is None:
+        value = ''
     elif isinstance(value, datetime.date):
-        value = value.strftime(DATE_FORMAT)
+        value = encode_date_value(value)
     elif isinstance(value, str):
         if query:
             # In some contexts, parentheses are interpreted for use in
@@ -132,25 +155,193 @@ def encode_task_experimental(task):
     ]
 
 
+def encode_json_value(value):
+    """ Convert a single task value into something `task import` accepts """
+    if isinstance(value, datetime.date):
+        return encode_date_value(value)
+    elif isinstance(value, uuid.UUID):
+        return str(value)
+    elif isinstance(value, str):
+        return CTRLCHAR_TEXT.sub('', value)
+    elif isinstance(value, (int, float)):
+        return value
+    return str(value)
+
+
+def _get_annotation_entry(annotation):
+    """ The date an annotation carries, if any """
+    if isinstance(annotation, dict):
+        return annotation.get('entry')
+    # taskw.fields.annotationarray.Annotation remembers its entry date
+    return getattr(annotation, '_entry', None)
+
+
+def _add_seconds(entry, seconds):
+    """ ``entry``, an encoded date, moved on by ``seconds`` """
+    if not seconds:
+        return entry
+    if entry.isdigit():
+        # As stored in the .data files.
+        return str(int(entry) + seconds)
+    try:
+        value = datetime.datetime.strptime(entry, DATE_FORMAT)
+    except ValueError:
+        return entry
+    return (value + datetime.timedelta(seconds=seconds)).strftime(DATE_FORMAT)
+
+
+def encode_annotation_json(annotation, entry):
+    """ Convert an annotation into the object `task import` expects
+
+    ``entry`` is used as the annotation's date if it doesn't carry one.
+    """
+    if isinstance(annotation, dict):
+        description = annotation['description']
+    else:
+        description = annotation
+    entry = _get_annotation_entry(annotation) or entry
+    return {
+        'entry': encode_json_value(entry),
+        'description': encode_json_value(str(description)),
+    }
+
+
+def encode_annotations_json(annotations, entry):
+    """ Convert a task's annotations into the objects `task import` expects
+
+    Taskwarrior keys annotations on their date, to the second, so those
+    without a date of their own are given ``entry`` or the first second
+    after it that no other annotation of the task has.
+    """
+    taken = set(
+        encode_json_value(own) for own in (
+            _get_annotation_entry(annotation) for annotation in annotations
+        ) if own
+    )
+    entry = encode_json_value(entry)
+    seconds = 0
+    encoded = []
+    for annotation in annotations:
+        fallback = None
+        if not _get_annotation_entry(annotation):
+            fallback = _add_seconds(entry, seconds)
+            while fallback in taken:
+                seconds += 1
+                moved = _add_seconds(entry, seconds)
+                if moved == fallback:
+                    # Not a date we know how to move on.
+                    break
+                fallback = moved
+            seconds += 1
+            taken.add(fallback)
+        encoded.append(encode_annotation_json(annotation, fallback))
+    return encoded
+
+
+def encode_task_json(task, entry=None):
+    """ Convert a dict-like task to a JSON-serializable dict
+        Used for adding or replacing tasks via `task import`
+
+    ``None`` values are dropped, and annotations without a date of their
+    own are given ``entry`` (by default, now).
+    """
+    if entry is None:
+        entry = format_now()
+
+    encoded = {}
+    for k, v in task.items():
+        if v is None:
+            continue
+        if k == 'annotations':
+            v = encode_annotations_json(v, entry)
+        elif k == 'depends' and isinstance(v, (list, tuple)):
+            # Every 2.x release understands the comma-separated form.
+            v = ','.join(str(encode_json_value(d)) for d in v)
+        elif isinstance(v, (list, tuple)):
+            v = [encode_json_value(item) for item in v]
+        else:
+            v = encode_json_value(v)
+        encoded[k] = v
+    return encoded
+
+
+def _encode_match(match):
+    return encode_replacements[match.group(0)]
+
+
 def encode_task(task):
     """ Convert a dict-like task to its string representation """
-    # First, clean the task:
-    task = task.copy()
-    if 'tags' in task:
-        task['tags'] = ','.join(task['tags'])
-    for k in task:
-        for unsafe, safe in encode_replacements.items():
-            if isinstance(task[k], str):
-                task[k] = task[k].replace(unsafe, safe)
-
-        if isinstance(task[k], datetime.datetime):
-            task[k] = task[k].strftime("%Y%m%dT%M%H%SZ")
+    fields = []
+    for k, v in sorted(task.items(), key=itemgetter(0)):
+        if k == 'tags':
+            v = ','.join(v)
+        if isinstance(v, str):
+            # Escape everything in a single pass, and only if needed.
+            if ENCODE_CHARACTERS.search(v):
+                v = ENCODE_CHARACTERS.sub(_encode_match, v)
+        elif isinstance(v, datetime.datetime):
+            v = v.strftime("%Y%m%dT%M%H%SZ")
+        fields.append("%s:\"%s\"" % (k, v))
 
     # Then, format it as a string
-    return "[%s]\n" % " ".join([
-        "%s:\"%s\"" % (k, v)
-        for k, v in sorted(task.items(), key=itemgetter(0))
-    ])
+    return "[%s]\n" % " ".join(fields)
+
+
+def _decode_match(match):
+    backslashes, following = match.groups()
+    if backslashes is None:
+        return decode_replacements[match.group(0)]
+
+    # Equivalent to unescaping '\\"', then '\\\\' and, last of all, '\\/'
+    # one after the other, the way records have always been decoded.
+    count = len(backslashes)
+    if following == '"':
+        count -= 1
+    count = (count + 1) // 2
+    if following == '/':
+        count -= 1
+    return '\\' * count + following
+
+
+def _split_task_fields(line):
+    """ Split a well-formed record into (key, escaped value) pairs
+
+    Returns ``None`` for anything out of the ordinary, which
+    ``TASK_FIELD`` then handles instead.
+
+    """
+    if not line.startswith('['):
+        return None
+    newline = line.find('\n')
+    if newline >= 0 and newline != len(line) - 1:
+        return None
+
+    fields = []
+    position = 1
+    while True:
+        colon = line.find(':"', position)
+        if colon < 0:
+            return None
+        key = line[position:colon]
+        if not key.replace('_', '0').isalnum():
+            return None
+
+        # The value ends at the first quote that isn't escaped.
+        end = line.find('"', colon + 2)
+        while end > 0 and line[end - 1] == '\\':
+            end = line.find('"', end + 1)
+        if end < 0:
+            return None
+        fields.append((key, line[colon + 2:end]))
+
+        following = line[end + 1:end + 2]
+        if following == ']':
+            if line[end + 2:] not in ('', '\n'):
+                return None
+            return fields
+        if following != ' ':
+            return None
+        position = end + 2
 
 
 def decode_task(line):
@@ -164,12 +355,16 @@ def decode_task(line):
 
     """
 
+    fields = _split_task_fields(line)
+    if fields is None:
+        fields = TASK_FIELD.findall(line)
+
     task = {}
-    for key, value in re.findall(r'(\w+):"(.*?)(?<!\\)"', line):
-        value = value.replace('\\"', '"')  # unescape quotes
+    for key, value in fields:
+        # Unescape everything in a single pass, and only if needed.
+        if '\\' in value or '&' in value:
+            value = DECODE_ESCAPES.sub(_decode_match, value)
         task[key] = value
-        for unsafe, safe in decode_replacements.items():
-            task[key] = task[key].replace(unsafe, safe)
     if 'tags' in task:
         task['tags'] = task['tags'].split(',')
     return task
@@ -256,6 +451,7 @@ def convert_dict_to_override_args(config, prefix=''):
 
 
 CTRLCHAR = re.compile(b"[\x00-\x08\x0e-\x1f]")
+CTRLCHAR_TEXT = re.compile("[\x00-\x08\x0e-\x1f]")
 
 def clean_ctrl_chars(s):
     """ Clean string removing most (but not all) control characters """
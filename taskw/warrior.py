@@ -8,24 +8,50 @@ of a sufficiently advanced version, then TaskWarriorShellout will be made the
 default TaskWarrior class.  If not, then the default TaskWarrior class will
 fall back to the older TaskWarriorDirect implementation.
 
+That check is deferred until TaskWarrior is first instantiated, so that
+importing this module never runs the 'task' binary.  Set the TASKW_BACKEND
+environment variable to 'shellout' or 'direct' to skip the check entirely.
+
 """
 import abc
+import collections
+import concurrent.futures
+import contextlib
 import copy
+import datetime
 from distutils.version import LooseVersion
+import itertools
 import logging
 import os
 import re
+import shutil
 import time
 import uuid
+import weakref
 import subprocess
 import sys
 import json
+import tempfile
 
 import kitchen.text.converters
 
 import taskw.utils
+import taskw.datafile
+from taskw.cache import DEFAULT_CACHE_TTL, TaskCache
+from taskw.datafile import StagedDataFile, TaskDataFile
+from taskw.index import TaskIndex
+from taskw.query import Filter, _get_timestamp
+from taskw.undo import (
+    UndoJournal,
+    get_end,
+    iter_entries,
+    read_entries,
+    starts_entry,
+)
+from taskw.watcher import DEFAULT_POLL_INTERVAL, TaskWatcher
 from taskw.exceptions import TaskwarriorError
-from taskw.task import Task
+from taskw.record import COMPACT, TaskRecord
+from taskw.task import Task, TaskSchema
 from taskw.taskrc import TaskRc
 
 
@@ -60,6 +86,8 @@ class TaskWarriorBase(metaclass=abc.ABCMeta):
             raise NotImplementedError(
                 "You must use TaskWarriorShellout to use 'config_overrides'"
             )
+        # TaskIndex instances to keep up to date; see ``load_index``.
+        self._indexes = weakref.WeakSet()
 
     def _stub_task(self, description, tags=None, **kw):
         """ Given a description, stub out a task dict. """
@@ -155,8 +183,73 @@ class TaskWarriorBase(metaclass=abc.ABCMeta):
 
     def filter_by(self, func):
         tasks = self.load_tasks()
-        filtered = filter(func, tasks)
-        return filtered
+        return [
+            task for task in itertools.chain(*tasks.values()) if func(task)
+        ]
+
+    def load_index(self, command='all'):
+        """ Load tasks into a ``taskw.index.TaskIndex``.
+
+        Accepts the same commands as ``load_tasks``.  The index is kept up
+        to date as tasks are added or changed through this warrior.
+
+        """
+        index = TaskIndex(
+            self.load_tasks(command), udas=self.config.get_udas()
+        )
+        self._indexes.add(index)
+        return index
+
+    def load_frame(self, command='all'):
+        """ Load tasks into a ``taskw.frame.TaskFrame``, for analytics.
+
+        Accepts the same commands as ``load_tasks``.  Requires numpy.
+
+        """
+        # Imported here, so that importing taskw doesn't import numpy.
+        from taskw.frame import TaskFrame
+        return TaskFrame(self.load_tasks(command), udas=self.config.get_udas())
+
+    def watch(self, interval=DEFAULT_POLL_INTERVAL, inotify=True):
+        """ Returns a ``taskw.watcher.TaskWatcher`` following the tasks in
+        this warrior's data directory.
+
+        """
+        return TaskWatcher(
+            self._get_data_location(),
+            udas=self.config.get_udas(),
+            interval=interval,
+            inotify=inotify,
+        )
+
+    def _get_data_location(self):
+        """ Returns taskwarrior's data directory
+
+        Worked out the way taskwarrior does:  an override of data.location
+        wins, then the TASKDATA environment variable, then the taskrc.
+
+        """
+        config = self.config.get('data')
+        location = (
+            self._get_data_location_override()
+            or os.environ.get('TASKDATA')
+            or (config.get('location') if isinstance(config, dict) else None)
+            or '~/.task'
+        )
+        return os.path.expanduser(location)
+
+    def _get_data_location_override(self):
+        return None
+
+    def _index_tasks(self, *tasks):
+        """ Pass tasks written by this warrior on to its indexes """
+        for index in list(self._indexes):
+            for task in tasks:
+                index.add(task)
+
+    def _unindex_task(self, uuid):
+        for index in list(self._indexes):
+            index.discard(uuid)
 
     @classmethod
     def load_config(cls, config_filename=TASKRC, overrides=None):
@@ -190,25 +283,172 @@ class TaskWarriorDirect(TaskWarriorBase):
     and https://github.com/ralphbean/taskw/issues/30 for more.
     """
 
+    def __init__(
+        self,
+        config_filename=TASKRC,
+        config_overrides=None,
+        marshal=False,
+        fsync=taskw.datafile.FSYNC_REWRITES,
+    ):
+        super(TaskWarriorDirect, self).__init__(
+            config_filename,
+            config_overrides=config_overrides,
+            marshal=marshal,
+        )
+        # One of taskw.datafile.FSYNC_POLICIES.
+        self.fsync = taskw.datafile.validate_fsync(fsync)
+        # TaskDataFile instances, keyed on filename.
+        self._data_files = {}
+        # StagedDataFile instances, keyed on category, while a transaction
+        # is open, and the changes to pass on to indexes once it commits.
+        self._transaction = None
+        self._transaction_indexed = None
+        self._undo_journal = None
+
     def sync(self):
         raise NotImplementedError(
             "You must use TaskWarriorShellout to use 'sync'"
         )
 
-    def load_tasks(self, command='all'):
-        def _load_tasks(filename):
-            filename = os.path.join(self.config['data']['location'], filename)
-            filename = os.path.expanduser(filename)
-            with open(filename, 'r') as f:
-                lines = f.readlines()
+    def _get_data_file(self, category):
+        """ Returns the ``TaskDataFile`` for a category of tasks.
 
-            return list(map(taskw.utils.decode_task, lines))
+        Each one is kept around so that its index can be reused for as
+        long as the file doesn't change.
 
-        return dict(
-            (db, _load_tasks(DataFile.filename(db)))
-            for db in Command.files(command)
+        """
+        if self._transaction is not None:
+            return self._transaction[category]
+
+        filename = os.path.join(
+            self._get_data_location(), DataFile.filename(category)
         )
 
+        if filename not in self._data_files:
+            self._data_files[filename] = TaskDataFile(
+                filename, fsync=self.fsync
+            )
+        return self._data_files[filename]
+
+    def _get_undo_journal(self):
+        if self._undo_journal is None:
+            self._undo_journal = UndoJournal(
+                os.path.join(self._get_data_location(), 'undo.data'),
+                fsync=self.fsync,
+            )
+        return self._undo_journal
+
+    def _record_undo(self, old, new):
+        """ Journal a change to a task in undo.data, so it can be undone.
+
+        Entries are written once the transaction is, or right away outside
+        of one.
+
+        """
+        journal = self._get_undo_journal()
+        journal.record(old, new)
+        if self._transaction is None:
+            journal.flush()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """ Group changes together, writing each file only once.
+
+        Changes made inside the ``with`` block are kept in memory and
+        written when it exits, with a single write to each file they
+        touch::
+
+            with tw.transaction():
+                for description in descriptions:
+                    tw.task_add(description)
+
+        pending.data, completed.data and undo.data stay locked until then,
+        so other writers (taskwarrior included) wait for the whole
+        transaction.  If the block raises an exception, nothing is written.
+        A transaction opened inside another one is part of it.
+
+        """
+        if self._transaction is not None:
+            yield
+            return
+
+        with contextlib.ExitStack() as stack:
+            staged = {}
+            # Always lock in the same order, so transactions can't deadlock.
+            for category in Command.files(Command.ALL):
+                data_file = self._get_data_file(category)
+                stack.enter_context(taskw.datafile.locked(data_file.filename))
+                staged[category] = StagedDataFile(data_file)
+            journal = self._get_undo_journal()
+            stack.enter_context(taskw.datafile.locked(journal.filename))
+
+            self._transaction = staged
+            self._transaction_indexed = indexed = []
+            try:
+                yield
+            except BaseException:
+                journal.discard()
+                raise
+            finally:
+                self._transaction = None
+                self._transaction_indexed = None
+
+            # completed.data first, so that tasks moved there by
+            # ``compact`` are saved before they leave pending.data.
+            for category in reversed(Command.files(Command.ALL)):
+                staged[category].commit()
+            journal.flush()
+
+        for change, argument in indexed:
+            change(argument)
+
+    def _index_tasks(self, *tasks):
+        if self._transaction_indexed is not None:
+            for task in tasks:
+                self._transaction_indexed.append(
+                    (super(TaskWarriorDirect, self)._index_tasks, task)
+                )
+            return
+        super(TaskWarriorDirect, self)._index_tasks(*tasks)
+
+    def _unindex_task(self, uuid):
+        if self._transaction_indexed is not None:
+            self._transaction_indexed.append(
+                (super(TaskWarriorDirect, self)._unindex_task, uuid)
+            )
+            return
+        super(TaskWarriorDirect, self)._unindex_task(uuid)
+
+    def _get_category(self, task, found_in):
+        """ The category a task belongs in, wherever it is stored.
+
+        Completed and deleted tasks stay in pending.data until ``compact``
+        is called, just like they do until taskwarrior's garbage collection.
+
+        """
+        try:
+            return Status.to_file(task.get('status'))
+        except KeyError:
+            return found_in
+
+    def load_tasks(self, command='all'):
+        categories = Command.files(command)
+        tasks = dict((db, []) for db in categories)
+
+        # pending.data may hold tasks which are already completed.
+        files = set(categories)
+        if DataFile.COMPLETED in files:
+            files.add(DataFile.PENDING)
+
+        for db in Command.files(Command.ALL):
+            if db not in files:
+                continue
+            for task in self._get_data_file(db):
+                category = self._get_category(task, db)
+                if category in tasks:
+                    tasks[category].append(task)
+        return tasks
+
     def get_task(self, **kw):
         line, task = self._load_task(**kw)
 
@@ -220,6 +460,11 @@ class TaskWarriorDirect(TaskWarriorBase):
         return id, task
 
     def _load_task(self, **kw):
+        category, line, task = self._find_task(**kw)
+        return line, task
+
+    def _find_task(self, **kw):
+        """ Returns the category, line and task matching ``kw`` """
         valid_keys = set(['id', 'uuid', 'description'])
         id_keys = valid_keys.intersection(kw.keys())
 
@@ -230,32 +475,37 @@ class TaskWarriorDirect(TaskWarriorBase):
         if key not in valid_keys:
             raise KeyError("Argument must be one of %r" % valid_keys)
 
+        category = None
         line = None
         task = dict()
 
         # If the key is an id, assume the task is pending (completed tasks
         # don't have IDs).
         if key == 'id':
-            tasks = self.load_tasks(command=Status.PENDING)
+            category = DataFile.PENDING
             line = kw[key]
+            task = self._get_data_file(category).line(line) or task
 
-            if len(tasks[Status.PENDING]) >= line:
-                task = tasks[Status.PENDING][line - 1]
+        elif key == 'uuid':
+            # Look the task up in each file's index rather than decoding
+            # every task.
+            for db in Command.files(Command.ALL):
+                found_line, found = self._get_data_file(db).get(kw[key])
+                if found is not None:
+                    category, line, task = db, found_line, found
+                    break
 
         else:
             # Search all tasks for the specified key.
-            tasks = self.load_tasks(command=Command.ALL)
-
-            matching = list(filter(
-                lambda t: t.get(key, None) == kw[key],
-                sum(tasks.values(), [])
-            ))
+            for db in Command.files(Command.ALL):
+                for i, candidate in enumerate(self._get_data_file(db)):
+                    if candidate.get(key, None) == kw[key]:
+                        category, line, task = db, i + 1, candidate
+                        break
+                if line is not None:
+                    break
 
-            if matching:
-                task = matching[0]
-                line = tasks[Status.to_file(task['status'])].index(task) + 1
-
-        return line, task
+        return category, line, task
 
     def task_add(self, description, tags=None, **kw):
         """ Add a new task.
@@ -291,7 +541,8 @@ class TaskWarriorDirect(TaskWarriorBase):
         return self._task_change_status(Status.COMPLETED, validate, **kw)
 
     def task_update(self, task):
-        line, _task = self._load_task(uuid=task['uuid'])
+        category, line, _task = self._find_task(uuid=task['uuid'])
+        original = copy.copy(_task)
 
         if 'id' in task:
             del task['id']
@@ -306,7 +557,7 @@ class TaskWarriorDirect(TaskWarriorBase):
                     _task.pop(k)
 
         _task.update(task)
-        self._task_replace(line, Status.to_file(task['status']), _task)
+        self._task_replace(line, category, _task, original)
         return line, _task
 
     def task_delete(self, **kw):
@@ -329,73 +580,159 @@ class TaskWarriorDirect(TaskWarriorBase):
         raise NotImplementedError()
 
     def filter_tasks(self, filter_dict):
-        raise NotImplementedError()
+        """ Return the tasks matching ``filter_dict``.
 
-    def _task_replace(self, id, category, task):
-        def modification(lines):
-            lines[id - 1] = taskw.utils.encode_task(task)
-            return lines
+        The filter is evaluated in Python by ``taskw.query.Filter``; see
+        ``TaskWarriorShellout.filter_tasks`` for what it looks like.
+        Pending tasks are given their ``id``, as taskwarrior does.
 
-        # FIXME write to undo.data
-        self._apply_modification(id, category, modification)
+        """
+        query = Filter(filter_dict, udas=self.config.get_udas())
+        return query.filter(self._iter_tasks_with_ids())
 
-    def _task_remove(self, id, category):
-        def modification(lines):
-            del lines[id - 1]
-            return lines
+    def _iter_tasks_with_ids(self):
+        for db in Command.files(Command.ALL):
+            for line, task in enumerate(self._get_data_file(db)):
+                if db == DataFile.PENDING and Status.is_pending(
+                    task.get('status')
+                ):
+                    task['id'] = line + 1
+                yield task
 
-        # FIXME write to undo.data
-        self._apply_modification(id, category, modification)
+    def compact(self):
+        """ Move completed and deleted tasks out of pending.data.
 
-    def _apply_modification(self, id, category, modification):
-        filename = DataFile.filename(category)
-        filename = os.path.join(self.config['data']['location'], filename)
-        filename = os.path.expanduser(filename)
+        This is what taskwarrior's garbage collection does; until it runs,
+        the IDs of pending tasks don't change.
 
-        with open(filename, "r") as f:
-            lines = f.readlines()
+        """
+        def keep(task):
+            category = self._get_category(task, DataFile.PENDING)
+            return category == DataFile.PENDING
+
+        def move(tasks):
+            # Save them in completed.data before they leave pending.data,
+            # so that nothing is lost if we are interrupted.
+            self._get_data_file(DataFile.COMPLETED).append(
+                [taskw.utils.encode_task(task) for task in tasks]
+            )
 
-        lines = modification(lines)
+        pending = self._get_data_file(DataFile.PENDING)
+        return len(pending.compact(keep, before_replace=move))
 
-        with open(filename, "w") as f:
-            f.writelines(lines)
+    def undo(self):
+        """ Revert the most recent change to a task, like ``task undo``.
 
-    def _task_add(self, task, category):
-        location = self.config['data']['location']
-        location = os.path.expanduser(location)
-        filename = category + '.data'
+        Returns the ``taskw.undo.UndoEntry`` which was reverted, or None if
+        there was nothing to undo.
 
-        # Append the task
-        with open(os.path.join(location, filename), "a") as f:
-            f.writelines([taskw.utils.encode_task(task)])
+        """
+        with self.transaction():
+            entry = self._get_undo_journal().pop()
+            if entry is None:
+                return None
+
+            category, line, task = self._find_task(uuid=entry.new['uuid'])
+            if line is None:
+                raise KeyError("No task with UUID %s." % entry.new['uuid'])
+
+            if entry.old is None:
+                self._task_remove(line, category)
+                self._unindex_task(entry.new['uuid'])
+                return entry
+
+            self._index_tasks(entry.old)
+            if self._get_category(entry.old, category) == category:
+                self._get_data_file(category).replace(
+                    line, taskw.utils.encode_task(entry.old)
+                )
+            else:
+                # Compacted into completed.data, and pending once more.
+                self._task_remove(line, category)
+                self._get_data_file(DataFile.PENDING).append(
+                    [taskw.utils.encode_task(entry.old)]
+                )
+        return entry
 
-        # FIXME - this gets written when a task is completed.  incorrect.
-        # Add to undo.data
-        with open(os.path.join(location, 'undo.data'), "a") as f:
-            f.write("time %s\n" % str(int(time.time())))
-            f.write("new %s" % taskw.utils.encode_task(task))
-            f.write("---\n")
+    def changes_since(self, since):
+        """ Returns the tasks changed since ``since``, and a ``ChangeCursor``
+        to pass next time.
 
-        with open(os.path.join(location, filename), "r") as f:
-            # The 'id' of this latest added task.
-            return len(f.readlines())
+        ``since`` is the cursor from the last call, or a datetime or
+        timestamp to start from.  Changes are read from undo.data:  with a
+        cursor, just the entries written since; otherwise (or once the file
+        has been cut short by an undo) those made since its ``time``.
+        Deleted tasks are among those returned, with a status of 'deleted'.
+
+        """
+        cursor = ChangeCursor.get(since)
+        filename = self._get_undo_journal().filename
+        started = int(time.time())
+
+        if cursor.offset is not None and starts_entry(
+            filename, cursor.offset
+        ):
+            entries, offset = read_entries(filename, cursor.offset)
+        else:
+            offset = get_end(filename)
+            # The file holds entries in the order they were made, so only
+            # the newest need reading; undo.data times are in seconds.
+            entries = list(itertools.takewhile(
+                lambda entry: entry.time >= int(cursor.time),
+                iter_entries(filename, reverse=True),
+            ))[::-1]
+
+        tasks = collections.OrderedDict()
+        for entry in entries:
+            uuid = str(entry.new['uuid'])
+            tasks.pop(uuid, None)
+            tasks[uuid] = entry.new
+        return list(tasks.values()), ChangeCursor(started, offset)
+
+    def _task_replace(self, id, category, task, original):
+        self._get_data_file(category).replace(
+            id, taskw.utils.encode_task(task)
+        )
+        self._record_undo(original, task)
+        self._index_tasks(task)
+
+    def _task_remove(self, id, category):
+        # undo.data has no way to describe a task going away; this is only
+        # used to undo adding one.
+        self._get_data_file(category).remove(id)
+
+    def _task_add(self, task, category):
+        # Append the task, and get back its 'id'.
+        id = self._get_data_file(category).append(
+            [taskw.utils.encode_task(task)]
+        )
+        self._record_undo(None, task)
+        self._index_tasks(task)
+        return id
 
     def _task_change_status(self, status, validation, **kw):
-        line, task = self._load_task(**kw)
+        category, line, task = self._find_task(**kw)
         validation(task)
-        original_status = task['status']
+        original = copy.copy(task)
 
         task['status'] = status
         task['end'] = kw.get('end') or str(int(time.time()))
 
-        self._task_add(task, Status.to_file(status))
-        self._task_remove(line, Status.to_file(original_status))
+        # The task is changed where it stands; ``compact`` moves it to
+        # completed.data later on.
+        self._task_replace(line, category, task, original)
         return task
 
 # This regex is used to parse UUIDs from messages output
 # by the shell client when creating tasks.
 UUID_REGEX = '[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
 
+# How many tasks ``TaskWarriorShellout.task_import`` sends per `task import`.
+IMPORT_CHUNK_SIZE = 1000
+
+# How many exports ``LoadStrategy.THREADS`` runs at once by default.
+DEFAULT_MAX_WORKERS = 4
+
 class TaskWarriorShellout(TaskWarriorBase):
     """ Interacts with taskwarrior by invoking shell commands.
 
@@ -421,16 +758,41 @@ class TaskWarriorShellout(TaskWarriorBase):
         },
     }
 
+    # Versions reported by 'task --version', keyed on the signature
+    # returned by ``_get_executable_signature``.
+    _version_cache = {}
+    _version_override = None
+
     def __init__(
         self,
         config_filename=TASKRC,
         config_overrides=None,
         marshal=False,
+        load_strategy=None,
+        max_workers=DEFAULT_MAX_WORKERS,
+        cache_size=0,
+        cache_ttl=DEFAULT_CACHE_TTL,
     ):
         super(TaskWarriorShellout, self).__init__(config_filename)
         self.config_overrides = config_overrides if config_overrides else {}
         self._marshal = marshal
+        # Taken first, so that changes made while reading are noticed.
+        self._config_signature = self._get_config_signature()
         self.config = TaskRc(config_filename, overrides=config_overrides)
+        # Shared by every task and record this warrior marshals; see
+        # ``_get_schema``.
+        self._schema = None
+        self.load_strategy = LoadStrategy.validate(
+            load_strategy or LoadStrategy.SERIAL
+        )
+        self.max_workers = max_workers
+        # Up to ``cache_size`` exports are kept for ``cache_ttl`` seconds,
+        # or until the data files change; see ``taskw.cache``.
+        self.cache = None
+        if cache_size:
+            self.cache = TaskCache(
+                self._get_data_location(), cache_size, ttl=cache_ttl
+            )
 
         if self.get_version() >= LooseVersion('2.4'):
             self.DEFAULT_CONFIG_OVERRIDES['verbose'] = 'new-uuid'
@@ -444,15 +806,26 @@ class TaskWarriorShellout(TaskWarriorBase):
                 "Python < 3.7 with TaskWarrior => 2.5.3 is not suppoprted. "
                 "Task addition may fail.")
 
+    def _get_data_location_override(self):
+        # Either {'data.location': ...} or {'data': {'location': ...}}.
+        overrides = self.config_overrides
+        if overrides.get('data.location'):
+            return overrides['data.location']
+        nested = overrides.get('data')
+        if isinstance(nested, dict):
+            return nested.get('location')
+        return None
+
     def get_configuration_override_args(self):
         config_overrides = self.DEFAULT_CONFIG_OVERRIDES.copy()
         config_overrides.update(self.config_overrides)
         return taskw.utils.convert_dict_to_override_args(config_overrides)
 
-    def _execute(self, *args):
-        """ Execute a given taskwarrior command with arguments
+    def _get_command(self, args):
+        """ Build the command line and environment for a taskwarrior command
 
-        Returns a 2-tuple of stdout and stderr (respectively).
+        Returns a 2-tuple of the command (as a list of bytestrings) and the
+        environment to run it in.
 
         """
         command = (
@@ -472,59 +845,144 @@ class TaskWarriorShellout(TaskWarriorBase):
                 command[i] = (
                     taskw.utils.clean_ctrl_chars(command[i].encode('utf-8')))
 
+        return command, env
+
+    def _decode_output(self, command, returncode, stdout, stderr):
+        """ Check a finished command and decode what it printed
+
+        Returns a 2-tuple of stdout and stderr (respectively), as text.
+
+        """
+        if returncode != 0:
+            raise TaskwarriorError(command, stderr, stdout, returncode)
+
+        return self._decode_text(stdout), self._decode_text(stderr)
+
+    def _decode_text(self, value):
+        """ Decode a bytestring printed by taskwarrior """
+        # We should get bytes from the outside world.  Turn those into unicode
+        # as soon as we can.
+        # Everything going into and coming out of taskwarrior *should* be
+        # utf-8, but there are weird edge cases where something totally unusual
+        # made it in.. so we need to be able to handle (or at least try to
+        # handle) whatever.  Kitchen tries its best.
+        try:
+            value = value.decode(self.config.get('encoding', 'utf-8'))
+        except UnicodeDecodeError as e:
+            value = kitchen.text.converters.to_unicode(value)
+
+        # strip any crazy terminal escape characters like bells, backspaces,
+        # and form feeds
+        for c in ('\a', '\b', '\f', '\x1b'):
+            value = value.replace(c, '?')
+
+        return value
+
+    def _execute(self, *args, stdin=None):
+        """ Execute a given taskwarrior command with arguments
+
+        If given, the ``stdin`` bytestring is fed to the command's standard
+        input.
+
+        Returns a 2-tuple of stdout and stderr (respectively).
+
+        """
+        command, env = self._get_command(args)
+
         try:
             proc = subprocess.Popen(
                 command,
                 env=env,
+                stdin=subprocess.PIPE if stdin is not None else None,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
             )
-            stdout, stderr = proc.communicate()
+            stdout, stderr = proc.communicate(stdin)
         except FileNotFoundError:
             raise FileNotFoundError(
                 "Unable to find the 'task' command-line tool."
             )
+        finally:
+            self._invalidate_cache(args)
 
-        if proc.returncode != 0:
-            raise TaskwarriorError(command, stderr, stdout, proc.returncode)
+        return self._decode_output(command, proc.returncode, stdout, stderr)
 
-        # We should get bytes from the outside world.  Turn those into unicode
-        # as soon as we can.
-        # Everything going into and coming out of taskwarrior *should* be
-        # utf-8, but there are weird edge cases where something totally unusual
-        # made it in.. so we need to be able to handle (or at least try to
-        # handle) whatever.  Kitchen tries its best.
-        try:
-            stdout = stdout.decode(self.config.get('encoding', 'utf-8'))
-        except UnicodeDecodeError as e:
-            stdout = kitchen.text.converters.to_unicode(stdout)
-        try:
-            stderr = stderr.decode(self.config.get('encoding', 'utf-8'))
-        except UnicodeDecodeError as e:
-            stderr = kitchen.text.converters.to_unicode(stderr)
+    def _invalidate_cache(self, args):
+        """ Forget every cached export once a command that may have changed
+        tasks has run.
 
-        # strip any crazy terminal escape characters like bells, backspaces,
-        # and form feeds
-        for c in ('\a', '\b', '\f', ''):
-            stdout = stdout.replace(c, '?')
-            stderr = stderr.replace(c, '?')
+        The data files changing would do that anyway, unless they change
+        within the resolution of their modification times.
+
+        """
+        if self.cache is not None and (not args or args[-1] != 'export'):
+            self.cache.clear()
 
-        return stdout, stderr
+    def _get_cache_key(self, args):
+        return tuple(str(arg) for arg in args)
 
     def _get_json(self, *args):
-        return json.loads(self._execute(*args)[0])
+        if self.cache is None:
+            return json.loads(self._execute(*args)[0])
+
+        key = self._get_cache_key(args)
+        signature = self.cache.get_signature()
+        stdout = self.cache.get(key, signature)
+        if stdout is None:
+            stdout = self._execute(*args)[0]
+            self.cache.set(key, stdout, signature)
+        # Parsed afresh each time, so callers can't change what's cached.
+        return json.loads(stdout)
 
     def _get_task_objects(self, *args):
-        json = self._get_json(*args)
+        return self._get_task_objects_from(self._get_json(*args))
+
+    def _get_task_objects_from(self, json):
         if isinstance(json, dict):
             return self._get_task_object(json)
-        value = [self._get_task_object(j) for j in json]
+        schema = self._get_schema() if self._marshal else None
+        value = [self._get_task_object(j, schema) for j in json]
         return value
 
-    def _get_task_object(self, obj):
-        if self._marshal:
-            return Task(obj, udas=self.config.get_udas())
-        return obj
+    def _get_task_object(self, obj, schema=None):
+        if not self._marshal:
+            return obj
+        if schema is None:
+            schema = self._get_schema()
+        if self._marshal == COMPACT:
+            return TaskRecord(obj, schema)
+        return Task(obj, schema=schema)
+
+    def _get_schema(self):
+        """ Returns the ``taskw.task.TaskSchema`` tasks are marshalled with
+
+        It is built once, and again only if the taskrc has changed since,
+        in which case the taskrc is read again too.
+
+        """
+        signature = self._get_config_signature()
+        if signature != self._config_signature and signature is not None:
+            self.config = TaskRc(
+                self.config_filename, overrides=self.config_overrides
+            )
+            self._schema = None
+        self._config_signature = signature
+        if self._schema is None:
+            self._schema = TaskSchema(self.config.get_udas())
+        return self._schema
+
+    def _get_config_signature(self):
+        """ Returns the size, modification time and inode of the taskrc, or
+        None if there isn't one.
+
+        Files it includes aren't looked at.
+
+        """
+        try:
+            stat = os.stat(os.path.expanduser(self.config_filename))
+        except (FileNotFoundError, TypeError):
+            return None
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
 
     def _stub_task(self, description, tags=None, **kw):
         """ Given a description, stub out a task dict. """
@@ -544,7 +1002,7 @@ class TaskWarriorShellout(TaskWarriorBase):
         task.update(kw)
 
         if self._marshal:
-            return Task.from_stub(task, udas=self.config.get_udas())
+            return Task.from_stub(task, schema=self._get_schema())
 
         return task
 
@@ -560,43 +1018,168 @@ class TaskWarriorShellout(TaskWarriorBase):
             return False
 
     @classmethod
-    def get_version(cls):
+    def _get_executable_signature(cls):
+        """ Identify the 'task' binary that would be run right now.
+
+        Returns a 3-tuple of the binary's resolved path, its modification
+        time and its inode; if any of these change, the binary has been
+        replaced and its version must be probed again.
+
+        """
+        executable = shutil.which('task')
+        if executable is None:
+            raise FileNotFoundError(
+                "Unable to find the 'task' command-line tool."
+            )
+        executable = os.path.realpath(executable)
+        stat = os.stat(executable)
+        return executable, stat.st_mtime_ns, stat.st_ino
+
+    @classmethod
+    def _probe_version(cls, executable):
         try:
             taskwarrior_version = subprocess.Popen(
-                ['task', '--version'],
+                [executable, '--version'],
                 stdout=subprocess.PIPE
             ).communicate()[0]
         except FileNotFoundError:
             raise FileNotFoundError(
                 "Unable to find the 'task' command-line tool."
             )
-        return LooseVersion(taskwarrior_version.decode())
+        return LooseVersion(taskwarrior_version.decode().strip())
 
-    def sync(self, init=False):
+    @classmethod
+    def get_version(cls):
+        """ Returns the version of the installed taskwarrior binary.
+
+        The binary is only run once per process for each distinct
+        executable; see ``set_version`` and ``clear_version_cache``.
+
+        """
+        if TaskWarriorShellout._version_override is not None:
+            return TaskWarriorShellout._version_override
+
+        signature = cls._get_executable_signature()
+        version = cls._version_cache.get(signature)
+        if version is None:
+            version = cls._probe_version(signature[0])
+            cls._version_cache[signature] = version
+        return version
+
+    @classmethod
+    def set_version(cls, version):
+        """ Force ``get_version`` to return ``version`` without probing.
+
+        Pass ``None`` to go back to asking the binary.
+
+        """
+        if version is not None and not isinstance(version, LooseVersion):
+            version = LooseVersion(str(version))
+        TaskWarriorShellout._version_override = version
+
+    @classmethod
+    def clear_version_cache(cls):
+        """ Forget every taskwarrior version probed so far. """
+        cls._version_cache.clear()
+
+    def _get_sync_args(self, init=False):
         if self.get_version() < LooseVersion('2.3'):
             raise UnsupportedVersionException(
                 "'sync' requires version 2.3 of taskwarrior or later."
             )
         if init is True:
-            self._execute('sync', 'init')
-        else:
-            self._execute('sync')
+            return ['sync', 'init']
+        return ['sync']
 
-    def load_tasks(self, command='all'):
-        """ Returns a dictionary of tasks for a list of command."""
+    def sync(self, init=False):
+        self._execute(*self._get_sync_args(init))
 
-        results = dict(
-            (db, self._get_task_objects('status:%s' % db, 'export'))
-            for db in Command.files(command)
-        )
+    def _get_load_queries(self, command):
+        """ Returns (category, status) pairs to export for ``load_tasks``
 
-        # 'waiting' tasks are returned separately from 'pending' tasks
-        # Here we merge the waiting list back into the pending list.
-        if 'pending' in results:
-            results['pending'].extend(
-                self._get_task_objects('status:waiting', 'export'))
+        'waiting' tasks are exported separately from 'pending' tasks, but
+        are returned as part of the 'pending' list.
 
-        return results
+        """
+        queries = [(db, db) for db in Command.files(command)]
+        if DataFile.PENDING in Command.files(command):
+            queries.append((DataFile.PENDING, Status.WAITING))
+        return queries
+
+    def _merge_loaded_tasks(self, command, results):
+        """ Combine ``_get_load_queries`` results into ``load_tasks`` form """
+        tasks = dict((db, []) for db in Command.files(command))
+        for (db, status), loaded in zip(self._get_load_queries(command),
+                                        results):
+            tasks[db].extend(loaded)
+        return tasks
+
+    def _get_combined_load_args(self, command):
+        """ Arguments exporting every task ``load_tasks`` wants at once """
+        statuses = [status for db, status in self._get_load_queries(command)]
+        return [
+            '( %s )' % ' or '.join('status:%s' % s for s in statuses),
+            'export',
+        ]
+
+    def _partition_loaded_tasks(self, command, loaded):
+        """ Split a single export into one list per ``_get_load_queries`` """
+        by_status = collections.defaultdict(list)
+        for task in loaded:
+            by_status[task['status']].append(task)
+        return [
+            by_status[status]
+            for db, status in self._get_load_queries(command)
+        ]
+
+    def _export_many(self, queries, strategy):
+        """ Run each list of export arguments in ``queries``
+
+        Returns the resulting task lists in order.  With
+        ``LoadStrategy.THREADS``, up to ``max_workers`` exports run at once;
+        the time is spent waiting on taskwarrior, so threads are enough.
+
+        """
+        if strategy == LoadStrategy.THREADS and len(queries) > 1:
+            workers = min(self.max_workers, len(queries))
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                return list(executor.map(
+                    lambda args: self._get_task_objects(*args), queries
+                ))
+        return [self._get_task_objects(*args) for args in queries]
+
+    def load_tasks(self, command='all', strategy=None):
+        """ Returns a dictionary of tasks for a list of command.
+
+        ``strategy`` is one of the ``LoadStrategy`` values and defaults to
+        the warrior's ``load_strategy``:  'serial' exports each status in
+        turn, 'threads' exports them concurrently and 'single' exports
+        them all at once and sorts them by status afterwards.
+
+        """
+        strategy = LoadStrategy.validate(strategy or self.load_strategy)
+        if strategy == LoadStrategy.SINGLE:
+            return self._merge_loaded_tasks(
+                command,
+                self._partition_loaded_tasks(
+                    command,
+                    self._get_task_objects(
+                        *self._get_combined_load_args(command)
+                    ),
+                ),
+            )
+
+        return self._merge_loaded_tasks(command, self._export_many(
+            [
+                ['status:%s' % status, 'export']
+                for db, status in self._get_load_queries(command)
+            ],
+            strategy,
+        ))
+
+    def _get_filter_args(self, filter_dict):
+        query_args = taskw.utils.encode_query(filter_dict, self.get_version())
+        return query_args + ['export']
 
     def filter_tasks(self, filter_dict):
         """ Return a filtered list of tasks from taskwarrior.
@@ -619,25 +1202,230 @@ class TaskWarriorShellout(TaskWarriorBase):
         website.
 
         """
-        query_args = taskw.utils.encode_query(filter_dict, self.get_version())
-        return self._get_task_objects(
-            *(query_args + ['export'])
+        return self._get_task_objects(*self._get_filter_args(filter_dict))
+
+    def filter_tasks_many(self, filter_dicts, strategy=None):
+        """ Run several ``filter_tasks`` queries.
+
+        Returns one list of tasks per filter dict, in order.  Queries run
+        concurrently unless ``strategy`` (or the warrior's
+        ``load_strategy``) is 'serial'.
+
+        """
+        strategy = LoadStrategy.validate(strategy or self.load_strategy)
+        if strategy == LoadStrategy.SINGLE:
+            strategy = LoadStrategy.THREADS
+        return self._export_many(
+            [self._get_filter_args(f) for f in filter_dicts],
+            strategy,
         )
 
-    def get_task(self, **kw):
-        task = dict()
-        task_id = None
-        task_id, task = self._load_task(**kw)
-        id = None
+    def _get_changes_args(self, cursor):
+        # 'modified' is kept to the second and 'after' is strict, so start
+        # a second early rather than miss changes made in the second the
+        # last call was.
+        after = datetime.datetime.fromtimestamp(
+            int(cursor.time) - 1, datetime.timezone.utc
+        )
+        return self._get_filter_args({
+            'or': [('modified.after', after), ('entry.after', after)],
+        })
 
+    def changes_since(self, since):
+        """ Returns the tasks changed since ``since``, and a ``ChangeCursor``
+        to pass next time.
+
+        ``since`` is the cursor from the last call, or a datetime or
+        timestamp to start from.  Tasks are found by when they were last
+        modified, so one changed just as a call was made may be returned by
+        the next one too.  Deleted tasks are among those returned, with a
+        status of 'deleted'.
+
+        """
+        cursor = ChangeCursor.get(since)
+        started = int(time.time())
+        tasks = self._get_task_objects(*self._get_changes_args(cursor))
+        return tasks, ChangeCursor(started, None)
+
+    def _stub_import(self, task):
+        """ Fill in what `task import` needs to create ``task``.
+
+        Returns a copy of the task with a UUID, a status and an entry date,
+        and with any legacy 'annotation_*' keys folded into 'annotations'.
+        """
+        if isinstance(task, Task):
+            annotations = task.get('annotations')
+            task = task.serialized()
+            if annotations:
+                # Serializing would throw away each annotation's entry date.
+                task['annotations'] = list(annotations)
+        else:
+            task = dict(task)
+
+        for key in sorted(task.keys()):
+            if key.startswith('annotation_'):
+                task['annotations'] = list(task.get('annotations') or [])
+                task['annotations'].append({
+                    'entry': key[len('annotation_'):],
+                    'description': task.pop(key),
+                })
+
+        if not task.get('uuid'):
+            task['uuid'] = uuid.uuid4()
+        task['uuid'] = str(task['uuid'])
+        task.setdefault('status', Status.PENDING)
+        task.setdefault(
+            'entry',
+            taskw.utils.format_now()
+        )
+        return task
+
+    def _get_import_payloads(self, tasks, uuids, chunk_size):
+        """ Yield `task import` payloads of up to ``chunk_size`` tasks
+
+        The UUID of every task is appended to ``uuids`` as it is consumed.
+
+        """
+        entry = taskw.utils.format_now()
+        chunk = []
+        for task in tasks:
+            task = self._stub_import(task)
+            for key in ('id', 'urgency'):
+                task.pop(key, None)
+            uuids.append(task['uuid'])
+            chunk.append(json.dumps(
+                taskw.utils.encode_task_json(task, entry=entry),
+                ensure_ascii=False,
+            ) + '\n')
+            if len(chunk) >= chunk_size:
+                yield ''.join(chunk).encode('utf-8')
+                chunk = []
+
+        if chunk:
+            yield ''.join(chunk).encode('utf-8')
+
+    def task_import(self, tasks, chunk_size=IMPORT_CHUNK_SIZE):
+        """ Add (or replace) many tasks using `task import`.
+
+        ``tasks`` may be any iterable of task dicts or ``taskw.task.Task``
+        instances; it is consumed lazily and sent to taskwarrior's stdin
+        ``chunk_size`` tasks at a time, so even huge imports only cost one
+        invocation per chunk.  Annotations are sent along with their task.
+
+        Tasks without a UUID are assigned one; a task whose UUID already
+        exists replaces the existing task.
+
+        Returns the UUIDs of the imported tasks, in order.
+
+        """
+        uuids = []
+        for payload in self._get_import_payloads(tasks, uuids, chunk_size):
+            self._execute('import', stdin=payload)
+        return uuids
+
+    def _get_tasks_by_uuid(self, uuids):
+        """ Export the tasks having the given UUIDs with a single command. """
+        uuids = [str(u) for u in uuids]
+        if not uuids:
+            return []
+        return self._get_task_objects(*(uuids + ['export']))
+
+    def batch(self):
+        """ Queue up task changes and apply them all at once.
+
+        Adds, updates and annotations made through the returned
+        ``TaskWarriorBatch`` are sent to taskwarrior in a single
+        `task import` when the ``with`` block exits::
+
+            with tw.batch() as batch:
+                batch.task_add('Eat food', annotations=['Fruit, mostly'])
+                batch.task_update(existing_task)
+            batch.tasks  # Every added or changed task, freshly exported
+
+        """
+        return TaskWarriorBatch(self)
+
+    def _decode_export_line(self, line):
+        """ Decode one line of `task export` output
+
+        Export prints one task per line, wrapped in '[' and ']' and
+        separated by commas when rc.json.array is on.  Returns ``None`` for
+        lines holding no task.
+
+        """
+        line = self._decode_text(line).strip()
+        if line.startswith('['):
+            line = line[1:]
+        if line.endswith(']'):
+            line = line[:-1]
+        line = line.strip().rstrip(',')
+        if not line:
+            return None
+        return json.loads(line)
+
+    def iter_tasks(self, filter_dict=None):
+        """ Yield the tasks matching ``filter_dict`` one at a time.
+
+        Unlike ``filter_tasks``, the export is read as it is printed, so
+        memory use does not grow with the number of tasks and the first
+        tasks are available before taskwarrior has finished.  Without a
+        filter, every task is exported.
+
+        If the generator is closed early, taskwarrior is killed.
+
+        """
+        args = ['export']
+        if filter_dict:
+            args = self._get_filter_args(filter_dict)
+        command, env = self._get_command(args)
+        schema = self._get_schema() if self._marshal else None
+
+        # stderr goes to a file so that a chatty taskwarrior can't block on
+        # a pipe nobody is reading until stdout is done.
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                proc = subprocess.Popen(
+                    command,
+                    env=env,
+                    stdout=subprocess.PIPE,
+                    stderr=stderr,
+                )
+            except FileNotFoundError:
+                raise FileNotFoundError(
+                    "Unable to find the 'task' command-line tool."
+                )
+
+            finished = False
+            try:
+                for line in proc.stdout:
+                    task = self._decode_export_line(line)
+                    if task is not None:
+                        yield self._get_task_object(task, schema)
+                finished = True
+            finally:
+                if not finished and proc.poll() is None:
+                    proc.kill()
+                proc.stdout.close()
+                proc.wait()
+
+            if proc.returncode != 0:
+                stderr.seek(0)
+                raise TaskwarriorError(
+                    command, stderr.read(), b'', proc.returncode
+                )
+
+    def _get_pending_id(self, task_id, task):
         # The ID going back only makes sense if the task is pending.
         if 'status' in task:
             if Status.is_pending(task['status']):
-                id = task_id
+                return task_id
+        return None
 
-        return id, task
+    def get_task(self, **kw):
+        task_id, task = self._load_task(**kw)
+        return self._get_pending_id(task_id, task), task
 
-    def _load_task(self, **kwargs):
+    def _get_search_args(self, kwargs):
         if len(kwargs) > 1:
             raise KeyError(
                 "Only one keyword argument may be specified"
@@ -659,8 +1447,9 @@ class TaskWarriorShellout(TaskWarriorBase):
             else:
                 search = [value]
 
-        task = self._get_task_objects(*(search + ['export']))
+        return search + ['export']
 
+    def _get_first_task(self, task):
         if task:
             if isinstance(task, list):
                 # Multiple items returned from search, return just the 1st
@@ -669,10 +1458,17 @@ class TaskWarriorShellout(TaskWarriorBase):
 
         return None, dict()
 
-    def task_add(self, description, tags=None, **kw):
-        """ Add a new task.
+    def _load_task(self, **kwargs):
+        return self._get_first_task(
+            self._get_task_objects(*self._get_search_args(kwargs))
+        )
+
+    def _get_add_args(self, description, tags, kw):
+        """ Prepare a ``task_add``
+
+        Returns a 3-tuple of the stubbed task, the annotations to add once
+        it exists, and the arguments to pass to `task add`.
 
-        Takes any of the keywords allowed by taskwarrior like proj or prior.
         """
         task = self._stub_task(description, tags, **kw)
 
@@ -692,16 +1488,16 @@ class TaskWarriorShellout(TaskWarriorBase):
         else:
             args = taskw.utils.encode_task_experimental(task)
 
-        stdout, stderr = self._execute('add', *args)
+        return task, annotations, ['add'] + args
 
+    def _set_added_uuid(self, task, stdout):
         # However, in 2.4 and later, you cannot specify whatever uuid you want
         # when adding a task.  Instead, you have to specify rc.verbose=new-uuid
         # and then parse the assigned uuid out from stdout.
         if self.get_version() >= LooseVersion('2.4'):
             task['uuid'] = re.search(UUID_REGEX, stdout).group(0)
 
-        id, added_task = self.get_task(uuid=task['uuid'])
-
+    def _check_added_task(self, added_task, stdout, stderr):
         # Check if 'uuid' is in the task we just added.
         if not 'uuid' in added_task:
             raise KeyError(
@@ -712,14 +1508,150 @@ class TaskWarriorShellout(TaskWarriorBase):
                 )
             )
 
-        if annotations and 'uuid' in added_task:
-            for annotation in annotations:
-                self.task_annotate(added_task, annotation)
+    def task_add(self, description, tags=None, **kw):
+        """ Add a new task.
+
+        Takes any of the keywords allowed by taskwarrior like proj or prior.
+        """
+        task, annotations, args = self._get_add_args(description, tags, kw)
+        stdout, stderr = self._execute(*args)
+        self._set_added_uuid(task, stdout)
+
+        for annotation in annotations:
+            self.task_annotate(task, annotation, readback=False)
 
-        id, added_task = self.get_task(uuid=added_task['uuid'])
+        id, added_task = self.get_task(uuid=task['uuid'])
+        self._check_added_task(added_task, stdout, stderr)
+        self._index_tasks(added_task)
         return added_task
 
-    def task_annotate(self, task, annotation):
+    def _get_write_lookup(self, task, lookup, kw):
+        """ Work out how to find the task a task_* write method will change.
+
+        By default the task is exported first so that it can be validated.
+        Callers that already have the task can pass it as ``task`` to skip
+        that export; callers that only have a UUID can pass ``uuid`` along
+        with ``lookup=False`` to skip it as well (and any validation, since
+        there is nothing to validate against).
+
+        Returns either the keyword arguments to pass to ``get_task``, or
+        ``None`` along with the task to use as is.
+
+        """
+        if lookup is None:
+            lookup = task is None
+
+        if lookup:
+            if task is not None:
+                kw = {'uuid': task['uuid']}
+            if not kw:
+                raise KeyError('No key was passed.')
+            return kw, None
+
+        if task is None:
+            if list(kw.keys()) != ['uuid']:
+                raise KeyError('A uuid must be passed when lookup=False.')
+            task = {'uuid': kw['uuid']}
+        return None, task
+
+    def _get_task_to_write(self, task, lookup, kw):
+        lookup_kw, task = self._get_write_lookup(task, lookup, kw)
+        if lookup_kw is not None:
+            return self.get_task(**lookup_kw)[1]
+        return task
+
+    def _change_locally(self, task, change):
+        """ Predict the state of a task after one of the task_* writes.
+
+        ``change`` is applied to a serialized copy of ``task``, along with
+        the current time.
+
+        """
+        if isinstance(task, (Task, TaskRecord)):
+            task = task.serialized()
+        else:
+            task = copy.deepcopy(task)
+        task['uuid'] = str(task['uuid'])
+        now = taskw.utils.format_now()
+        change(task, now)
+        task['modified'] = now
+        return self._get_task_object(task)
+
+    def _get_written_task(self, task, readback, change):
+        """ Return the state of a task after one of the task_* writes.
+
+        With ``readback``, the task is exported again; otherwise its new
+        state is computed locally by ``change``.
+
+        """
+        if readback:
+            task = self.get_task(uuid=task['uuid'])[1]
+        else:
+            task = self._change_locally(task, change)
+        self._index_tasks(task)
+        return task
+
+    @staticmethod
+    def _annotated(annotation):
+        def change(task, now):
+            task['annotations'] = list(task.get('annotations') or [])
+            task['annotations'].append({
+                'entry': now,
+                'description': annotation,
+            })
+        return change
+
+    @staticmethod
+    def _denotated(annotation):
+        def change(task, now):
+            annotations = list(task.get('annotations') or [])
+            descriptions = [
+                taskw.utils.get_annotation_value(a) for a in annotations
+            ]
+            # Like taskwarrior, prefer an exact match to a partial one.
+            matches = [
+                i for i, d in enumerate(descriptions) if d == annotation
+            ] or [
+                i for i, d in enumerate(descriptions) if annotation in d
+            ]
+            if matches:
+                del annotations[matches[0]]
+            if annotations:
+                task['annotations'] = annotations
+            else:
+                task.pop('annotations', None)
+        return change
+
+    @staticmethod
+    def _completed(task, now):
+        task['status'] = Status.COMPLETED
+        task['end'] = now
+        task['id'] = 0
+        task.pop('start', None)
+
+    @staticmethod
+    def _deleted(task, now):
+        task['status'] = Status.DELETED
+        task.setdefault('end', now)
+        task['id'] = 0
+
+    @staticmethod
+    def _started(task, now):
+        task['start'] = now
+
+    @staticmethod
+    def _stopped(task, now):
+        task.pop('start', None)
+
+    def _check_can_complete(self, task):
+        if 'status' in task and not Status.is_pending(task['status']):
+            raise ValueError("Task is not pending.")
+
+    def _check_can_delete(self, task):
+        if task.get('status') == Status.DELETED:
+            raise ValueError("Task is already deleted.")
+
+    def task_annotate(self, task, annotation, readback=True):
         """ Annotates a task. """
         self._execute(
             task['uuid'],
@@ -727,10 +1659,11 @@ class TaskWarriorShellout(TaskWarriorBase):
             '--',
             annotation
         )
-        id, annotated_task = self.get_task(uuid=task['uuid'])
-        return annotated_task
+        return self._get_written_task(
+            task, readback, self._annotated(annotation)
+        )
 
-    def task_denotate(self, task, annotation):
+    def task_denotate(self, task, annotation, readback=True):
         """ Removes an annotation from a task. """
         self._execute(
             task['uuid'],
@@ -738,37 +1671,51 @@ class TaskWarriorShellout(TaskWarriorBase):
             '--',
             annotation
         )
-        id, denotated_task = self.get_task(uuid=task['uuid'])
-        return denotated_task
+        return self._get_written_task(
+            task, readback, self._denotated(annotation)
+        )
 
-    def task_done(self, **kw):
-        if not kw:
-            raise KeyError('No key was passed.')
+    def task_done(self, task=None, lookup=None, readback=True, **kw):
+        """ Marks a task as done.
 
-        id, task = self.get_task(**kw)
+        The task is found by ``id``, ``uuid`` or ``description``.  To avoid
+        exporting it before and after completing it, pass the ``task`` you
+        already have (or a ``uuid`` with ``lookup=False``) and
+        ``readback=False``; the completed task is then computed locally.
 
-        if not Status.is_pending(task['status']):
-            raise ValueError("Task is not pending.")
+        """
+        task = self._get_task_to_write(task, lookup, kw)
+        self._check_can_complete(task)
+        self._execute(task['uuid'], 'done')
+        return self._get_written_task(task, readback, self._completed)
 
-        self._execute(id, 'done')
-        return self.get_task(uuid=task['uuid'])[1]
+    def _prepare_update(self, task):
+        """ Work out what ``task_update`` has to send to taskwarrior.
 
-    def task_update(self, task):
+        Returns a dict describing the update; if its 'needs_original' is
+        set, ``_diff_update_annotations`` must be called with the task as
+        taskwarrior currently has it before the update can be applied.
+
+        """
         if 'uuid' not in task:
             raise KeyError('Task must have a UUID.')
-        # 'Legacy' causes us to handle this task as if it were an
-        # old-style task -- just a standard dictionary
-        legacy = True
+        update = {
+            # 'Legacy' causes us to handle this task as if it were an
+            # old-style task -- just a standard dictionary
+            'legacy': True,
+            'task': task,
+            'annotations_to_create': set(),
+            'annotations_to_delete': set(),
+            'annotations': {},
+        }
 
         if isinstance(task, Task):
             # Let's pre-serialize taskw.task.Task instances
-            task_uuid = str(task['uuid'])
+            update['uuid'] = str(task['uuid'])
             task = task.serialized_changes(keep=True)
-            legacy = False
+            update['legacy'] = False
         else:
-            task_uuid = task['uuid']
-
-        id, original_task = self.get_task(uuid=task_uuid)
+            update['uuid'] = task['uuid']
 
         if 'id' in task:
             del task['id']
@@ -782,77 +1729,158 @@ class TaskWarriorShellout(TaskWarriorBase):
 
         # Only handle annotation differences if this is an old-style
         # task, or if the task itself says annotations have changed.
-        annotations_to_delete = set()
-        annotations_to_create = set()
-        if legacy or 'annotations' in task_to_modify:
-            # Check if there are annotations, if so, look if they are
-            # in the existing task, otherwise annotate the task to add them.
-            ttm_annotations = taskw.utils.annotation_list_to_comparison_map(
-                self._extract_annotations_from_task(task_to_modify)
-            )
-            original_annotations = (
+        update['needs_original'] = (
+            update['legacy'] or 'annotations' in task_to_modify
+        )
+        if update['needs_original']:
+            update['new_annotations'] = (
                 taskw.utils.annotation_list_to_comparison_map(
-                    self._extract_annotations_from_task(original_task)
+                    self._extract_annotations_from_task(task_to_modify)
                 )
             )
+            task_to_modify.pop('annotations', None)
+
+        update['task_to_modify'] = task_to_modify
+        return update
+
+    def _diff_update_annotations(self, update, original):
+        original_task = copy.deepcopy(original)
+        update['original'] = original
+
+        # Check if there are annotations, if so, look if they are
+        # in the existing task, otherwise annotate the task to add them.
+        ttm_annotations = update['new_annotations']
+        original_annotations = (
+            taskw.utils.annotation_list_to_comparison_map(
+                self._extract_annotations_from_task(original_task)
+            )
+        )
 
-            new_annotations = set(ttm_annotations.keys())
-            existing_annotations = set(original_annotations.keys())
+        new_annotations = set(ttm_annotations.keys())
+        existing_annotations = set(original_annotations.keys())
 
-            annotations_to_delete = existing_annotations - new_annotations
-            annotations_to_create = new_annotations - existing_annotations
+        update['annotations_to_delete'] = (
+            existing_annotations - new_annotations
+        )
+        update['annotations_to_create'] = (
+            new_annotations - existing_annotations
+        )
+        update['annotations'] = dict(ttm_annotations)
+        update['annotations'].update(original_annotations)
 
-            if 'annotations' in task_to_modify:
-                del task_to_modify['annotations']
+    def _get_update_commands(self, update):
+        """ Returns the argument lists ``task_update`` must execute """
+        commands = []
+        task_uuid = update['uuid']
 
-        modification = taskw.utils.encode_task_experimental(task_to_modify)
+        modification = taskw.utils.encode_task_experimental(
+            update['task_to_modify']
+        )
         # Only try to modify the task if there are changes to post here
         # (changes *might* just be in annotations).
         if modification:
-            self._execute(task_uuid, 'modify', *modification)
-
-        # If there are no existing annotations, add the new ones
-        if legacy or annotations_to_delete or annotations_to_create:
-            ttm_annotations.update(original_annotations)
-            for annotation_key in annotations_to_create:
-                self.task_annotate(
-                    original_task,
-                    ttm_annotations[annotation_key]
-                )
-            for annotation_key in annotations_to_delete:
-                self.task_denotate(
-                    original_task,
-                    ttm_annotations[annotation_key]
-                )
+            commands.append([task_uuid, 'modify'] + modification)
+
+        for annotation_key in update['annotations_to_create']:
+            commands.append([
+                task_uuid, 'annotate', '--',
+                update['annotations'][annotation_key],
+            ])
+        for annotation_key in update['annotations_to_delete']:
+            commands.append([
+                task_uuid, 'denotate', '--',
+                update['annotations'][annotation_key],
+            ])
+        return commands
+
+    def _update_locally(self, update):
+        """ Predict the result of ``task_update`` without exporting it """
+        if not update['legacy']:
+            # The Task itself already reflects every change.
+            updated_task = self._get_task_object(update['task'].serialized())
+            return updated_task.get('id'), updated_task
+
+        def change(task, now):
+            for key, value in update['task_to_modify'].items():
+                if value is None:
+                    task.pop(key, None)
+                else:
+                    task[key] = value
+            annotations = [
+                a for a in task.get('annotations') or []
+                if taskw.utils.make_annotation_comparable(
+                    taskw.utils.get_annotation_value(a)
+                ) not in update['annotations_to_delete']
+            ]
+            annotations.extend(
+                {'entry': now, 'description': update['annotations'][key]}
+                for key in update['annotations_to_create']
+            )
+            if annotations:
+                task['annotations'] = annotations
+            else:
+                task.pop('annotations', None)
 
-        return self.get_task(uuid=task_uuid)
+        updated_task = self._change_locally(
+            dict(update['original'], uuid=update['uuid']), change
+        )
+        return updated_task.get('id'), updated_task
 
-    def task_delete(self, **kw):
-        """ Marks a task as deleted.  """
+    def task_update(self, task, original=None, readback=True):
+        """ Saves changes made to a task.
 
-        id, task = self.get_task(**kw)
+        ``original`` is the task as taskwarrior currently has it; it is only
+        needed to work out which annotations were added or removed, and is
+        exported if it is needed but not given.  With ``readback=False``,
+        the updated task is computed locally instead of being exported.
 
-        if task['status'] == Status.DELETED:
-            raise ValueError("Task is already deleted.")
+        """
+        update = self._prepare_update(task)
+        if update['needs_original']:
+            if original is None:
+                id, original = self.get_task(uuid=update['uuid'])
+            self._diff_update_annotations(update, original)
+
+        for args in self._get_update_commands(update):
+            self._execute(*args)
+
+        if readback:
+            id, task = self.get_task(uuid=update['uuid'])
+        else:
+            id, task = self._update_locally(update)
+        self._index_tasks(task)
+        return id, task
 
+    def task_delete(self, task=None, lookup=None, readback=True, **kw):
+        """ Marks a task as deleted.
+
+        Accepts the same arguments as ``task_done``.
+
+        """
+        task = self._get_task_to_write(task, lookup, kw)
+        self._check_can_delete(task)
         self._execute(task['uuid'], 'delete')
-        return self.get_task(uuid=task['uuid'])[1]
+        return self._get_written_task(task, readback, self._deleted)
 
-    def task_start(self, **kw):
-        """ Marks a task as started.  """
+    def task_start(self, task=None, lookup=None, readback=True, **kw):
+        """ Marks a task as started.
 
-        id, task = self.get_task(**kw)
+        Accepts the same arguments as ``task_done``.
 
-        self._execute(id, 'start')
-        return self.get_task(uuid=task['uuid'])[1]
+        """
+        task = self._get_task_to_write(task, lookup, kw)
+        self._execute(task['uuid'], 'start')
+        return self._get_written_task(task, readback, self._started)
 
-    def task_stop(self, **kw):
-        """ Marks a task as stopped.  """
+    def task_stop(self, task=None, lookup=None, readback=True, **kw):
+        """ Marks a task as stopped.
 
-        id, task = self.get_task(**kw)
+        Accepts the same arguments as ``task_done``.
 
-        self._execute(id, 'stop')
-        return self.get_task(uuid=task['uuid'])[1]
+        """
+        task = self._get_task_to_write(task, lookup, kw)
+        self._execute(task['uuid'], 'stop')
+        return self._get_written_task(task, readback, self._stopped)
 
     def task_info(self, **kw):
         id, task = self.get_task(**kw)
@@ -862,6 +1890,135 @@ class TaskWarriorShellout(TaskWarriorBase):
         return out
 
 
+class TaskWarriorBatch(object):
+    """ Task changes queued up by ``TaskWarriorShellout.batch``.
+
+    Flushing costs three `task` invocations however many changes were
+    queued (up to ``IMPORT_CHUNK_SIZE`` of them): one export of the existing
+    tasks being changed, one import of every new and changed task, and one
+    export of the results.
+    """
+
+    def __init__(self, warrior):
+        self.warrior = warrior
+        self.tasks = None
+        self._added = collections.OrderedDict()
+        self._changes = collections.OrderedDict()
+        self._annotations = collections.OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def _get_uuid(self, task):
+        uuid = task['uuid'] if isinstance(task, dict) else task
+        return str(uuid)
+
+    def task_add(self, description, tags=None, **kw):
+        """ Queue a new task; returns it, including its assigned UUID. """
+        task = self.warrior._stub_import(
+            self.warrior._stub_task(description, tags, **kw)
+        )
+        self._added[task['uuid']] = task
+        return task
+
+    def task_update(self, task):
+        """ Queue changes to a task. """
+        if 'uuid' not in task:
+            raise KeyError('Task must have a UUID.')
+        task_uuid = self._get_uuid(task)
+
+        if isinstance(task, Task):
+            changes = task.serialized_changes(keep=True)
+        else:
+            changes = copy.deepcopy(task)
+        for key in ('uuid', 'id', 'urgency'):
+            changes.pop(key, None)
+
+        if task_uuid in self._added:
+            self._added[task_uuid].update(changes)
+        else:
+            self._changes.setdefault(task_uuid, {}).update(changes)
+
+    def task_annotate(self, task, annotation):
+        """ Queue an annotation for a task. """
+        task_uuid = self._get_uuid(task)
+        if task_uuid in self._added:
+            self._added[task_uuid].setdefault('annotations', [])
+            self._added[task_uuid]['annotations'].append(annotation)
+        else:
+            self._annotations.setdefault(task_uuid, []).append(annotation)
+
+    def _merge(self, original, changes, annotations):
+        task = dict(original)
+        for key, value in changes.items():
+            if value is None:
+                task.pop(key, None)
+            else:
+                task[key] = value
+
+        if annotations:
+            task['annotations'] = (
+                list(task.get('annotations') or []) + annotations
+            )
+        return task
+
+    def flush(self):
+        """ Apply every queued change; returns the resulting tasks. """
+        existing = self._get_existing()
+        originals = []
+        if existing:
+            originals = self.warrior._get_json(*(existing + ['export']))
+        to_import = self._get_imports(originals)
+        self.warrior.task_import(to_import.values())
+        self._clear()
+        return self._finish(
+            self.warrior._get_tasks_by_uuid(to_import.keys())
+        )
+
+    def _get_existing(self):
+        """ Returns the UUIDs of the existing tasks being changed """
+        existing = list(self._changes)
+        existing.extend(
+            task_uuid for task_uuid in self._annotations
+            if task_uuid not in self._changes
+        )
+        return existing
+
+    def _get_imports(self, originals):
+        """ Returns every task to import, keyed on UUID
+
+        ``originals`` are the existing tasks being changed, as exported.
+
+        """
+        to_import = collections.OrderedDict(
+            (task_uuid, task) for task_uuid, task in self._added.items()
+        )
+        for original in originals:
+            task_uuid = original['uuid']
+            to_import[task_uuid] = self._merge(
+                original,
+                self._changes.get(task_uuid, {}),
+                self._annotations.get(task_uuid, []),
+            )
+        return to_import
+
+    def _clear(self):
+        self._added.clear()
+        self._changes.clear()
+        self._annotations.clear()
+
+    def _finish(self, tasks):
+        if isinstance(tasks, dict):
+            tasks = [tasks]
+        self.tasks = tasks
+        self.warrior._index_tasks(*self.tasks)
+        return self.tasks
+
+
 class DataFile(object):
     """ Encapsulates data file names. """
     PENDING = 'pending'
@@ -894,6 +2051,28 @@ class Command(object):
         return known_commands[command]
 
 
+class LoadStrategy(object):
+    """ Ways ``TaskWarriorShellout`` can run several exports. """
+    SERIAL = 'serial'
+    THREADS = 'threads'
+    SINGLE = 'single'
+
+    @classmethod
+    def validate(cls, strategy):
+        known_strategies = [
+            LoadStrategy.SERIAL,
+            LoadStrategy.THREADS,
+            LoadStrategy.SINGLE,
+        ]
+
+        if strategy not in known_strategies:
+            raise ValueError(
+                "Unknown load strategy, %s. Strategy must be one of %s." %
+                (strategy, known_strategies))
+
+        return strategy
+
+
 class Status(object):
     """ Encapsulates task status values. """
     PENDING = 'pending'
@@ -917,6 +2096,30 @@ class Status(object):
         }[status]
 
 
+class ChangeCursor(
+    collections.namedtuple('ChangeCursor', ['time', 'offset'])
+):
+    """ Where ``changes_since`` left off, to pass to it next time.
+
+    ``time`` is when the call was made, in seconds since the epoch, and
+    ``offset`` how much of undo.data ``TaskWarriorDirect`` had read (or
+    None).  Being a tuple, a cursor can be stored as JSON and rebuilt with
+    ``ChangeCursor(*stored)``.
+
+    """
+    __slots__ = ()
+
+    @classmethod
+    def get(cls, since):
+        """ Returns the cursor for ``since``, which may be a cursor (or
+        tuple), or a datetime, date or timestamp.
+
+        """
+        if isinstance(since, (tuple, list)):
+            return cls(*since)
+        return cls(_get_timestamp(since, query=True), None)
+
+
 class UnsupportedVersionException(object):
     pass
 
@@ -926,8 +2129,76 @@ class UnsupportedVersionException(object):
 TaskWarriorExperimental = TaskWarriorShellout
 
 
-# Set a default based on what is available on the system.
-if TaskWarriorShellout.can_use():
-    TaskWarrior = TaskWarriorShellout
-else:
-    TaskWarrior = TaskWarriorDirect
+BACKENDS = {
+    'shellout': TaskWarriorShellout,
+    'direct': TaskWarriorDirect,
+}
+
+# The backend picked by ``get_default_backend`` when TASKW_BACKEND is unset.
+_probed_backend = None
+
+
+def get_default_backend():
+    """ Returns the class that ``TaskWarrior`` stands for.
+
+    The TASKW_BACKEND environment variable wins if it is set; otherwise
+    the result of ``TaskWarriorShellout.can_use()`` decides, and that is
+    only computed once per process.
+
+    """
+    global _probed_backend
+
+    pinned = os.getenv('TASKW_BACKEND')
+    if pinned:
+        try:
+            return BACKENDS[pinned.lower()]
+        except KeyError:
+            raise ValueError(
+                "Unknown TASKW_BACKEND, %s. Must be one of %s." % (
+                    pinned, ', '.join(sorted(BACKENDS)),
+                )
+            )
+
+    if _probed_backend is None:
+        # Set a default based on what is available on the system.
+        if TaskWarriorShellout.can_use():
+            _probed_backend = TaskWarriorShellout
+        else:
+            _probed_backend = TaskWarriorDirect
+    return _probed_backend
+
+
+class _DefaultBackendMeta(type):
+    # Class attributes (``TaskWarrior.load_config`` and the like) and
+    # isinstance checks go to the default backend, as they did when
+    # ``TaskWarrior`` was that class.
+
+    def __getattr__(cls, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(get_default_backend(), name)
+
+    def __instancecheck__(cls, instance):
+        return isinstance(instance, get_default_backend())
+
+
+class TaskWarrior(metaclass=_DefaultBackendMeta):
+    """ The default backend:  instantiating ``TaskWarrior`` returns an
+    instance of the class ``get_default_backend()`` picks, built with the
+    same arguments.
+
+    The backend is only picked once something is instantiated (or looked
+    up on ``TaskWarrior``), so importing it never runs the 'task' binary.
+    To customise a backend, subclass ``TaskWarriorShellout`` or
+    ``TaskWarriorDirect``.
+
+    """
+
+    def __new__(cls, *args, **kwargs):
+        if cls is not TaskWarrior:
+            raise TypeError(
+                "%s can't derive from TaskWarrior, which only picks a "
+                "backend; subclass TaskWarriorShellout or TaskWarriorDirect "
+                "instead." % cls.__name__
+            )
+        return get_default_backend()(*args, **kwargs)
@@ -0,0 +1,284 @@
+""" Following changes other processes make to the task database.
+
+A ``TaskWatcher`` loads every task in a data directory into a
+``taskw.index.TaskIndex`` once, and then keeps it up to date by reading
+only what has been appended to undo.data since:  each entry there holds
+the new state of a task that changed.  ``wait`` blocks until something
+changes and returns the UUIDs of the tasks which did::
+
+    with tw.watch() as watcher:
+        for uuids in watcher:
+            for uuid in uuids:
+                print(watcher.tasks.get(uuid))
+
+On Linux the directory is watched with inotify; elsewhere (or if inotify
+isn't available) the files are checked every ``interval`` seconds.
+
+Should undo.data shrink or be replaced, or no longer hold what was read
+from it (as after ``task undo``, even once it has grown again), or the
+other data files change without an entry explaining why (as garbage
+collection does), everything is loaded again.
+
+"""
+import ctypes
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from taskw.cache import WATCHED_FILES
+from taskw.datafile import TaskDataFile
+from taskw.index import TaskIndex
+from taskw.undo import get_end, get_tail, read_entries, starts_entry
+
+
+# How often, in seconds, the data files are checked without inotify.
+DEFAULT_POLL_INTERVAL = 1.0
+
+# How long, in seconds, the directory has to be quiet before a change is
+# read.  taskwarrior writes each of its files in turn.
+SETTLE_TIME = 0.05
+
+# The files tasks are loaded from.
+TASK_FILES = ('pending.data', 'completed.data')
+
+# inotify_init1 flags and events, from <sys/inotify.h>.
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_EVENTS = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE |
+    IN_DELETE
+)
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class TaskWatcher(object):
+    """ The tasks in taskwarrior's data directory ``location``, kept up to
+    date as other processes change them.
+
+    ``tasks`` is a ``taskw.index.TaskIndex`` of every task, as stored in
+    the data files; ``udas`` are passed on to it.  Pass ``inotify=False``
+    to check the files every ``interval`` seconds even on Linux.
+
+    """
+
+    def __init__(self, location, udas=None, interval=DEFAULT_POLL_INTERVAL,
+                 inotify=True):
+        self.location = location
+        self.udas = udas
+        self.interval = interval
+        self.tasks = TaskIndex(udas=udas)
+        # The size, modification time and inode of each data file, as of
+        # the last look at them.
+        self._signatures = {}
+        # How much of undo.data has been read, and what it ended with.
+        self._offset = 0
+        self._tail = b''
+        self._inotify = None
+        if inotify and sys.platform.startswith('linux'):
+            try:
+                self._inotify = _Inotify(location)
+            except (AttributeError, OSError):
+                # No inotify here, or no more watches to be had.
+                pass
+        self.reload()
+
+    @property
+    def using_inotify(self):
+        return self._inotify is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __iter__(self):
+        """ Yields the UUIDs changed by each change, as a set, forever """
+        while True:
+            changed = self.wait()
+            if changed:
+                yield changed
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def reload(self):
+        """ Load every task again
+
+        Returns the UUIDs of the tasks which changed since they were last
+        loaded.
+
+        """
+        signatures = self._get_signatures()
+        # Entries written from here on are read again by the next
+        # ``refresh``; replaying one already loaded does no harm.
+        undo = os.path.join(self.location, 'undo.data')
+        offset = get_end(undo)
+        tail = get_tail(undo, offset)
+
+        tasks = TaskIndex(self._load_tasks(), udas=self.udas)
+        changed = set(
+            uuid for uuid in set(self._get_uuids(self.tasks)).union(
+                self._get_uuids(tasks)
+            )
+            if self.tasks.get(uuid) != tasks.get(uuid)
+        )
+        self.tasks = tasks
+        self._signatures = signatures
+        self._offset = offset
+        self._tail = tail
+        return changed
+
+    def refresh(self):
+        """ Catch up with any changes to the data files
+
+        Returns the UUIDs of the tasks which changed, as a set.
+
+        """
+        signatures = self._get_signatures()
+        if signatures == self._signatures:
+            return set()
+
+        undo = os.path.join(self.location, 'undo.data')
+        previous = self._signatures.get(undo)
+        current = signatures.get(undo)
+        if (
+            current is None
+            or (previous is not None and previous[2] != current[2])
+            or current[0] < self._offset
+            or not starts_entry(undo, self._offset)
+            or get_tail(undo, self._offset) != self._tail
+        ):
+            # Rewritten, or cut short by `task undo` and written to since;
+            # the offset means nothing any more.
+            return self.reload()
+
+        entries, offset = read_entries(undo, self._offset)
+        if not entries:
+            # The data files changed all by themselves.
+            return self.reload()
+
+        changed = set()
+        for entry in entries:
+            self.tasks.add(entry.new)
+            changed.add(str(entry.new['uuid']))
+        self._signatures = signatures
+        self._offset = offset
+        self._tail = get_tail(undo, offset)
+        return changed
+
+    def wait(self, timeout=None):
+        """ Wait until the data files change, for up to ``timeout`` seconds
+
+        Returns the UUIDs of the tasks which changed, which is empty if
+        ``timeout`` ran out first.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - time.monotonic(), 0)
+
+            if self._inotify is not None:
+                names = self._inotify.read(remaining)
+                if names.intersection(WATCHED_FILES):
+                    while self._inotify.read(SETTLE_TIME):
+                        pass
+                    changed = self.refresh()
+                    if changed:
+                        return changed
+            else:
+                time.sleep(
+                    self.interval if remaining is None
+                    else min(self.interval, remaining)
+                )
+                changed = self.refresh()
+                if changed:
+                    return changed
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+
+    def _get_signatures(self):
+        signatures = {}
+        for name in WATCHED_FILES:
+            filename = os.path.join(self.location, name)
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                signatures[filename] = None
+            else:
+                signatures[filename] = (
+                    stat.st_size, stat.st_mtime_ns, stat.st_ino
+                )
+        return signatures
+
+    def _load_tasks(self):
+        for name in TASK_FILES:
+            try:
+                for task in TaskDataFile(os.path.join(self.location, name)):
+                    yield task
+            except FileNotFoundError:
+                pass
+
+    def _get_uuids(self, tasks):
+        return [str(task['uuid']) for task in tasks]
+
+
+class _Inotify(object):
+    """ An inotify instance watching one directory, through libc """
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        watch = libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), IN_EVENTS
+        )
+        if watch < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, os.strerror(error), directory)
+
+    def read(self, timeout=None):
+        """ Wait up to ``timeout`` seconds for events
+
+        Returns the names of the files they happened to, as a set.
+
+        """
+        names = set()
+        readable = select.select([self.fd], [], [], timeout)[0]
+        while readable:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            position = 0
+            while position < len(data):
+                wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(
+                    data, position
+                )
+                position += INOTIFY_EVENT.size
+                name = data[position:position + length].rstrip(b'\0')
+                position += length
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)